@@ -0,0 +1,327 @@
+"""
+Бенчмарк слоя статистики
+Генерирует синтетическую БД (N строк по нескольким серверам, методам и
+модераторам), замеряет каждый запрос StatsCog по отдельности, сравнивает
+старый вариант get_stats_period (шесть запросов по сырым строкам) с дневными
+агрегатами, а затем гоняет запись и чтение одновременно через настоящий
+путь записи StatsCog и пул потоков чтения.
+
+Результаты можно сохранить в JSON (--json), чтобы сравнивать их между коммитами.
+
+Использование: python bench_stats.py [--rows 1000000] [--repeat 5] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+
+from stats_cog import StatsCog, window_start_day
+
+GUILD_ID = 1000000000
+METHODS = ["команда", "qr-код", "модератор"]
+STATUSES = ["успешно", "успешно", "успешно", "отклонено"]
+USERS_PER_GUILD = 50000        # Пул пользователей сервера (повторные попытки одних и тех же людей)
+MODERATORS_PER_GUILD = 20
+
+def open_cog(path: str) -> StatsCog:
+    """Создаёт StatsCog поверх указанной БД без бота и без запуска потока записи"""
+    cog = StatsCog(None, db_path=path)
+    # Кэш с нулевым TTL: каждое измерение выполняет запрос заново
+    cog.cache.ttl = 0
+    return cog
+
+def guild_weights(guilds: int) -> List[float]:
+    """Размеры серверов неравномерны: первый самый большой, дальше по убыванию"""
+    return [1 / (i + 1) for i in range(guilds)]
+
+def generate_database(path: str, rows: int, days: int = 90, guilds: int = 3, seed: int = 42):
+    """Создаёт БД со схемой StatsCog и заполняет её синтетическими данными"""
+    cog = open_cog(path)
+    cog.init_database()
+    cog.db.close()
+
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    span = days * 86400
+    guild_ids = [GUILD_ID + i for i in range(guilds)]
+    weights = guild_weights(guilds)
+
+    def timestamp():
+        return (now - timedelta(seconds=rng.randrange(span))).strftime('%Y-%m-%d %H:%M:%S')
+
+    def verifications():
+        for _ in range(rows):
+            guild_id = rng.choices(guild_ids, weights)[0]
+            user = rng.randrange(USERS_PER_GUILD)
+            method = rng.choice(METHODS)
+            moderator = rng.randrange(MODERATORS_PER_GUILD) if method == "модератор" else None
+            yield (
+                user, f"user{user}", guild_id, rng.choice(STATUSES), method,
+                moderator, f"mod{moderator}" if moderator is not None else None,
+                METHODS.index(method) + 1, timestamp()
+            )
+
+    def joins():
+        for _ in range(rows // 2):
+            user = rng.randrange(USERS_PER_GUILD)
+            yield (user, f"user{user}", rng.choices(guild_ids, weights)[0], rng.randrange(3000), timestamp())
+
+    def attempts():
+        for _ in range(rows // 2):
+            yield (rng.randrange(USERS_PER_GUILD), rng.choices(guild_ids, weights)[0], rng.random() < 0.8, timestamp())
+
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany('''
+            INSERT INTO verifications
+            (user_id, username, guild_id, status, method, moderator_id, moderator_name, verification_level, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', verifications())
+        conn.executemany('''
+            INSERT INTO member_joins (user_id, username, guild_id, account_age_days, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        ''', joins())
+        conn.executemany('''
+            INSERT INTO verification_attempts (user_id, guild_id, success, timestamp)
+            VALUES (?, ?, ?, ?)
+        ''', attempts())
+    conn.execute('ANALYZE')
+    conn.close()
+
+def legacy_stats_period(db_path: str, guild_id: int, days: int) -> dict:
+    """Старая реализация: шесть запросов по сырым строкам на один период"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    # Граница периода та же, что у агрегатов: начало дня (UTC)
+    date_threshold = window_start_day(days)
+    cursor.execute('SELECT COUNT(*) FROM verifications WHERE guild_id = ? AND timestamp >= ?', (guild_id, date_threshold))
+    total = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM verifications WHERE guild_id = ? AND status = 'успешно' AND timestamp >= ?", (guild_id, date_threshold))
+    successful = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM verifications WHERE guild_id = ? AND status = 'отклонено' AND timestamp >= ?", (guild_id, date_threshold))
+    rejected = cursor.fetchone()[0]
+    cursor.execute('SELECT method, COUNT(*) FROM verifications WHERE guild_id = ? AND timestamp >= ? GROUP BY method', (guild_id, date_threshold))
+    by_method = dict(cursor.fetchall())
+    cursor.execute('SELECT COUNT(*) FROM member_joins WHERE guild_id = ? AND timestamp >= ?', (guild_id, date_threshold))
+    new_members = cursor.fetchone()[0]
+    cursor.execute('SELECT AVG(account_age_days) FROM member_joins WHERE guild_id = ? AND timestamp >= ?', (guild_id, date_threshold))
+    avg_account_age = cursor.fetchone()[0] or 0
+    conn.close()
+    return {
+        'total_verifications': total,
+        'successful': successful,
+        'rejected': rejected,
+        'by_method': by_method,
+        'new_members': new_members,
+        'avg_account_age': round(avg_account_age, 1),
+    }
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    """Сводка по замерам в миллисекундах"""
+    if not timings:
+        return {'runs': 0}
+    timings = sorted(timings)
+
+    def percentile(p):
+        return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+    return {
+        'runs': len(timings),
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(percentile(0.5), 3),
+        'p95_ms': round(percentile(0.95), 3),
+        'p99_ms': round(percentile(0.99), 3),
+        'max_ms': round(timings[-1], 3),
+    }
+
+def measure(func: Callable, repeat: int) -> List[float]:
+    """Время каждого из repeat вызовов в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def query_suite(cog: StatsCog, guild_id: int) -> Dict[str, Callable]:
+    """Все запросы чтения StatsCog с параметрами, как их вызывают команды"""
+    return {
+        'get_stats_period_7': lambda: cog.get_stats_period(guild_id, 7),
+        'get_stats_period_30': lambda: cog.get_stats_period(guild_id, 30),
+        'get_stats_period_365': lambda: cog.get_stats_period(guild_id, 365),
+        'get_stats_windows_7_30': lambda: cog.get_stats_windows(guild_id, (7, 30)),
+        'get_top_moderators': lambda: cog.get_top_moderators(guild_id, 5),
+        'get_recent_verifications': lambda: cog.get_recent_verifications(guild_id, 50),
+        'get_user_history': lambda: cog.get_user_history(guild_id, random.randrange(USERS_PER_GUILD)),
+    }
+
+async def concurrent_load(path: str, writes: int, readers: int, guilds: int) -> dict:
+    """
+    Запись через очередь StatsCog и одновременное чтение через run_read.
+    Пишущие корутины ставят writes событий; читающие крутят все запросы
+    по кругу, пока запись не завершится.
+    """
+    cog = StatsCog(None, db_path=path)
+    cog.cache.ttl = 0
+    await cog.cog_load()
+
+    batch_timings = []
+    write_batch = cog._write_batch
+
+    def timed_write_batch(batch):
+        start = time.perf_counter()
+        write_batch(batch)
+        batch_timings.append((time.perf_counter() - start) * 1000)
+
+    cog._write_batch = timed_write_batch
+
+    guild_ids = [GUILD_ID + i for i in range(guilds)]
+    read_timings: Dict[str, List[float]] = {}
+    stop = asyncio.Event()
+
+    async def reader(number: int):
+        suite = query_suite(cog, guild_ids[number % len(guild_ids)])
+        while not stop.is_set():
+            for name, query in suite.items():
+                start = time.perf_counter()
+                await cog.run_read(query)
+                read_timings.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+
+    async def writer(count: int, seed: int):
+        rng = random.Random(seed)
+        for i in range(count):
+            guild_id = rng.choice(guild_ids)
+            user = rng.randrange(USERS_PER_GUILD)
+            kind = i % 3
+            if kind == 0:
+                cog.log_member_join(user, f"user{user}", guild_id, rng.randrange(3000))
+            elif kind == 1:
+                cog.log_verification_attempt(user, guild_id, rng.random() < 0.8)
+            else:
+                cog.log_verification_to_db(user, f"user{user}", guild_id, rng.choice(STATUSES),
+                                           rng.choice(METHODS), 2)
+            if i % 100 == 0:
+                # Отдаём управление, как это происходит между событиями Discord
+                await asyncio.sleep(0)
+
+    reader_tasks = [asyncio.create_task(reader(i)) for i in range(readers)]
+    producers = 4
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(writes // producers, seed) for seed in range(producers)))
+    enqueued = time.perf_counter() - start
+    # Остановка кога дожидается записи всего, что стоит в очереди
+    stop.set()
+    await asyncio.gather(*reader_tasks)
+    await cog.cog_unload()
+    elapsed = time.perf_counter() - start
+
+    written = writes // producers * producers
+    return {
+        'readers': readers,
+        'writes': written,
+        'dropped_writes': cog.dropped_writes,
+        'enqueue_seconds': round(enqueued, 3),
+        'write_seconds': round(elapsed, 3),
+        'write_throughput_per_s': round(written / elapsed, 1),
+        'write_batches': summarize(batch_timings),
+        'reads': {name: summarize(timings) for name, timings in read_timings.items()},
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк слоя статистики")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="строк в таблице verifications")
+    parser.add_argument("--guilds", type=int, default=3, help="количество серверов")
+    parser.add_argument("--days", type=int, default=90, help="за сколько дней распределены события")
+    parser.add_argument("--repeat", type=int, default=5, help="повторов каждого замера")
+    parser.add_argument("--writes", type=int, default=100_000, help="событий в тесте одновременной нагрузки")
+    parser.add_argument("--readers", type=int, default=4, help="читающих корутин в тесте одновременной нагрузки")
+    parser.add_argument("--seed", type=int, default=42, help="зерно генератора данных")
+    parser.add_argument("--json", metavar="PATH", help="сохранить результаты в JSON ('-' — вывести в stdout)")
+    args = parser.parse_args()
+
+    quiet = args.json == '-'
+    log = print
+    random.seed(args.seed)
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'args': vars(args),
+        }
+    }
+
+    # При выводе JSON в stdout всё остальное (в том числе сообщения StatsCog) уходит в stderr
+    with contextlib.redirect_stdout(sys.stderr if quiet else sys.stdout), tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        log(f"🧪 Генерация {args.rows} строк ({args.guilds} серверов)...")
+        start = time.perf_counter()
+        generate_database(path, args.rows, days=args.days, guilds=args.guilds, seed=args.seed)
+        results['generate_seconds'] = round(time.perf_counter() - start, 2)
+        log(f"   готово за {results['generate_seconds']:.1f} с")
+
+        cog = open_cog(path)
+
+        # Проверяем, что обе реализации дают одинаковые цифры
+        new = cog.get_stats_windows(GUILD_ID, (7, 30))
+        for days in (7, 30):
+            old = legacy_stats_period(path, GUILD_ID, days)
+            for key, value in old.items():
+                assert new[days][key] == value, (days, key, new[days][key], value)
+
+        legacy = summarize(measure(lambda: [legacy_stats_period(path, GUILD_ID, d) for d in (7, 30)], args.repeat))
+        rollups = summarize(measure(lambda: cog.get_stats_windows(GUILD_ID, (7, 30)), args.repeat))
+        results['verifstats'] = {'legacy': legacy, 'rollups': rollups,
+                                 'speedup': round(legacy['median_ms'] / max(rollups['median_ms'], 1e-6), 1)}
+
+        log("\n📊 !verifstats (окна 7 и 30 дней), медиана:")
+        log(f"   До  (2 × 6 запросов):           {legacy['median_ms']:8.1f} мс")
+        log(f"   После (дневные агрегаты):       {rollups['median_ms']:8.1f} мс")
+        log(f"   Ускорение: ×{results['verifstats']['speedup']}")
+
+        results['queries'] = {}
+        log("\n⏱️ Запросы StatsCog (без нагрузки), медиана / p95:")
+        for name, query in query_suite(cog, GUILD_ID).items():
+            summary = summarize(measure(query, args.repeat))
+            results['queries'][name] = summary
+            log(f"   {name:28} {summary['median_ms']:8.2f} / {summary['p95_ms']:8.2f} мс")
+        cog.db.close()
+
+        log(f"\n🔀 Одновременно: {args.writes} записей и {args.readers} читателя...")
+        load = asyncio.run(concurrent_load(path, args.writes, args.readers, args.guilds))
+        results['concurrent'] = load
+        log(f"   запись: {load['write_throughput_per_s']:.0f} событий/с, "
+            f"пачка медиана {load['write_batches'].get('median_ms', 0):.1f} мс, отброшено {load['dropped_writes']}")
+        for name, summary in load['reads'].items():
+            log(f"   {name:28} {summary['median_ms']:8.2f} / {summary['p95_ms']:8.2f} мс ({summary['runs']} запросов)")
+
+    if args.json == '-':
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        log(f"\n💾 Результаты сохранены в {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import discord
 from discord.ext import commands
-import json
 import os
 import asyncio
 from dotenv import load_dotenv
+from config_store import get_config
+from shard_monitor import sharding_from_env
+from member_cache import member_cache_options
 
 # --- Загрузка переменных окружения ---
 load_dotenv()
@@ -12,8 +14,7 @@ load_dotenv()
 if not os.path.exists('config.json'):
     raise FileNotFoundError("Файл 'config.json' не найден! Пожалуйста, создайте его.")
 
-with open('config.json', 'r', encoding='utf-8') as f:
-    config = json.load(f)
+config = get_config()
 
 # --- Настройка намерений (Intents) ---
 # Боту нужны права для просмотра участников и сообщений.
@@ -22,7 +23,15 @@ intents.members = True  # Для отслеживания входа новых
 intents.message_content = True # Для обработки команд
 
 # --- Инициализация бота ---
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Режим кэша участников (MEMBER_CACHE_MODE в config.json)
+cache_options = member_cache_options(config.member_cache_mode)
+
+# Шардинг включается переменными окружения SHARDING / SHARD_COUNT / SHARD_IDS
+sharding = sharding_from_env()
+if sharding is None:
+    bot = commands.Bot(command_prefix="!", intents=intents, **cache_options)
+else:
+    bot = commands.AutoShardedBot(command_prefix="!", intents=intents, **cache_options, **sharding)
 
 # --- Главная функция для асинхронной инициализации ---
 async def main():
@@ -42,6 +51,30 @@ async def main():
         print(f'Ошибка при загрузке модуля статистики: {e}')
         # Продолжаем работу, даже если статистика не загрузилась
 
+    # Загружаем отчёт о памяти и управление кэшем участников
+    try:
+        await bot.load_extension('member_cache')
+    except Exception as e:
+        print(f'Ошибка при загрузке модуля кэша участников: {e}')
+
+    # Загружаем выгрузку истории верификаций (!export)
+    try:
+        await bot.load_extension('stats_export')
+    except Exception as e:
+        print(f'Ошибка при загрузке модуля выгрузки: {e}')
+
+    # Загружаем метрики производительности (/metrics и !perf)
+    try:
+        await bot.load_extension('perf_metrics')
+    except Exception as e:
+        print(f'Ошибка при загрузке модуля метрик: {e}')
+
+    # Загружаем мониторинг шардов (задержка и частота событий)
+    try:
+        await bot.load_extension('shard_monitor')
+    except Exception as e:
+        print(f'Ошибка при загрузке мониторинга шардов: {e}')
+
     # Получаем токен из переменных окружения
     token = os.getenv("BOT_TOKEN")
     if not token:
@@ -62,6 +95,8 @@ async def main():
 async def on_ready():
     print(f'Бот {bot.user.name} успешно запущен!')
     print(f'ID бота: {bot.user.id}')
+    if isinstance(bot, commands.AutoShardedBot):
+        print(f'Шардов: {bot.shard_count}')
 
 # --- Глобальный обработчик ошибок команд ---
 @bot.event
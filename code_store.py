@@ -0,0 +1,128 @@
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from db_pool import BackgroundWriter, SQLitePool
+
+DEFAULT_TTL = 24 * 3600        # Время жизни кода (секунды)
+DEFAULT_MAX_ENTRIES = 10000    # Максимум одновременно ожидающих кодов
+
+class PendingCodeStore:
+    """
+    Хранилище кодов QR-верификации.
+
+    Рабочая копия — OrderedDict в памяти по ключу (guild_id, user_id): поиск
+    за O(1), порядок для вытеснения самых старых записей при переполнении.
+    Индекс user_id → серверы позволяет командам в ЛС найти сервер, где
+    пользователь ожидает верификации. Каждое изменение дублируется
+    в таблицу verification_codes, поэтому коды переживают перезапуск бота.
+
+    Запись в БД идёт в отдельном потоке (BackgroundWriter): пока модуль
+    статистики держит блокировку БД, event loop не ждёт.
+    """
+
+    def __init__(self, db_path: str = 'verification_stats.db', ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._codes: "OrderedDict[Tuple[int, int], Tuple[str, float]]" = OrderedDict()
+        self._by_user: Dict[int, Set[int]] = {}
+        self.db = SQLitePool(db_path, readers=1)
+        self._writes = BackgroundWriter(self.db, "коды верификации", 'codes')
+        self.db.writer.execute('''
+            CREATE TABLE IF NOT EXISTS verification_codes (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                token TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (guild_id, user_id)
+            )
+        ''')
+        self.db.writer.execute(
+            'CREATE INDEX IF NOT EXISTS idx_verification_codes_user ON verification_codes (user_id)'
+        )
+        self._load()
+
+    def _load(self):
+        """Загружает действующие коды из БД"""
+        now = time.time()
+        self.db.writer.execute('DELETE FROM verification_codes WHERE expires_at <= ?', (now,))
+        rows = self.db.writer.execute(
+            'SELECT guild_id, user_id, token, expires_at FROM verification_codes ORDER BY expires_at DESC LIMIT ?',
+            (self.max_entries,)
+        ).fetchall()
+        for guild_id, user_id, token, expires_at in reversed(rows):
+            self._codes[(guild_id, user_id)] = (token, expires_at)
+            self._by_user.setdefault(user_id, set()).add(guild_id)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def _forget(self, key: Tuple[int, int]):
+        """Удаляет запись из памяти вместе с индексом по пользователю"""
+        self._codes.pop(key, None)
+        guild_id, user_id = key
+        guilds = self._by_user.get(user_id)
+        if guilds is not None:
+            guilds.discard(guild_id)
+            if not guilds:
+                del self._by_user[user_id]
+
+    def get(self, guild_id: int, user_id: int) -> Optional[str]:
+        """Возвращает действующий код пользователя на сервере или None"""
+        entry = self._codes.get((guild_id, user_id))
+        if entry is None:
+            return None
+        token, expires_at = entry
+        if expires_at <= time.time():
+            self.pop(guild_id, user_id)
+            return None
+        return token
+
+    def pending_guilds(self, user_id: int) -> List[int]:
+        """Серверы, на которых у пользователя есть действующий код"""
+        return [guild_id for guild_id in list(self._by_user.get(user_id, ()))
+                if self.get(guild_id, user_id) is not None]
+
+    def set(self, guild_id: int, user_id: int, token: str):
+        """Сохраняет новый код; при переполнении вытесняет самые старые"""
+        key = (guild_id, user_id)
+        expires_at = time.time() + self.ttl
+        self._codes[key] = (token, expires_at)
+        self._codes.move_to_end(key)
+        self._by_user.setdefault(user_id, set()).add(guild_id)
+        self._writes.execute(
+            'INSERT OR REPLACE INTO verification_codes (guild_id, user_id, token, expires_at) VALUES (?, ?, ?, ?)',
+            (guild_id, user_id, token, expires_at)
+        )
+        evicted = []
+        while len(self._codes) > self.max_entries:
+            evicted.append(next(iter(self._codes)))
+            self._forget(evicted[-1])
+        if evicted:
+            self._writes.execute('DELETE FROM verification_codes WHERE guild_id = ? AND user_id = ?', *evicted)
+
+    def pop(self, guild_id: int, user_id: int) -> Optional[str]:
+        entry = self._codes.get((guild_id, user_id))
+        self._forget((guild_id, user_id))
+        self._writes.execute('DELETE FROM verification_codes WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+        return entry[0] if entry else None
+
+    def sweep(self) -> int:
+        """Удаляет просроченные коды из памяти и БД, возвращает их количество"""
+        now = time.time()
+        removed = 0
+        # Записи упорядочены по времени выдачи, а значит и по сроку истечения
+        while self._codes:
+            key, (_, expires_at) = next(iter(self._codes.items()))
+            if expires_at > now:
+                break
+            self._forget(key)
+            removed += 1
+        self._writes.execute('DELETE FROM verification_codes WHERE expires_at <= ?', (now,))
+        return removed
+
+    def close(self):
+        """Дожидается записи всех изменений и закрывает БД (блокирует — вызывать вне event loop)"""
+        self._writes.close()
+        self.db.close()
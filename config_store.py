@@ -0,0 +1,304 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Dict, List, Optional
+
+from db_pool import BackgroundWriter, SQLitePool
+from perf_metrics import metrics
+
+CONFIG_PATH = 'config.json'
+GUILD_DB_PATH = 'verification_stats.db'
+CHECK_INTERVAL = 1.0  # Как часто (в секундах) проверять mtime файла
+
+@dataclass(frozen=True)
+class BotConfig:
+    """Типизированное представление config.json"""
+    guild_id: Optional[int] = None
+    unverified_role_id: Optional[int] = None
+    verified_role_id: Optional[int] = None
+    moderator_channel_id: Optional[int] = None
+    welcome_channel_id: Optional[int] = None
+    log_channel_id: Optional[int] = None
+    verification_level: int = 1
+    # Обработка входов (режим рейда)
+    join_workers: int = 4
+    welcome_batch_size: int = 10
+    welcome_batch_window: float = 3.0
+    route_limits: Dict[str, Any] = field(default_factory=dict)
+    log_batch_window: float = 2.0
+    # Коды QR-верификации
+    code_ttl_hours: float = 24
+    code_store_max: int = 10000
+    # Кэш участников: "full" или "lean"
+    member_cache_mode: str = "full"
+    recent_join_hours: float = 24
+    # Срок хранения сырых данных статистики: {таблица: дней}; не указано или 0 — хранить всегда
+    retention_days: Dict[str, float] = field(default_factory=dict)
+    retention_archive: str = ""   # Путь к архивной БД; пусто — просроченные строки удаляются
+    # Обнаружение рейдов: действие ("level3", "pause_dm", "alert", "off") и пороги окна входов
+    raid_action: str = "level3"
+    raid_window_seconds: float = 60
+    raid_min_joins: int = 10
+    raid_burst_joins: int = 30
+    raid_young_days: float = 7
+    raid_young_share: float = 0.6
+    raid_no_avatar_share: float = 0.8
+    raid_name_cluster: int = 5
+    raid_cooldown_minutes: float = 15
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BotConfig":
+        return cls(
+            guild_id=data.get("GUILD_ID"),
+            unverified_role_id=data.get("UNVERIFIED_ROLE_ID"),
+            verified_role_id=data.get("VERIFIED_ROLE_ID"),
+            moderator_channel_id=data.get("MODERATOR_CHANNEL_ID"),
+            welcome_channel_id=data.get("WELCOME_CHANNEL_ID"),
+            log_channel_id=data.get("LOG_CHANNEL_ID"),
+            verification_level=data.get("VERIFICATION_LEVEL", 1),
+            join_workers=data.get("JOIN_WORKERS", 4),
+            welcome_batch_size=data.get("WELCOME_BATCH_SIZE", 10),
+            welcome_batch_window=data.get("WELCOME_BATCH_WINDOW", 3.0),
+            route_limits=data.get("ROUTE_LIMITS", {}),
+            log_batch_window=data.get("LOG_BATCH_WINDOW", 2.0),
+            code_ttl_hours=data.get("CODE_TTL_HOURS", 24),
+            code_store_max=data.get("CODE_STORE_MAX", 10000),
+            member_cache_mode=data.get("MEMBER_CACHE_MODE", "full"),
+            recent_join_hours=data.get("RECENT_JOIN_HOURS", 24),
+            retention_days=data.get("RETENTION_DAYS", {}),
+            retention_archive=data.get("RETENTION_ARCHIVE", ""),
+            raid_action=data.get("RAID_ACTION", "level3"),
+            raid_window_seconds=data.get("RAID_WINDOW_SECONDS", 60),
+            raid_min_joins=data.get("RAID_MIN_JOINS", 10),
+            raid_burst_joins=data.get("RAID_BURST_JOINS", 30),
+            raid_young_days=data.get("RAID_YOUNG_DAYS", 7),
+            raid_young_share=data.get("RAID_YOUNG_SHARE", 0.6),
+            raid_no_avatar_share=data.get("RAID_NO_AVATAR_SHARE", 0.8),
+            raid_name_cluster=data.get("RAID_NAME_CLUSTER", 5),
+            raid_cooldown_minutes=data.get("RAID_COOLDOWN_MINUTES", 15),
+            raw=dict(data)
+        )
+
+class ConfigStore:
+    """
+    Кэш конфигурации в памяти.
+
+    Файл читается один раз и перечитывается только при изменении его mtime
+    (проверка не чаще раза в CHECK_INTERVAL секунд) или по явному reload().
+    """
+
+    def __init__(self, path: str = CONFIG_PATH):
+        self.path = path
+        self._config: Optional[BotConfig] = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _file_stamp(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self) -> BotConfig:
+        """Возвращает текущую конфигурацию, перечитывая файл только если он изменился"""
+        now = time.monotonic()
+        if self._config is not None and now - self._checked_at < CHECK_INTERVAL:
+            return self._config
+
+        self._checked_at = now
+        try:
+            stamp = self._file_stamp()
+        except OSError:
+            if self._config is not None:
+                return self._config
+            raise
+
+        if stamp != self._stamp:
+            try:
+                self.reload()
+            except (OSError, ValueError) as e:
+                # Битый файл (например, во время ручного редактирования) — оставляем прежнюю версию
+                if self._config is None:
+                    raise
+                print(f"Ошибка при перечитывании {self.path}: {e}")
+        return self._config
+
+    def reload(self) -> BotConfig:
+        """Принудительно перечитывает файл конфигурации"""
+        with self._lock:
+            stamp = self._file_stamp()
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._config = BotConfig.from_dict(data)
+            self._stamp = stamp
+            self._checked_at = time.monotonic()
+            return self._config
+
+@dataclass(frozen=True)
+class GuildConfig:
+    """Настройки верификации одного сервера"""
+    guild_id: int
+    unverified_role_id: Optional[int] = None
+    verified_role_id: Optional[int] = None
+    moderator_channel_id: Optional[int] = None
+    welcome_channel_id: Optional[int] = None
+    log_channel_id: Optional[int] = None
+    verification_level: int = 1
+
+    @classmethod
+    def from_bot_config(cls, config: BotConfig) -> "GuildConfig":
+        return cls(
+            guild_id=config.guild_id,
+            unverified_role_id=config.unverified_role_id,
+            verified_role_id=config.verified_role_id,
+            moderator_channel_id=config.moderator_channel_id,
+            welcome_channel_id=config.welcome_channel_id,
+            log_channel_id=config.log_channel_id,
+            verification_level=config.verification_level
+        )
+
+GUILD_CONFIG_COLUMNS = [f.name for f in fields(GuildConfig)]
+
+class GuildConfigStore:
+    """
+    Настройки серверов, хранящиеся в таблице guild_configs.
+
+    Все записи держатся в словаре по guild_id, так что поиск — O(1).
+    Сервер из config.json (GUILD_ID) работает и без записи в таблице:
+    для него настройки берутся из файла, пока их не изменят командой.
+
+    Временный уровень верификации (режим рейда) хранится отдельно, в таблице
+    guild_level_overrides, и накладывается поверх настроек: запись в
+    guild_configs при этом не создаётся, и правки config.json продолжают действовать.
+    Изменения применяются в памяти сразу, а в БД пишутся в отдельном потоке
+    (BackgroundWriter): команды и режим рейда не ждут блокировку SQLite.
+    """
+
+    def __init__(self, db_path: str = GUILD_DB_PATH):
+        self.db_path = db_path
+        self._db: Optional[SQLitePool] = None
+        self._writes: Optional[BackgroundWriter] = None
+        self._configs: Dict[int, GuildConfig] = {}
+        self._level_overrides: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _open(self):
+        with self._lock:
+            if self._db is not None:
+                return
+            db = SQLitePool(self.db_path, readers=1)
+            db.writer.execute('''
+                CREATE TABLE IF NOT EXISTS guild_configs (
+                    guild_id INTEGER PRIMARY KEY,
+                    unverified_role_id INTEGER,
+                    verified_role_id INTEGER,
+                    moderator_channel_id INTEGER,
+                    welcome_channel_id INTEGER,
+                    log_channel_id INTEGER,
+                    verification_level INTEGER NOT NULL DEFAULT 1
+                )
+            ''')
+            db.writer.execute('''
+                CREATE TABLE IF NOT EXISTS guild_level_overrides (
+                    guild_id INTEGER PRIMARY KEY,
+                    verification_level INTEGER NOT NULL
+                )
+            ''')
+            rows = db.writer.execute(f'SELECT {", ".join(GUILD_CONFIG_COLUMNS)} FROM guild_configs').fetchall()
+            self._configs = {row[0]: GuildConfig(*row) for row in rows}
+            self._level_overrides = dict(
+                db.writer.execute('SELECT guild_id, verification_level FROM guild_level_overrides').fetchall()
+            )
+            self._writes = BackgroundWriter(db, "настройки серверов", 'guild-config')
+            self._db = db
+
+    def get(self, guild_id: int) -> Optional[GuildConfig]:
+        """Настройки сервера (с учётом временного уровня) или None, если сервер не настроен"""
+        return self._with_override(self.get_base(guild_id))
+
+    def get_base(self, guild_id: int) -> Optional[GuildConfig]:
+        """Настройки сервера без временного уровня"""
+        if self._db is None:
+            self._open()
+        config = self._configs.get(guild_id)
+        if config is None:
+            legacy = get_config()
+            if legacy.guild_id == guild_id:
+                return GuildConfig.from_bot_config(legacy)
+        return config
+
+    def _with_override(self, config: Optional[GuildConfig]) -> Optional[GuildConfig]:
+        if config is None:
+            return None
+        level = self._level_overrides.get(config.guild_id)
+        return config if level is None else replace(config, verification_level=level)
+
+    def update(self, guild_id: int, **changes) -> GuildConfig:
+        """Изменяет (или создаёт) настройки сервера; запись в БД идёт в фоне"""
+        config = replace(self.get_base(guild_id) or GuildConfig(guild_id=guild_id), **changes)
+        values = tuple(getattr(config, column) for column in GUILD_CONFIG_COLUMNS)
+        self._configs[guild_id] = config
+        self._writes.execute(
+            f'''INSERT OR REPLACE INTO guild_configs ({", ".join(GUILD_CONFIG_COLUMNS)})
+                VALUES ({", ".join("?" * len(values))})''',
+            values
+        )
+        return self._with_override(config)
+
+    def set_level_override(self, guild_id: int, level: int):
+        """Временно задаёт уровень верификации сервера, не трогая его настройки"""
+        if self._db is None:
+            self._open()
+        self._level_overrides[guild_id] = level
+        self._writes.execute(
+            'INSERT OR REPLACE INTO guild_level_overrides (guild_id, verification_level) VALUES (?, ?)',
+            (guild_id, level)
+        )
+
+    def clear_level_override(self, guild_id: int) -> bool:
+        """Снимает временный уровень; False — его не было"""
+        if self._db is None:
+            self._open()
+        if self._level_overrides.pop(guild_id, None) is None:
+            return False
+        self._writes.execute('DELETE FROM guild_level_overrides WHERE guild_id = ?', (guild_id,))
+        return True
+
+    def level_overrides(self) -> Dict[int, int]:
+        """Серверы с временным уровнем: {guild_id: уровень}"""
+        if self._db is None:
+            self._open()
+        return dict(self._level_overrides)
+
+    def all(self) -> List[GuildConfig]:
+        """Все настроенные серверы (включая сервер из config.json)"""
+        if self._db is None:
+            self._open()
+        configs = dict(self._configs)
+        legacy = get_config()
+        if legacy.guild_id and legacy.guild_id not in configs:
+            configs[legacy.guild_id] = GuildConfig.from_bot_config(legacy)
+        return [self._with_override(config) for config in configs.values()]
+
+    def close(self):
+        """Дожидается записи всех изменений и закрывает БД (блокирует — вызывать вне event loop)"""
+        with self._lock:
+            if self._db is not None:
+                self._writes.close()
+                self._db.close()
+                self._db = None
+                self._writes = None
+
+# --- Общие экземпляры для всех модулей ---
+config_store = ConfigStore()
+guild_config_store = GuildConfigStore()
+
+def get_config() -> BotConfig:
+    with metrics.timer("glistbot_config_read_seconds", source="bot"):
+        return config_store.get()
+
+def get_guild_config(guild_id: int) -> Optional[GuildConfig]:
+    with metrics.timer("glistbot_config_read_seconds", source="guild"):
+        return guild_config_store.get(guild_id)
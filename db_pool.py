@@ -0,0 +1,196 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Sequence
+
+from perf_metrics import metrics, sql_label
+
+# --- Настройки соединений SQLite ---
+DEFAULT_READERS = 4                    # Количество соединений для чтения
+CACHE_SIZE_KIB = 16 * 1024             # Кэш страниц на соединение (16 МБ)
+MMAP_SIZE = 256 * 1024 * 1024          # Размер отображения файла в память (256 МБ)
+BUSY_TIMEOUT_MS = 5000                 # Ожидание блокировки перед ошибкой
+STATEMENT_CACHE = 256                  # Подготовленных запросов на соединение
+WRITE_ATTEMPTS = 3                     # Сколько раз BackgroundWriter повторяет запись, если БД занята
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор, записывающий время каждого запроса в метрики (метка — вид запроса и таблица)"""
+
+    def execute(self, sql, parameters=()):
+        started = time.monotonic()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe("glistbot_sqlite_query_seconds", time.monotonic() - started, statement=sql_label(sql))
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.monotonic()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe("glistbot_sqlite_query_seconds", time.monotonic() - started, statement=sql_label(sql))
+
+class TimedConnection(sqlite3.Connection):
+    """Соединение, у которого и conn.execute, и conn.cursor() дают TimedCursor"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class ReadToken:
+    """
+    Отмена запроса чтения, который выполняется в другом потоке.
+
+    Пул привязывает к токену выданное соединение на время чтения;
+    cancel() прерывает текущий запрос через conn.interrupt(), а если чтение
+    ещё не началось — оно завершится ошибкой сразу при получении соединения.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.cancelled = False
+
+    def attach(self, conn: sqlite3.Connection):
+        with self._lock:
+            if self.cancelled:
+                raise sqlite3.OperationalError("interrupted")
+            self._conn = conn
+
+    def detach(self):
+        with self._lock:
+            self._conn = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+
+class SQLitePool:
+    """
+    Небольшой пул постоянных соединений SQLite: один писатель и N читателей.
+
+    БД переводится в режим WAL, поэтому читатели не блокируют писателя и наоборот.
+    Соединения живут всё время работы пула, так что схема разбирается один раз,
+    а подготовленные запросы переиспользуются из кэша каждого соединения
+    (ключ кэша — текст SQL, поэтому запросы стоит держать в константах).
+    """
+
+    def __init__(self, db_path: str, readers: int = DEFAULT_READERS):
+        self.db_path = db_path
+        self._closed = False
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+        # Писатель работает в режиме autocommit: транзакции открываются явно
+        self.writer = self._connect(isolation_level=None)
+        self.writer.execute('PRAGMA journal_mode=WAL')
+
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(max(1, readers)):
+            self._readers.put(self._connect())
+
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE,
+            factory=TimedConnection,
+            **kwargs
+        )
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KIB}')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def reader(self, token: Optional[ReadToken] = None) -> Iterator[sqlite3.Connection]:
+        """Выдаёт соединение для чтения; ждёт, если все заняты. token позволяет прервать чтение."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Пул соединений закрыт")
+        conn = self._readers.get()
+        try:
+            if token is not None:
+                token.attach(conn)
+            try:
+                yield conn
+            finally:
+                if token is not None:
+                    token.detach()
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Открывает транзакцию на соединении писателя.
+        Должна вызываться только из одного потока (потока записи).
+        """
+        self.writer.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.writer
+        except BaseException:
+            self.writer.execute('ROLLBACK')
+            raise
+        else:
+            self.writer.execute('COMMIT')
+
+    def close(self):
+        """Закрывает все соединения пула"""
+        self._closed = True
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+
+class BackgroundWriter:
+    """
+    Запись в БД из отдельного потока, чтобы event loop не ждал блокировку SQLite.
+
+    Запросы выполняются по одному в порядке постановки на соединении писателя
+    пула; вызывающий код не ждёт результата. Если БД занята другим писателем
+    дольше busy_timeout, запись повторяется, а после WRITE_ATTEMPTS попыток
+    ошибка печатается в консоль — главная копия данных у вызывающего в памяти.
+    """
+
+    def __init__(self, pool: SQLitePool, what: str, name: str = 'db'):
+        self.pool = pool
+        self.what = what
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'{name}-writer')
+
+    def _write(self, sql: str, rows: Sequence[tuple]):
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                self.pool.writer.executemany(sql, rows)
+                return
+            except sqlite3.OperationalError as e:
+                if attempt == WRITE_ATTEMPTS:
+                    print(f"Не удалось сохранить {self.what} в БД: {e}")
+            except sqlite3.Error as e:
+                print(f"Ошибка при сохранении {self.what} в БД: {e}")
+                return
+
+    def execute(self, sql: str, *rows: tuple):
+        """Ставит запрос (по одному набору параметров на строку) в очередь записи"""
+        self._executor.submit(self._write, sql, rows)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Выполняет fn в потоке записи после всех ранее поставленных запросов"""
+        return self._executor.submit(fn, *args)
+
+    def close(self):
+        """Дожидается всех записей (блокирует — вызывать вне event loop)"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,190 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from perf_metrics import metrics
+
+# --- Лимиты по маршрутам Discord API: (запросов, за секунд) ---
+# Значения чуть ниже реальных лимитов, чтобы не упираться в 429
+DEFAULT_ROUTE_LIMITS: Dict[str, Tuple[int, float]] = {
+    "roles": (10, 1.0),     # Изменение ролей участников сервера
+    "welcome": (4, 5.0),    # Сообщения в канал приветствий
+    "dm": (4, 1.0),         # Личные сообщения
+    "mod": (4, 5.0),        # Сообщения в канал модерации
+    "kick": (5, 1.0),       # Кик участников (массовое отклонение заявок)
+}
+
+class TokenBucket:
+    """Простое ведро токенов: не более capacity запросов за per секунд"""
+
+    def __init__(self, capacity: int, per: float):
+        self.capacity = capacity
+        self.fill_rate = capacity / per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.fill_rate)
+
+class RouteLimiter:
+    """
+    Ограничитель запросов по маршрутам.
+    Для каждой пары (маршрут, ключ) — например ("roles", guild_id) — заводится своё ведро.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, float]]] = None):
+        self.limits = dict(DEFAULT_ROUTE_LIMITS)
+        if limits:
+            self.limits.update({route: (int(rate), float(per)) for route, (rate, per) in limits.items()})
+        self._buckets: Dict[Tuple[str, Hashable], TokenBucket] = {}
+
+    async def acquire(self, route: str, key: Hashable = None):
+        if route not in self.limits:
+            return
+        bucket = self._buckets.get((route, key))
+        if bucket is None:
+            bucket = self._buckets[(route, key)] = TokenBucket(*self.limits[route])
+        with metrics.timer("glistbot_ratelimit_wait_seconds", route=route):
+            await bucket.acquire()
+
+class JoinPipeline:
+    """
+    Очередь обработки входов с фиксированным пулом воркеров.
+    Событие on_member_join только ставит участника в очередь и сразу возвращается.
+
+    У каждого сервера своя очередь, воркеры берут участников из них по кругу:
+    во время рейда на одном сервере вход на другом не ждёт весь накопившийся
+    хвост рейда (и его лимит на смену ролей). Общая asyncio.Queue хранит только
+    «талоны» — по одному на участника — для ожидания, предела размера и join().
+    """
+
+    def __init__(self, handler: Callable[..., Awaitable], workers: int = 4, maxsize: int = 10000):
+        self.handler = handler
+        self.worker_count = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        # guild_id -> входы сервера в порядке поступления; порядок обхода серверов
+        self._guilds: Dict[int, Deque[Tuple[float, object]]] = {}
+        self._order: Deque[int] = deque()
+        self._workers: List[asyncio.Task] = []
+        self.processed = 0
+        self.dropped = 0
+        # Задержка от события входа до конца обработки (последние 1000 входов)
+        self.latencies = deque(maxlen=1000)
+
+    def start(self):
+        for i in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"join-worker-{i}"))
+
+    async def stop(self, timeout: float = 10.0):
+        """Дожидается обработки очереди (не дольше timeout) и останавливает воркеров"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Очередь входов не обработана до конца: осталось {self.queue.qsize()}")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    def submit(self, member) -> bool:
+        if self.queue.full():
+            self.dropped += 1
+            print(f"Очередь входов переполнена, участник {member.name} не обработан")
+            return False
+        members = self._guilds.get(member.guild.id)
+        if members is None:
+            members = self._guilds[member.guild.id] = deque()
+            self._order.append(member.guild.id)
+        members.append((time.monotonic(), member))
+        self.queue.put_nowait(None)
+        return True
+
+    def _next(self) -> Tuple[float, object]:
+        """Следующий вход: первый в очереди сервера, чья очередь подошла"""
+        guild_id = self._order.popleft()
+        members = self._guilds[guild_id]
+        item = members.popleft()
+        if members:
+            self._order.append(guild_id)
+        else:
+            del self._guilds[guild_id]
+        return item
+
+    async def _worker(self):
+        while True:
+            await self.queue.get()
+            joined_at, member = self._next()
+            metrics.observe("glistbot_join_queue_seconds", time.monotonic() - joined_at)
+            try:
+                with metrics.timer("glistbot_join_stage_seconds", stage="total"):
+                    await self.handler(member)
+            except Exception as e:
+                print(f"Ошибка при обработке входа {member.name}: {e}")
+            finally:
+                self.processed += 1
+                self.latencies.append(time.monotonic() - joined_at)
+                self.queue.task_done()
+
+class WelcomeBatcher:
+    """
+    Объединяет приветствия: участники, зашедшие в течение window секунд,
+    приветствуются одним сообщением (не более batch_size человек в сообщении).
+    """
+
+    def __init__(self, send: Callable[..., Awaitable], batch_size: int = 10, window: float = 3.0):
+        self.send = send
+        self.batch_size = max(1, batch_size)
+        self.window = window
+        self._pending: Dict[int, Tuple[object, list]] = {}
+        self._timers: Dict[int, asyncio.Task] = {}
+        self._sending: set = set()
+
+    def add(self, channel, member):
+        _, members = self._pending.setdefault(channel.id, (channel, []))
+        members.append(member)
+        if len(members) >= self.batch_size:
+            self._flush_soon(channel.id)
+        elif channel.id not in self._timers:
+            self._timers[channel.id] = asyncio.create_task(self._flush_later(channel.id))
+
+    async def _flush_later(self, channel_id: int):
+        await asyncio.sleep(self.window)
+        self._timers.pop(channel_id, None)
+        await self._flush(channel_id)
+
+    def _flush_soon(self, channel_id: int):
+        timer = self._timers.pop(channel_id, None)
+        if timer:
+            timer.cancel()
+        task = asyncio.create_task(self._flush(channel_id))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _flush(self, channel_id: int):
+        channel, members = self._pending.pop(channel_id, (None, []))
+        if not members:
+            return
+        try:
+            await self.send(channel, members)
+        except Exception as e:
+            print(f"Ошибка при отправке приветствия ({len(members)} участников): {e}")
+
+    async def close(self):
+        """Отправляет всё накопленное и останавливает таймеры"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for channel_id in list(self._pending):
+            await self._flush(channel_id)
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Tuple
+
+import discord
+
+from perf_metrics import discord_request
+
+MAX_EMBEDS_PER_MESSAGE = 10     # Ограничение Discord на одно сообщение
+SUMMARY_CHUNK_CHARS = 3900      # Запас до лимита описания embed (4096)
+
+class LogEvent(NamedTuple):
+    embed: discord.Embed
+    summary: str  # Короткая строка для сводки при большом всплеске
+
+class LogAggregator:
+    """
+    Буферизует события для канала логов и отправляет их пачками по таймеру.
+
+    Если за окно накопилось не больше 10 событий, они уходят одним сообщением
+    с несколькими embed. При большем всплеске вместо отдельных embed
+    отправляется компактная сводка по строке на событие.
+    """
+
+    def __init__(self, window: float = 2.0, max_pending: int = 2000):
+        self.window = window
+        self.max_pending = max_pending
+        self._pending: Dict[int, Tuple[object, List[LogEvent]]] = {}
+        self._task = None
+        self.dropped = 0
+        self.sent_events = 0
+        self.sent_messages = 0
+
+    @property
+    def queued(self) -> int:
+        """Количество событий, ожидающих отправки"""
+        return sum(len(events) for _, events in self._pending.values())
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def add(self, channel, embed: discord.Embed, summary: str):
+        if self.queued >= self.max_pending:
+            self.dropped += 1
+            return
+        _, events = self._pending.setdefault(channel.id, (channel, []))
+        events.append(LogEvent(embed, summary))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.window)
+            await self.flush()
+
+    async def flush(self):
+        """Отправляет всё накопленное по каждому каналу"""
+        pending, self._pending = self._pending, {}
+        for channel, events in pending.values():
+            try:
+                if len(events) <= MAX_EMBEDS_PER_MESSAGE:
+                    with discord_request("log"):
+                        await channel.send(embeds=[event.embed for event in events])
+                    self.sent_messages += 1
+                else:
+                    for embed in self._summary_embeds(events):
+                        with discord_request("log"):
+                            await channel.send(embed=embed)
+                        self.sent_messages += 1
+                self.sent_events += len(events)
+            except discord.HTTPException as e:
+                self.dropped += len(events)
+                print(f"Ошибка при отправке логов ({len(events)} событий): {e}")
+
+    @staticmethod
+    def _summary_embeds(events: List[LogEvent]) -> List[discord.Embed]:
+        """Собирает сводку из строк событий, разбивая её по лимиту длины описания"""
+        chunks = []
+        current = []
+        size = 0
+        for event in events:
+            summary = event.summary[:SUMMARY_CHUNK_CHARS]   # Одна строка не должна превышать лимит embed
+            if current and size + len(summary) + 1 > SUMMARY_CHUNK_CHARS:
+                chunks.append(current)
+                current, size = [], 0
+            current.append(summary)
+            size += len(summary) + 1
+        if current:
+            chunks.append(current)
+
+        embeds = []
+        for i, lines in enumerate(chunks, start=1):
+            title = f"📊 Сводка верификаций: {len(events)} событий"
+            if len(chunks) > 1:
+                title += f" (часть {i}/{len(chunks)})"
+            embeds.append(discord.Embed(
+                title=title,
+                description="\n".join(lines),
+                color=discord.Color.blurple(),
+                timestamp=datetime.now()
+            ))
+        return embeds
@@ -0,0 +1,238 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from db_pool import BackgroundWriter, SQLitePool
+from risk_score import fetch_failed_attempts, score_batch
+
+# Состояния заявки на ручную верификацию
+STATUS_PENDING = "pending"
+STATUS_APPROVED = "approved"
+STATUS_DENIED = "denied"
+STATUS_LEFT = "left"
+
+RANK_TTL = 60.0     # Сколько секунд действует рассчитанный порядок очереди (оценка зависит от возраста аккаунта)
+
+@dataclass
+class ManualRequest:
+    """Заявка участника на ручную верификацию (уровень 3)"""
+    guild_id: int
+    user_id: int
+    username: str
+    account_created_at: float
+    created_at: float
+    channel_id: Optional[int] = None
+    message_id: Optional[int] = None
+    status: str = STATUS_PENDING
+    moderator_id: Optional[int] = None
+    resolved_at: Optional[float] = None
+
+REQUEST_COLUMNS = ("guild_id", "user_id", "username", "account_created_at", "created_at",
+                   "channel_id", "message_id", "status", "moderator_id", "resolved_at")
+
+class ManualRequestStore:
+    """
+    Заявки на ручную верификацию в таблице manual_requests.
+
+    Ожидающие заявки держатся в памяти в двух словарях: по (guild_id, user_id)
+    и по ID сообщения с кнопками, поэтому нажатие кнопки находит участника
+    за O(1) без разбора текста embed. Обработанные заявки остаются в БД,
+    так что повторное нажатие (в том числе после перезапуска) распознаётся.
+
+    Изменения пишутся в БД в отдельном потоке (BackgroundWriter), поэтому вход
+    участника и нажатие кнопки не ждут блокировку SQLite; состояние заявок
+    определяется словарями в памяти.
+    """
+
+    def __init__(self, db_path: str = 'verification_stats.db'):
+        self.db = SQLitePool(db_path, readers=1)
+        self._pending: Dict[Tuple[int, int], ManualRequest] = {}
+        self._by_message: Dict[int, ManualRequest] = {}
+        # Обработанные заявки, чья запись в БД ещё в очереди: by_message находит их без БД
+        self._unsaved: Dict[int, ManualRequest] = {}
+        # Заявки, которые прямо сейчас обрабатываются (защита от двойного нажатия)
+        self._claimed = set()
+        self._lock = threading.Lock()
+        # Счётчик изменений очереди каждого сервера: рассчитанный порядок действует, пока он не изменился
+        self._changes: Dict[int, int] = {}
+        # Очередь сервера по убыванию риска: guild_id -> (время расчёта, изменения, версия попыток, [(оценка, заявка)])
+        self._ranked: Dict[int, Tuple[float, int, int, List[Tuple[float, ManualRequest]]]] = {}
+        self.db.writer.execute('''
+            CREATE TABLE IF NOT EXISTS manual_requests (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT NOT NULL,
+                account_created_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                channel_id INTEGER,
+                message_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending',
+                moderator_id INTEGER,
+                resolved_at REAL,
+                PRIMARY KEY (guild_id, user_id)
+            )
+        ''')
+        self.db.writer.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_manual_requests_message ON manual_requests (message_id)'
+        )
+        self.db.writer.execute(
+            'CREATE INDEX IF NOT EXISTS idx_manual_requests_queue ON manual_requests (guild_id, status, created_at)'
+        )
+        self._load()
+        self._writes = BackgroundWriter(self.db, "заявки на ручную верификацию", 'requests')
+
+    def _load(self):
+        rows = self.db.writer.execute(
+            f'SELECT {", ".join(REQUEST_COLUMNS)} FROM manual_requests WHERE status = ? ORDER BY created_at',
+            (STATUS_PENDING,)
+        ).fetchall()
+        for row in rows:
+            self._remember(ManualRequest(*row))
+
+    def _remember(self, request: ManualRequest):
+        self._pending[(request.guild_id, request.user_id)] = request
+        self._changes[request.guild_id] = self._changes.get(request.guild_id, 0) + 1
+        if request.message_id is not None:
+            self._by_message[request.message_id] = request
+
+    def _forget(self, request: ManualRequest):
+        self._pending.pop((request.guild_id, request.user_id), None)
+        self._changes[request.guild_id] = self._changes.get(request.guild_id, 0) + 1
+        if request.message_id is not None:
+            self._by_message.pop(request.message_id, None)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, guild_id: int, user_id: int, username: str, account_created_at: float) -> ManualRequest:
+        """Создаёт заявку (повторный вход участника заменяет прежнюю)"""
+        previous = self._pending.get((guild_id, user_id))
+        if previous is not None:
+            self._forget(previous)
+        request = ManualRequest(guild_id, user_id, username, account_created_at, time.time())
+        self._writes.execute(
+            f'INSERT OR REPLACE INTO manual_requests ({", ".join(REQUEST_COLUMNS)}) '
+            f'VALUES ({", ".join("?" * len(REQUEST_COLUMNS))})',
+            tuple(getattr(request, column) for column in REQUEST_COLUMNS)
+        )
+        self._remember(request)
+        return request
+
+    def attach_message(self, request: ManualRequest, channel_id: int, message_id: int):
+        """Привязывает к заявке сообщение с кнопками в канале модерации"""
+        request.channel_id = channel_id
+        request.message_id = message_id
+        self._writes.execute(
+            'UPDATE manual_requests SET channel_id = ?, message_id = ? WHERE guild_id = ? AND user_id = ?',
+            (channel_id, message_id, request.guild_id, request.user_id)
+        )
+        if (request.guild_id, request.user_id) in self._pending:
+            self._by_message[message_id] = request
+
+    def get(self, guild_id: int, user_id: int) -> Optional[ManualRequest]:
+        """Ожидающая заявка участника или None"""
+        return self._pending.get((guild_id, user_id))
+
+    async def by_message(self, message_id: int) -> Optional[ManualRequest]:
+        """
+        Заявка по ID сообщения с кнопками.
+        Ожидающие находятся в памяти; обработанные читаются из БД по индексу в потоке.
+        Строка в БД может отставать от памяти, но claim() проверяет заявку по памяти,
+        так что устаревшая копия не будет обработана повторно.
+        """
+        request = self._by_message.get(message_id) or self._unsaved.get(message_id)
+        if request is not None:
+            return request
+        try:
+            return await asyncio.to_thread(self._load_by_message, message_id)
+        except sqlite3.Error as e:
+            print(f"Ошибка при поиске заявки по сообщению {message_id}: {e}")
+            return None
+
+    def _load_by_message(self, message_id: int) -> Optional[ManualRequest]:
+        with self.db.reader() as conn:
+            row = conn.execute(
+                f'SELECT {", ".join(REQUEST_COLUMNS)} FROM manual_requests WHERE message_id = ?',
+                (message_id,)
+            ).fetchone()
+        return ManualRequest(*row) if row else None
+
+    def claim(self, request: ManualRequest) -> bool:
+        """Захватывает ожидающую заявку для обработки; False — уже обработана или в работе"""
+        key = (request.guild_id, request.user_id)
+        with self._lock:
+            if request.status != STATUS_PENDING or key in self._claimed or self._pending.get(key) is not request:
+                return False
+            self._claimed.add(key)
+            return True
+
+    def release(self, request: ManualRequest):
+        """Снимает захват, если обработка не удалась (заявка остаётся ожидающей)"""
+        with self._lock:
+            self._claimed.discard((request.guild_id, request.user_id))
+
+    def resolve(self, request: ManualRequest, status: str, moderator_id: Optional[int] = None):
+        """Закрывает заявку с итоговым статусом"""
+        request.status = status
+        request.moderator_id = moderator_id
+        request.resolved_at = time.time()
+        self._writes.execute(
+            'UPDATE manual_requests SET status = ?, moderator_id = ?, resolved_at = ? '
+            'WHERE guild_id = ? AND user_id = ? AND created_at = ?',
+            (status, moderator_id, request.resolved_at, request.guild_id, request.user_id, request.created_at)
+        )
+        if request.message_id is not None:
+            self._unsaved[request.message_id] = request
+            self._writes.submit(self._unsaved.pop, request.message_id, None)
+        self._forget(request)
+        self.release(request)
+
+    def pending(self, guild_id: int) -> List[ManualRequest]:
+        """Ожидающие заявки сервера в порядке поступления"""
+        return sorted((request for request in self._pending.values() if request.guild_id == guild_id),
+                      key=lambda request: request.created_at)
+
+    async def ranked(self, guild_id: int, attempts_version: int = 0) -> List[Tuple[float, ManualRequest]]:
+        """
+        Ожидающие заявки сервера с оценкой риска (0..100), самые рискованные первыми.
+        Вся очередь оценивается одной пачкой в потоке (чтение попыток из БД не
+        блокирует event loop). Результат хранится, пока не изменились очередь
+        и attempts_version (версия данных о попытках верификации сервера),
+        но не дольше RANK_TTL секунд.
+        """
+        changes = self._changes.get(guild_id, 0)
+        cached = self._ranked.get(guild_id)
+        if (cached is not None and time.monotonic() - cached[0] < RANK_TTL
+                and cached[1:3] == (changes, attempts_version)):
+            return cached[3]
+
+        requests = self.pending(guild_id)
+        ranking = await asyncio.to_thread(self._rank, guild_id, requests)
+        self._ranked[guild_id] = (time.monotonic(), changes, attempts_version, ranking)
+        return ranking
+
+    def _rank(self, guild_id: int, requests: List[ManualRequest]) -> List[Tuple[float, ManualRequest]]:
+        attempts: Dict[int, int] = {}
+        if requests:
+            try:
+                with self.db.reader() as conn:
+                    attempts = fetch_failed_attempts(conn, guild_id, [request.user_id for request in requests])
+            except sqlite3.Error as e:
+                # Таблицу verification_attempts создаёт модуль статистики; без неё попытки не учитываются
+                print(f"Не удалось прочитать попытки верификации для оценки риска: {e}")
+        scores = score_batch(
+            array('d', (request.account_created_at for request in requests)),
+            array('d', (request.created_at for request in requests)),
+            [request.username for request in requests],
+            array('l', (attempts.get(request.user_id, 0) for request in requests)),
+        )
+        return sorted(zip(scores, requests), key=lambda item: (-item[0], item[1].created_at))
+
+    def close(self):
+        """Дожидается записи всех изменений и закрывает БД (блокирует — вызывать вне event loop)"""
+        self._writes.close()
+        self.db.close()
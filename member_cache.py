@@ -0,0 +1,152 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import discord
+from discord.ext import commands, tasks
+
+from config_store import get_config, get_guild_config
+
+MEMBER_CACHE_MODES = ("full", "lean")
+
+def member_cache_options(mode: str) -> dict:
+    """
+    Параметры commands.Bot для выбранного режима кэша участников.
+
+    full — стандартное поведение: при запуске загружаются все участники всех серверов.
+    lean — участники не загружаются при запуске, в кэш попадают только вошедшие
+    во время работы бота; лишние периодически вытесняются (см. MemberCacheCog),
+    остальные запрашиваются у Discord по требованию (resolve_member).
+    """
+    if mode not in MEMBER_CACHE_MODES:
+        raise ValueError(f"Неизвестный MEMBER_CACHE_MODE: {mode!r} (допустимо: {', '.join(MEMBER_CACHE_MODES)})")
+    if mode == "full":
+        return {}
+    flags = discord.MemberCacheFlags.none()
+    flags.joined = True
+    return {"member_cache_flags": flags, "chunk_guilds_at_startup": False}
+
+async def resolve_member(guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+    """Участник из кэша, а если его там нет — запросом к Discord API"""
+    member = guild.get_member(user_id)
+    if member is not None:
+        return member
+    try:
+        return await guild.fetch_member(user_id)
+    except discord.NotFound:
+        return None
+
+def resident_memory() -> Optional[int]:
+    """Текущий объём резидентной памяти процесса в байтах (None, если узнать нельзя)"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    # На macOS и прочих системах доступен только пик: ru_maxrss (байты на macOS, КБ на остальных)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def format_memory(size: Optional[int]) -> str:
+    return "неизвестно" if size is None else f"{size / (1024 * 1024):.1f} МБ"
+
+class MemberCacheCog(commands.Cog):
+    """
+    Отчёт о памяти и (в режиме lean) вытеснение ненужных участников из кэша.
+    В кэше остаются участники с ролью неверифицированных и недавно вошедшие.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        config = get_config()
+        self.mode = config.member_cache_mode
+        self.recent_join = timedelta(hours=config.recent_join_hours)
+        self.evicted = 0
+
+    async def cog_load(self):
+        print(f"Режим кэша участников: {self.mode}, память процесса: {format_memory(resident_memory())}")
+        self.hourly_report.start()
+        if self.mode == "lean":
+            self.trim_cache.start()
+
+    async def cog_unload(self):
+        self.hourly_report.cancel()
+        self.trim_cache.cancel()
+
+    def cached_members(self) -> int:
+        return sum(len(guild.members) for guild in self.bot.guilds)
+
+    def report_line(self) -> str:
+        return (f"Память процесса: {format_memory(resident_memory())}, "
+                f"участников в кэше: {self.cached_members()}, вытеснено: {self.evicted}")
+
+    @tasks.loop(hours=1)
+    async def hourly_report(self):
+        print(self.report_line())
+
+    @hourly_report.before_loop
+    async def before_hourly_report(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(minutes=10)
+    async def trim_cache(self):
+        """Убирает из кэша верифицированных участников, вошедших давно"""
+        cutoff = datetime.now(timezone.utc) - self.recent_join
+        for guild in self.bot.guilds:
+            config = get_guild_config(guild.id)
+            unverified_role_id = config.unverified_role_id if config else None
+            for member in list(guild.members):
+                if member.id == self.bot.user.id:
+                    continue
+                if unverified_role_id and member.get_role(unverified_role_id) is not None:
+                    continue
+                if member.joined_at is not None and member.joined_at >= cutoff:
+                    continue
+                # В discord.py нет публичного способа убрать участника из кэша
+                guild._remove_member(member)
+                self.evicted += 1
+
+    @trim_cache.before_loop
+    async def before_trim_cache(self):
+        await self.bot.wait_until_ready()
+
+    @commands.command(name='memory')
+    @commands.has_permissions(administrator=True)
+    async def memory(self, ctx):
+        """Текущая память процесса и размер кэша участников"""
+        await ctx.send(f"🧠 Режим кэша: **{self.mode}**. {self.report_line()}.")
+
+async def setup(bot):
+    await bot.add_cog(MemberCacheCog(bot))
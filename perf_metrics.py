@@ -0,0 +1,282 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import discord
+from aiohttp import web
+from discord.ext import commands
+
+# Границы корзин гистограмм (секунды): от миллисекунды до минут ожидания лимитов
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+PERF_TOP = 15               # Строк в ответе команды !perf
+SQL_LABEL_CACHE = 1024      # Сколько разных SQL-запросов помнить при построении меток
+
+# Описания метрик для /metrics (# HELP)
+METRIC_HELP: Dict[str, str] = {
+    "glistbot_join_queue_seconds": "Ожидание входа в очереди до начала обработки",
+    "glistbot_join_stage_seconds": "Длительность этапов обработки входа",
+    "glistbot_join_to_verified_seconds": "Время от входа на сервер до успешной верификации",
+    "glistbot_ratelimit_wait_seconds": "Ожидание локального лимитера перед запросом к Discord",
+    "glistbot_discord_request_seconds": "Длительность запросов к Discord API",
+    "glistbot_discord_errors_total": "Ошибки запросов к Discord API",
+    "glistbot_sqlite_query_seconds": "Выполнение запросов SQLite (до первой строки результата)",
+    "glistbot_stats_read_seconds": "Чтения статистики в пуле потоков, включая ожидание слота",
+    "glistbot_config_read_seconds": "Чтение настроек бота и сервера",
+    "glistbot_command_seconds": "Выполнение команд",
+    "glistbot_commands_total": "Выполненные команды по результату",
+    "glistbot_raid_alerts_total": "Включения режима рейда по действию",
+    "glistbot_role_transition_seconds": "Смена ролей верификации, включая повторы после 429",
+    "glistbot_role_transition_retries_total": "Повторы смены ролей после ответа 429",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами, как в Prometheus"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # Последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class Metrics:
+    """
+    Реестр гистограмм и счётчиков.
+
+    Метрики создаются при первом обращении, метки передаются именованными
+    аргументами. Запись защищена блокировкой: запросы SQLite измеряются
+    в потоках пула чтения.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, object]) -> Tuple[str, Labels]:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Измеряет время блока (в том числе с await внутри) и пишет его в гистограмму"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def histograms(self) -> List[Tuple[str, Labels, Histogram]]:
+        with self._lock:
+            return [(name, labels, histogram) for (name, labels), histogram in self._histograms.items()]
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (version 0.0.4)"""
+        with self._lock:
+            histograms = sorted((key, histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                                for key, histogram in self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        lines = []
+        described = set()
+
+        def describe(name: str, kind: str):
+            if name not in described:
+                described.add(name)
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), buckets, counts, total, count in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, float('inf')), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+metrics = Metrics()
+
+@contextmanager
+def discord_request(route: str) -> Iterator[None]:
+    """Время запроса к Discord API; ошибки считаются по маршруту и HTTP-статусу"""
+    started = time.monotonic()
+    try:
+        yield
+    except discord.HTTPException as e:
+        metrics.inc("glistbot_discord_errors_total", route=route, status=e.status)
+        raise
+    except discord.RateLimited:
+        metrics.inc("glistbot_discord_errors_total", route=route, status=429)
+        raise
+    finally:
+        metrics.observe("glistbot_discord_request_seconds", time.monotonic() - started, route=route)
+
+# --- Метки запросов SQLite: вид запроса и таблица вместо полного текста ---
+_SQL_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)', re.IGNORECASE)
+_sql_labels: Dict[str, str] = {}
+
+def sql_label(sql: str) -> str:
+    """'SELECT verifications', 'INSERT daily_joins', 'PRAGMA' и т. п."""
+    label = _sql_labels.get(sql)
+    if label is None:
+        words = sql.split(None, 1)
+        label = words[0].upper() if words else "?"
+        table = _SQL_TABLE.search(sql)
+        if table:
+            label = f"{label} {table.group(1)}"
+        if len(_sql_labels) < SQL_LABEL_CACHE:
+            _sql_labels[sql] = label
+    return label
+
+def format_seconds(value: float) -> str:
+    if value < 1:
+        return f"{value * 1000:.1f}мс"
+    return f"{value:.2f}с"
+
+class MetricsCog(commands.Cog):
+    """
+    Метрики производительности: HTTP-эндпоинт /metrics для Prometheus
+    и команда !perf. Здесь же измеряется время выполнения всех команд.
+    """
+
+    def __init__(self, bot, host: str = "127.0.0.1", port: int = 9108):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def cog_load(self):
+        if not self.port:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            print(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+        except OSError as e:
+            print(f"Не удалось запустить сервер метрик на порту {self.port}: {e}")
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def cog_unload(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    # --- Время выполнения команд ---
+    @commands.Cog.listener()
+    async def on_command(self, ctx):
+        ctx.perf_started = time.monotonic()
+
+    def _command_done(self, ctx, status: str):
+        started = getattr(ctx, 'perf_started', None)
+        if started is None or ctx.command is None:
+            return
+        name = ctx.command.qualified_name
+        metrics.observe("glistbot_command_seconds", time.monotonic() - started, command=name)
+        metrics.inc("glistbot_commands_total", command=name, status=status)
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        self._command_done(ctx, "ok")
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx, error):
+        self._command_done(ctx, "error")
+
+    @commands.command(name='perf')
+    @commands.has_permissions(administrator=True)
+    async def perf(self, ctx, prefix: str = ""):
+        """Самые затратные измерения: !perf [начало имени метрики, например join]"""
+        rows = [(name, labels, histogram) for name, labels, histogram in metrics.histograms()
+                if name.removeprefix("glistbot_").startswith(prefix)]
+        if not rows:
+            await ctx.send("ℹ️ Измерений пока нет.")
+            return
+
+        rows.sort(key=lambda row: row[2].sum, reverse=True)
+        lines = [f"{'метрика':<44} {'n':>7} {'p50':>8} {'p95':>8} {'сумма':>9}"]
+        for name, labels, histogram in rows[:PERF_TOP]:
+            title = name.removeprefix("glistbot_").removesuffix("_seconds")
+            if labels:
+                title += "{" + ",".join(value for _, value in labels) + "}"
+            lines.append(f"{title[:44]:<44} {histogram.count:>7} {format_seconds(histogram.quantile(0.5)):>8} "
+                         f"{format_seconds(histogram.quantile(0.95)):>8} {format_seconds(histogram.sum):>9}")
+
+        embed = discord.Embed(
+            title="⏱️ Производительность",
+            description="```\n" + "\n".join(lines) + "\n```",
+            color=discord.Color.blurple()
+        )
+        if self._runner is not None:
+            embed.set_footer(text=f"Все метрики: http://{self.host}:{self.port}/metrics")
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    host = os.getenv("METRICS_HOST", "127.0.0.1")
+    port = int(os.getenv("METRICS_PORT", "9108"))
+    await bot.add_cog(MetricsCog(bot, host=host, port=port))
@@ -0,0 +1,363 @@
+"""
+Локальная генерация QR-кодов в PNG без внешних сервисов и зависимостей.
+
+Поддерживается байтовый режим, уровень коррекции ошибок M и версии 1–10
+(до 213 байт данных) — этого с запасом хватает для кодов верификации.
+"""
+
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, Optional
+
+# --- Таблицы стандарта для уровня коррекции M (индекс — номер версии) ---
+MAX_VERSION = 10
+ECC_CODEWORDS_PER_BLOCK = (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26)
+NUM_ERROR_CORRECTION_BLOCKS = (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5)
+FORMAT_BITS_M = 0  # Биты уровня коррекции M в формате QR
+
+# --- Параметры изображения ---
+MODULE_PIXELS = 8     # Размер одного модуля в пикселях
+QUIET_ZONE = 4        # Белая рамка в модулях
+
+# --- Арифметика Рида — Соломона в GF(256) ---
+def _rs_multiply(x: int, y: int) -> int:
+    z = 0
+    for i in reversed(range(8)):
+        z = (z << 1) ^ ((z >> 7) * 0x11D)
+        z ^= ((y >> i) & 1) * x
+    return z
+
+def _rs_divisor(degree: int) -> List[int]:
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = _rs_multiply(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = _rs_multiply(root, 0x02)
+    return result
+
+def _rs_remainder(data: List[int], divisor: List[int]) -> List[int]:
+    result = [0] * len(divisor)
+    for b in data:
+        factor = b ^ result.pop(0)
+        result.append(0)
+        for i, coef in enumerate(divisor):
+            result[i] ^= _rs_multiply(coef, factor)
+    return result
+
+def _get_bit(value: int, index: int) -> bool:
+    return (value >> index) & 1 != 0
+
+def _num_raw_data_modules(version: int) -> int:
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        num_align = version // 7 + 2
+        result -= (25 * num_align - 10) * num_align - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+def _num_data_codewords(version: int) -> int:
+    return (_num_raw_data_modules(version) // 8
+            - ECC_CODEWORDS_PER_BLOCK[version] * NUM_ERROR_CORRECTION_BLOCKS[version])
+
+class QRCode:
+    """Матрица QR-кода для строки байтов"""
+
+    def __init__(self, data: bytes, mask: Optional[int] = None):
+        self.version = self._choose_version(len(data))
+        self.size = self.version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self._is_function = [[False] * self.size for _ in range(self.size)]
+
+        self._draw_function_patterns()
+        self._draw_codewords(self._add_ecc_and_interleave(self._encode_data(data)))
+
+        if mask is None:
+            # Выбираем маску с наименьшим штрафом
+            best_penalty = None
+            for candidate in range(8):
+                self._apply_mask(candidate)
+                self._draw_format_bits(candidate)
+                penalty = self._penalty_score()
+                if best_penalty is None or penalty < best_penalty:
+                    mask, best_penalty = candidate, penalty
+                self._apply_mask(candidate)  # XOR обратим — возвращаем как было
+        self.mask = mask
+        self._apply_mask(mask)
+        self._draw_format_bits(mask)
+
+    @staticmethod
+    def _choose_version(length: int) -> int:
+        for version in range(1, MAX_VERSION + 1):
+            count_bits = 8 if version <= 9 else 16
+            if 4 + count_bits + length * 8 <= _num_data_codewords(version) * 8:
+                return version
+        raise ValueError(f"Слишком длинные данные для QR-кода: {length} байт")
+
+    # --- Кодирование данных ---
+    def _encode_data(self, data: bytes) -> List[int]:
+        bits = []
+
+        def append(value: int, length: int):
+            bits.extend((value >> i) & 1 for i in reversed(range(length)))
+
+        append(0b0100, 4)  # Байтовый режим
+        append(len(data), 8 if self.version <= 9 else 16)
+        for b in data:
+            append(b, 8)
+
+        capacity = _num_data_codewords(self.version) * 8
+        append(0, min(4, capacity - len(bits)))
+        append(0, -len(bits) % 8)
+        pad = 0xEC
+        while len(bits) < capacity:
+            append(pad, 8)
+            pad ^= 0xEC ^ 0x11
+
+        return [int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8)]
+
+    def _add_ecc_and_interleave(self, data: List[int]) -> List[int]:
+        num_blocks = NUM_ERROR_CORRECTION_BLOCKS[self.version]
+        block_ecc_len = ECC_CODEWORDS_PER_BLOCK[self.version]
+        raw_codewords = _num_raw_data_modules(self.version) // 8
+        num_short_blocks = num_blocks - raw_codewords % num_blocks
+        short_block_len = raw_codewords // num_blocks
+
+        divisor = _rs_divisor(block_ecc_len)
+        blocks = []
+        k = 0
+        for i in range(num_blocks):
+            length = short_block_len - block_ecc_len + (0 if i < num_short_blocks else 1)
+            block = data[k:k + length]
+            k += length
+            ecc = _rs_remainder(block, divisor)
+            if i < num_short_blocks:
+                block.append(0)
+            blocks.append(block + ecc)
+
+        result = []
+        for i in range(len(blocks[0])):
+            for j, block in enumerate(blocks):
+                # Пропускаем выравнивающий байт коротких блоков
+                if i != short_block_len - block_ecc_len or j >= num_short_blocks:
+                    result.append(block[i])
+        return result
+
+    # --- Служебные узоры ---
+    def _set_function(self, x: int, y: int, dark: bool):
+        self.modules[y][x] = dark
+        self._is_function[y][x] = True
+
+    def _alignment_positions(self) -> List[int]:
+        if self.version == 1:
+            return []
+        num_align = self.version // 7 + 2
+        step = (self.version * 8 + num_align * 3 + 5) // (num_align * 4 - 4) * 2
+        result = [self.size - 7 - i * step for i in range(num_align - 1)] + [6]
+        return list(reversed(result))
+
+    def _draw_function_patterns(self):
+        for i in range(self.size):
+            self._set_function(6, i, i % 2 == 0)
+            self._set_function(i, 6, i % 2 == 0)
+
+        for x, y in ((3, 3), (self.size - 4, 3), (3, self.size - 4)):
+            self._draw_finder(x, y)
+
+        positions = self._alignment_positions()
+        last = len(positions) - 1
+        for i, x in enumerate(positions):
+            for j, y in enumerate(positions):
+                if (i, j) not in ((0, 0), (0, last), (last, 0)):
+                    self._draw_alignment(x, y)
+
+        self._draw_format_bits(0)  # Резервируем место, настоящие биты — после выбора маски
+        self._draw_version()
+
+    def _draw_finder(self, x: int, y: int):
+        for dy in range(-4, 5):
+            for dx in range(-4, 5):
+                xx, yy = x + dx, y + dy
+                if 0 <= xx < self.size and 0 <= yy < self.size:
+                    self._set_function(xx, yy, max(abs(dx), abs(dy)) not in (2, 4))
+
+    def _draw_alignment(self, x: int, y: int):
+        for dy in range(-2, 3):
+            for dx in range(-2, 3):
+                self._set_function(x + dx, y + dy, max(abs(dx), abs(dy)) != 1)
+
+    def _draw_format_bits(self, mask: int):
+        data = FORMAT_BITS_M << 3 | mask
+        rem = data
+        for _ in range(10):
+            rem = (rem << 1) ^ ((rem >> 9) * 0x537)
+        bits = (data << 10 | rem) ^ 0x5412
+
+        for i in range(0, 6):
+            self._set_function(8, i, _get_bit(bits, i))
+        self._set_function(8, 7, _get_bit(bits, 6))
+        self._set_function(8, 8, _get_bit(bits, 7))
+        self._set_function(7, 8, _get_bit(bits, 8))
+        for i in range(9, 15):
+            self._set_function(14 - i, 8, _get_bit(bits, i))
+
+        for i in range(0, 8):
+            self._set_function(self.size - 1 - i, 8, _get_bit(bits, i))
+        for i in range(8, 15):
+            self._set_function(8, self.size - 15 + i, _get_bit(bits, i))
+        self._set_function(8, self.size - 8, True)  # Всегда тёмный модуль
+
+    def _draw_version(self):
+        if self.version < 7:
+            return
+        rem = self.version
+        for _ in range(12):
+            rem = (rem << 1) ^ ((rem >> 11) * 0x1F25)
+        bits = self.version << 12 | rem
+        for i in range(18):
+            bit = _get_bit(bits, i)
+            a, b = self.size - 11 + i % 3, i // 3
+            self._set_function(a, b, bit)
+            self._set_function(b, a, bit)
+
+    # --- Размещение данных и маска ---
+    def _draw_codewords(self, data: List[int]):
+        i = 0
+        right = self.size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            for vert in range(self.size):
+                for j in range(2):
+                    x = right - j
+                    upward = (right + 1) & 2 == 0
+                    y = self.size - 1 - vert if upward else vert
+                    if not self._is_function[y][x] and i < len(data) * 8:
+                        self.modules[y][x] = _get_bit(data[i >> 3], 7 - (i & 7))
+                        i += 1
+            right -= 2
+
+    def _apply_mask(self, mask: int):
+        condition = (
+            lambda x, y: (x + y) % 2 == 0,
+            lambda x, y: y % 2 == 0,
+            lambda x, y: x % 3 == 0,
+            lambda x, y: (x + y) % 3 == 0,
+            lambda x, y: (x // 3 + y // 2) % 2 == 0,
+            lambda x, y: x * y % 2 + x * y % 3 == 0,
+            lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+            lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+        )[mask]
+        for y in range(self.size):
+            row = self.modules[y]
+            is_function = self._is_function[y]
+            for x in range(self.size):
+                if not is_function[x] and condition(x, y):
+                    row[x] = not row[x]
+
+    def _penalty_score(self) -> int:
+        """Упрощённая оценка по правилам стандарта (серии, блоки 2×2, узоры искателя, баланс)"""
+        size = self.size
+        modules = self.modules
+        columns = [[modules[y][x] for y in range(size)] for x in range(size)]
+        result = 0
+
+        finder_like = ([True, False, True, True, True, False, True, False, False, False, False],
+                       [False, False, False, False, True, False, True, True, True, False, True])
+        for line in modules + columns:
+            run = 1
+            for i in range(1, size):
+                if line[i] == line[i - 1]:
+                    run += 1
+                else:
+                    if run >= 5:
+                        result += run - 2
+                    run = 1
+            if run >= 5:
+                result += run - 2
+            for i in range(size - 10):
+                if line[i:i + 11] in finder_like:
+                    result += 40
+
+        for y in range(size - 1):
+            for x in range(size - 1):
+                color = modules[y][x]
+                if color == modules[y][x + 1] == modules[y + 1][x] == modules[y + 1][x + 1]:
+                    result += 3
+
+        dark = sum(sum(row) for row in modules)
+        total = size * size
+        result += ((abs(dark * 20 - total * 10) + total - 1) // total - 1) * 10
+        return result
+
+def render_png(text: str) -> bytes:
+    """Строит QR-код для текста (UTF-8) и возвращает PNG в оттенках серого"""
+    qr = QRCode(text.encode('utf-8'))
+    modules = qr.size + QUIET_ZONE * 2
+    width = modules * MODULE_PIXELS
+
+    raw = bytearray()
+    for my in range(modules):
+        y = my - QUIET_ZONE
+        row = bytearray([0])  # Фильтр PNG: None
+        for mx in range(modules):
+            x = mx - QUIET_ZONE
+            dark = 0 <= x < qr.size and 0 <= y < qr.size and qr.modules[y][x]
+            row.extend((0 if dark else 255,) * MODULE_PIXELS)
+        for _ in range(MODULE_PIXELS):
+            raw.extend(row)
+
+    def chunk(tag: bytes, body: bytes) -> bytes:
+        return struct.pack('>I', len(body)) + tag + body + struct.pack('>I', zlib.crc32(tag + body) & 0xFFFFFFFF)
+
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, width, 8, 0, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(bytes(raw), 9))
+        + chunk(b'IEND', b'')
+    )
+
+class QRImageCache:
+    """LRU-кэш готовых PNG, ограниченный суммарным размером в байтах"""
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> bytes:
+        """Возвращает PNG для кода верификации, генерируя его при промахе"""
+        with self._lock:
+            png = self._images.get(token)
+            if png is not None:
+                self._images.move_to_end(token)
+                self.hits += 1
+                return png
+
+        png = render_png(f"Ваш код: {token}")
+        with self._lock:
+            self.misses += 1
+            if token not in self._images:
+                self._images[token] = png
+                self._size += len(png)
+            while self._size > self.max_bytes and len(self._images) > 1:
+                _, evicted = self._images.popitem(last=False)
+                self._size -= len(evicted)
+        return png
+
+    def discard(self, token: str):
+        with self._lock:
+            png = self._images.pop(token, None)
+            if png is not None:
+                self._size -= len(png)
+
+# --- Общий кэш для модуля верификации ---
+qr_cache = QRImageCache()
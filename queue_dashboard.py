@@ -0,0 +1,294 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import discord
+from discord.ui import View, Button, Modal, TextInput, button
+
+from config_store import get_guild_config
+from manual_queue import ManualRequest, STATUS_LEFT
+from member_cache import resolve_member
+
+PAGE_SIZE = 10              # Заявок на одной странице панели
+BATCH_WORKERS = 4           # Параллельных обработчиков массового действия
+PROGRESS_INTERVAL = 2.0     # Как часто (секунды) обновлять сообщение с прогрессом
+DASHBOARD_TIMEOUT = 900     # Время жизни кнопок панели (секунды)
+RISK_HIGH = 60              # Оценка риска, с которой заявка помечается красным
+RISK_MEDIUM = 30            # ... и жёлтым
+
+def risk_mark(score: float) -> str:
+    if score >= RISK_HIGH:
+        return "🔴"
+    if score >= RISK_MEDIUM:
+        return "🟡"
+    return "🟢"
+
+class BatchProgress:
+    """Счётчики массовой операции"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    @property
+    def finished(self) -> int:
+        return self.done + self.skipped + self.failed
+
+    def line(self, title: str) -> str:
+        elapsed = time.monotonic() - self.started
+        return (f"{title}: {self.finished}/{self.total} "
+                f"(выполнено {self.done}, пропущено {self.skipped}, ошибок {self.failed}, {elapsed:.0f} с)")
+
+async def run_batch(requests: List[ManualRequest], action: Callable[[ManualRequest], Awaitable[bool]],
+                    progress: BatchProgress, report: Callable[[], Awaitable[None]],
+                    workers: int = BATCH_WORKERS):
+    """
+    Выполняет action для каждой заявки пулом воркеров.
+
+    Лимиты Discord API соблюдает сам action (через RouteLimiter), здесь же —
+    только параллелизм и периодический вызов report с текущим прогрессом.
+    action возвращает True (выполнено) или False (пропущено).
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    async def worker():
+        while not queue.empty():
+            request = queue.get_nowait()
+            try:
+                if await action(request):
+                    progress.done += 1
+                else:
+                    progress.skipped += 1
+            except Exception as e:
+                progress.failed += 1
+                print(f"Ошибка при обработке заявки {request.user_id}: {e}")
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            try:
+                await report()
+            except discord.HTTPException as e:
+                print(f"Не удалось обновить прогресс: {e}")
+
+    reporter_task = asyncio.create_task(reporter())
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(workers, len(requests))))))
+    finally:
+        reporter_task.cancel()
+        await asyncio.gather(reporter_task, return_exceptions=True)
+    await report()
+
+class DenyYoungModal(Modal, title="Отклонить молодые аккаунты"):
+    days = TextInput(label="Возраст аккаунта меньше (дней)", default="7", max_length=4)
+
+    def __init__(self, dashboard: "QueueDashboardView"):
+        super().__init__()
+        self.dashboard = dashboard
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            days = int(self.days.value)
+        except ValueError:
+            await interaction.response.send_message("❌ Укажите число дней.", ephemeral=True)
+            return
+        if days <= 0:
+            await interaction.response.send_message("❌ Число дней должно быть больше нуля.", ephemeral=True)
+            return
+
+        cutoff = time.time() - days * 86400
+        requests = [request for request in self.dashboard.store.pending(self.dashboard.guild.id)
+                    if request.account_created_at > cutoff]
+        await self.dashboard.run(interaction, requests, approve=False,
+                                 title=f"Отклонение аккаунтов моложе {days} дн.")
+
+class QueueDashboardView(View):
+    """
+    Панель очереди ручной верификации: постраничный список ожидающих заявок
+    и массовые действия над ними.
+    """
+
+    def __init__(self, cog, guild: discord.Guild):
+        super().__init__(timeout=DASHBOARD_TIMEOUT)
+        self.cog = cog
+        self.store = cog.manual_requests
+        self.guild = guild
+        self.page = 0
+        self.busy = False
+        self.message: Optional[discord.Message] = None
+        # Заявки последней показанной страницы: (guild_id, user_id, created_at).
+        # Кнопки «…страницу» действуют только на них, даже если очередь успела измениться
+        self.shown: List[Tuple[int, int, float]] = []
+        # Порядок очереди по риску на момент последнего обновления панели: при листании
+        # он не пересчитывается, иначе новые входы перемешивали бы страницы
+        self._ranking: List[Tuple[float, ManualRequest]] = []
+
+    async def update_ranking(self):
+        """Пересчитывает порядок очереди (оценка идёт в потоке, вне event loop)"""
+        self._ranking = await self.store.ranked(self.guild.id, self.cog.stats_version(self.guild.id))
+
+    def current_page(self):
+        """Заявки текущей страницы (самые рискованные — на первых страницах) и общее число страниц"""
+        requests, total, pages = self._page()
+        return [request for _, request in requests], total, pages
+
+    def _page(self):
+        # Обработанные после расчёта порядка заявки пропускаются
+        ranked = [(score, request) for score, request in self._ranking
+                  if self.store.get(request.guild_id, request.user_id) is request]
+        pages = max(1, (len(ranked) + PAGE_SIZE - 1) // PAGE_SIZE)
+        self.page = min(self.page, pages - 1)
+        start = self.page * PAGE_SIZE
+        return ranked[start:start + PAGE_SIZE], len(ranked), pages
+
+    def render(self) -> discord.Embed:
+        """Панель текущей страницы в порядке последнего update_ranking()"""
+        requests, total, pages = self._page()
+        now = time.time()
+        lines = []
+        self.shown = [(request.guild_id, request.user_id, request.created_at) for _, request in requests]
+        for number, (score, request) in enumerate(requests, start=self.page * PAGE_SIZE + 1):
+            age_days = int((now - request.account_created_at) // 86400)
+            waiting_minutes = int((now - request.created_at) // 60)
+            lines.append(f"`{number}.` {risk_mark(score)} **{score:.0f}** <@{request.user_id}> ({request.username}) — "
+                         f"аккаунту {age_days} дн., ждёт {waiting_minutes} мин.")
+
+        embed = discord.Embed(
+            title=f"🗂️ Очередь ручной верификации: {total}",
+            description="\n".join(lines) if lines else "Очередь пуста.",
+            color=discord.Color.orange() if total else discord.Color.green(),
+            timestamp=datetime.now()
+        )
+        embed.set_footer(text=f"Страница {self.page + 1}/{pages} · по убыванию риска")
+        return embed
+
+    def shown_requests(self) -> List[ManualRequest]:
+        """Заявки показанной страницы, которые всё ещё ожидают решения"""
+        requests = []
+        for guild_id, user_id, created_at in self.shown:
+            request = self.store.get(guild_id, user_id)
+            # Повторный вход создаёт новую заявку — её модератор ещё не видел
+            if request is not None and request.created_at == created_at:
+                requests.append(request)
+        return requests
+
+    async def refresh(self):
+        if self.message is not None:
+            await self.update_ranking()
+            await self.message.edit(embed=self.render(), view=self)
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    # --- Действия над одной заявкой ---
+    async def _approve(self, request: ManualRequest, roles, moderator, level: int) -> bool:
+        if not self.store.claim(request):
+            return False
+        try:
+            await self.cog.limiter.acquire("roles", self.guild.id)
+            member = await resolve_member(self.guild, request.user_id)
+            if member is None:
+                self.store.resolve(request, STATUS_LEFT)
+                return False
+            await self.cog.approve_member(member, *roles, moderator, level, request)
+            return True
+        finally:
+            self.store.release(request)
+
+    async def _deny(self, request: ManualRequest, moderator, level: int) -> bool:
+        if not self.store.claim(request):
+            return False
+        try:
+            await self.cog.limiter.acquire("kick", self.guild.id)
+            member = await resolve_member(self.guild, request.user_id)
+            if member is None:
+                self.store.resolve(request, STATUS_LEFT)
+                return False
+            await self.cog.deny_member(member, moderator, level, request)
+            return True
+        finally:
+            self.store.release(request)
+
+    async def run(self, interaction: discord.Interaction, requests: List[ManualRequest],
+                  approve: bool, title: str):
+        """Запускает массовое действие и показывает его прогресс"""
+        permissions = interaction.user.guild_permissions
+        if not (permissions.manage_roles if approve else permissions.kick_members):
+            await interaction.response.send_message("❌ У вас недостаточно прав для выполнения этого действия.", ephemeral=True)
+            return
+        if self.busy:
+            await interaction.response.send_message("⏳ Предыдущее действие ещё выполняется.", ephemeral=True)
+            return
+        if not requests:
+            await interaction.response.send_message("ℹ️ Нет подходящих заявок.", ephemeral=True)
+            return
+
+        config = get_guild_config(self.guild.id)
+        level = config.verification_level if config else 3
+        roles = None
+        if approve:
+            roles = (self.guild.get_role(config.verified_role_id) if config else None,
+                     self.guild.get_role(config.unverified_role_id) if config else None)
+            if not all(roles):
+                await interaction.response.send_message("❌ Ошибка: Роли не найдены. Проверьте настройки сервера (`!setup`).", ephemeral=True)
+                return
+
+        self.busy = True
+        moderator = interaction.user
+        progress = BatchProgress(len(requests))
+        await interaction.response.send_message(progress.line(title))
+
+        async def action(request):
+            if approve:
+                return await self._approve(request, roles, moderator, level)
+            return await self._deny(request, moderator, level)
+
+        async def report():
+            await interaction.edit_original_response(content=progress.line(title))
+
+        try:
+            await run_batch(requests, action, progress, report)
+        finally:
+            self.busy = False
+            await self.refresh()
+
+    # --- Кнопки панели ---
+    @button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: Button):
+        self.page = max(0, self.page - 1)
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: Button):
+        self.page += 1
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @button(label="🔄", style=discord.ButtonStyle.secondary)
+    async def rerank(self, interaction: discord.Interaction, button: Button):
+        await self.update_ranking()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @button(label="Одобрить страницу", style=discord.ButtonStyle.green)
+    async def approve_page(self, interaction: discord.Interaction, button: Button):
+        await self.run(interaction, self.shown_requests(), approve=True, title="Одобрение страницы")
+
+    @button(label="Отклонить страницу", style=discord.ButtonStyle.red)
+    async def deny_page(self, interaction: discord.Interaction, button: Button):
+        await self.run(interaction, self.shown_requests(), approve=False, title="Отклонение страницы")
+
+    @button(label="Отклонить молодые аккаунты", style=discord.ButtonStyle.red)
+    async def deny_young(self, interaction: discord.Interaction, button: Button):
+        if not interaction.user.guild_permissions.kick_members:
+            await interaction.response.send_message("❌ У вас недостаточно прав для выполнения этого действия.", ephemeral=True)
+            return
+        await interaction.response.send_modal(DenyYoungModal(self))
@@ -0,0 +1,196 @@
+"""
+Обнаружение рейдов по потоку входов
+Для каждого сервера хранится скользящее окно последних входов (не дольше
+RAID_WINDOW_SECONDS и не больше WINDOW_MAX_JOINS записей) со счётчиками,
+которые обновляются при добавлении и вытеснении записи. Память — O(окна),
+проверка очередного входа не перебирает историю.
+
+Признаки рейда в окне:
+- частота входов;
+- доля молодых аккаунтов (моложе RAID_YOUNG_DAYS дней);
+- доля аккаунтов без аватара;
+- группа похожих имён (одинаковый «скелет» имени без цифр и знаков).
+"""
+
+import re
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, NamedTuple, Optional
+
+RAID_ACTIONS = ("level3", "pause_dm", "alert", "off")
+WINDOW_MAX_JOINS = 1000     # Предел записей в окне одного сервера, даже при очень сильном рейде
+NAME_MIN = 3                # Короче — имя не участвует в поиске похожих
+NAME_PREFIX = 6             # Сколько первых букв скелета сравнивается ("raider01", "raiderX" → "raider")
+
+_NAME_NOISE = re.compile(r'[\W\d_]+')
+
+def name_key(username: str) -> str:
+    """Скелет имени: без регистра, цифр и знаков; пустая строка — имя слишком короткое"""
+    key = _NAME_NOISE.sub('', username.casefold())
+    return key[:NAME_PREFIX] if len(key) >= NAME_MIN else ""
+
+def account_age_days(created_at: datetime, now: Optional[datetime] = None) -> float:
+    now = now or datetime.now(timezone.utc)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return (now - created_at).total_seconds() / 86400
+
+class JoinSample(NamedTuple):
+    at: float
+    young: bool
+    no_avatar: bool
+    name: str
+
+@dataclass(frozen=True)
+class RaidThresholds:
+    """Пороги срабатывания (RAID_* в config.json)"""
+    window: float = 60.0          # Длина окна, секунд
+    min_joins: int = 10           # С какого числа входов в окне проверяются доли и имена
+    burst_joins: int = 30         # Столько входов в окне — рейд независимо от признаков
+    young_days: float = 7.0
+    young_share: float = 0.6
+    no_avatar_share: float = 0.8
+    name_cluster: int = 5         # Столько входов с одинаковым скелетом имени
+
+    @classmethod
+    def from_config(cls, config) -> "RaidThresholds":
+        return cls(
+            window=config.raid_window_seconds,
+            min_joins=config.raid_min_joins,
+            burst_joins=config.raid_burst_joins,
+            young_days=config.raid_young_days,
+            young_share=config.raid_young_share,
+            no_avatar_share=config.raid_no_avatar_share,
+            name_cluster=config.raid_name_cluster,
+        )
+
+class WindowStats(NamedTuple):
+    joins: int
+    young: int
+    no_avatar: int
+    cluster: int          # Размер самой большой группы похожих имён
+    cluster_name: str
+
+    def share(self, count: int) -> float:
+        return count / self.joins if self.joins else 0.0
+
+class JoinWindow:
+    """Входы одного сервера за последние window секунд"""
+
+    def __init__(self):
+        self.samples: Deque[JoinSample] = deque()
+        self.young = 0
+        self.no_avatar = 0
+        self.names: Counter = Counter()
+
+    def add(self, sample: JoinSample):
+        self.samples.append(sample)
+        self.young += sample.young
+        self.no_avatar += sample.no_avatar
+        if sample.name:
+            self.names[sample.name] += 1
+        if len(self.samples) > WINDOW_MAX_JOINS:
+            self._pop()
+
+    def expire(self, now: float, window: float):
+        while self.samples and now - self.samples[0].at > window:
+            self._pop()
+
+    def _pop(self):
+        sample = self.samples.popleft()
+        self.young -= sample.young
+        self.no_avatar -= sample.no_avatar
+        if sample.name:
+            count = self.names[sample.name] - 1
+            if count:
+                self.names[sample.name] = count
+            else:
+                del self.names[sample.name]
+
+    def stats(self) -> WindowStats:
+        cluster_name, cluster = max(self.names.items(), key=lambda item: item[1], default=("", 0))
+        return WindowStats(len(self.samples), self.young, self.no_avatar, cluster, cluster_name)
+
+class RaidState(NamedTuple):
+    action: str
+    started: float
+    last_trip: float
+    previous_level: Optional[int]   # Уровень до переключения на 3 (для восстановления)
+
+def raid_reasons(stats: WindowStats, thresholds: RaidThresholds) -> List[str]:
+    """Сработавшие признаки рейда; пустой список — окно выглядит обычно"""
+    reasons = []
+    if stats.joins >= thresholds.burst_joins:
+        reasons.append(f"{stats.joins} входов за {thresholds.window:g} с")
+    if stats.joins < thresholds.min_joins:
+        return reasons
+    if stats.share(stats.young) >= thresholds.young_share:
+        reasons.append(f"аккаунты моложе {thresholds.young_days:g} дн.: {stats.share(stats.young):.0%}")
+    if stats.share(stats.no_avatar) >= thresholds.no_avatar_share:
+        reasons.append(f"без аватара: {stats.share(stats.no_avatar):.0%}")
+    if stats.cluster >= thresholds.name_cluster:
+        reasons.append(f"похожие имена «{stats.cluster_name}…»: {stats.cluster}")
+    return reasons
+
+class RaidDetector:
+    """
+    Скользящие окна входов по серверам и состояние режима рейда.
+
+    Решения (что делать при срабатывании) принимает вызывающий код:
+    observe() только сообщает, какие признаки сработали.
+    """
+
+    def __init__(self):
+        self._windows: Dict[int, JoinWindow] = {}
+        self.active: Dict[int, RaidState] = {}
+
+    def observe(self, guild_id: int, created_at: datetime, has_avatar: bool, username: str,
+                thresholds: RaidThresholds, now: Optional[float] = None) -> List[str]:
+        """Добавляет вход в окно сервера и возвращает сработавшие признаки"""
+        now = now if now is not None else time.monotonic()
+        window = self._windows.get(guild_id)
+        if window is None:
+            window = self._windows[guild_id] = JoinWindow()
+        window.expire(now, thresholds.window)
+        window.add(JoinSample(now, account_age_days(created_at) < thresholds.young_days,
+                              not has_avatar, name_key(username)))
+        return raid_reasons(window.stats(), thresholds)
+
+    def stats(self, guild_id: int, thresholds: RaidThresholds, now: Optional[float] = None) -> WindowStats:
+        window = self._windows.get(guild_id)
+        if window is None:
+            return WindowStats(0, 0, 0, 0, "")
+        window.expire(now if now is not None else time.monotonic(), thresholds.window)
+        return window.stats()
+
+    def trip(self, guild_id: int, action: str, previous_level: Optional[int] = None,
+             now: Optional[float] = None) -> bool:
+        """Отмечает срабатывание; True — режим рейда только что включён"""
+        now = now if now is not None else time.monotonic()
+        state = self.active.get(guild_id)
+        if state is not None:
+            self.active[guild_id] = state._replace(last_trip=now)
+            return False
+        self.active[guild_id] = RaidState(action, now, now, previous_level)
+        return True
+
+    def expired(self, cooldown: float, thresholds: RaidThresholds, now: Optional[float] = None) -> List[int]:
+        """
+        Серверы, где признаки не срабатывали cooldown секунд: режим рейда снимается.
+        Заодно удаляются опустевшие окна, чтобы не держать память под тихие серверы.
+        """
+        now = now if now is not None else time.monotonic()
+        for guild_id, window in list(self._windows.items()):
+            window.expire(now, thresholds.window)
+            if not window.samples:
+                del self._windows[guild_id]
+        return [guild_id for guild_id, state in self.active.items() if now - state.last_trip >= cooldown]
+
+    def end(self, guild_id: int) -> Optional[RaidState]:
+        return self.active.pop(guild_id, None)
+
+    def dm_paused(self, guild_id: int) -> bool:
+        state = self.active.get(guild_id)
+        return state is not None and state.action == "pause_dm"
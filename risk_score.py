@@ -0,0 +1,77 @@
+"""
+Оценка риска заявок на ручную верификацию
+Заявки оцениваются пачкой: признаки считаются по столбцам (array), а не
+по одному участнику, и попытки верификации всей пачки читаются из БД
+одним запросом на каждые SQL_CHUNK участников.
+
+Признаки (каждый приводится к 0..1, оценка — взвешенная сумма, 0..100):
+- возраст аккаунта: новый — 1, старше AGE_SCALE_DAYS дней — 0;
+- вход в составе всплеска: сколько ещё заявок поступило в пределах BURST_WINDOW секунд;
+- энтропия имени: случайные имена вида "xk29fq8z" выше обычных;
+- неудачные попытки верификации из verification_attempts.
+"""
+
+import math
+import sqlite3
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Dict, Iterable, Optional, Sequence
+
+AGE_SCALE_DAYS = 30.0       # С какого возраста аккаунт перестаёт добавлять риск
+BURST_WINDOW = 60.0         # Окно (секунды) вокруг заявки для поиска всплеска входов
+BURST_SCALE = 10            # Столько соседних заявок в окне — максимальный вклад всплеска
+ENTROPY_LOW = 2.5           # Энтропия имени (бит на символ), ниже которой риска нет
+ENTROPY_HIGH = 3.5          # ... и выше которой вклад максимален
+ATTEMPTS_SCALE = 3          # Столько неудачных попыток — максимальный вклад
+SQL_CHUNK = 500             # Участников в одном запросе (предел параметров SQLite — 999)
+
+# Вес признаков в итоговой оценке
+WEIGHTS = {"age": 0.4, "burst": 0.25, "attempts": 0.2, "entropy": 0.15}
+
+def username_entropy(username: str) -> float:
+    """Энтропия Шеннона символов имени, бит на символ"""
+    if not username:
+        return 0.0
+    length = len(username)
+    return -sum(count / length * math.log2(count / length) for count in Counter(username.casefold()).values())
+
+def _clamp(values: Iterable[float]) -> array:
+    return array('d', (0.0 if value < 0 else 1.0 if value > 1 else value for value in values))
+
+def burst_sizes(times: Sequence[float], window: float = BURST_WINDOW) -> array:
+    """Для каждой заявки — сколько других заявок поступило в пределах ±window секунд"""
+    ordered = sorted(times)
+    return array('l', (bisect_right(ordered, at + window) - bisect_left(ordered, at - window) - 1
+                       for at in times))
+
+def fetch_failed_attempts(conn: sqlite3.Connection, guild_id: int, user_ids: Sequence[int]) -> Dict[int, int]:
+    """Число неудачных попыток верификации по участникам (без участников без попыток)"""
+    attempts: Dict[int, int] = {}
+    for start in range(0, len(user_ids), SQL_CHUNK):
+        chunk = user_ids[start:start + SQL_CHUNK]
+        rows = conn.execute(
+            f'SELECT user_id, COUNT(*) FROM verification_attempts '
+            f'WHERE guild_id = ? AND user_id IN ({", ".join("?" * len(chunk))}) AND success = 0 '
+            f'GROUP BY user_id',
+            (guild_id, *chunk)
+        ).fetchall()
+        attempts.update(rows)
+    return attempts
+
+def score_batch(account_created: Sequence[float], requested: Sequence[float], usernames: Sequence[str],
+                attempts: Sequence[int], now: Optional[float] = None) -> array:
+    """
+    Оценки риска 0..100 для пачки заявок.
+    Аргументы — столбцы одинаковой длины: время создания аккаунта и заявки (unix),
+    имя и число неудачных попыток.
+    """
+    now = now if now is not None else time.time()
+    age = _clamp(1 - (now - created) / 86400 / AGE_SCALE_DAYS for created in account_created)
+    burst = _clamp(size / BURST_SCALE for size in burst_sizes(requested))
+    entropy = _clamp((username_entropy(name) - ENTROPY_LOW) / (ENTROPY_HIGH - ENTROPY_LOW) for name in usernames)
+    failed = _clamp(count / ATTEMPTS_SCALE for count in attempts)
+    return array('d', (100 * (WEIGHTS["age"] * a + WEIGHTS["burst"] * b +
+                              WEIGHTS["attempts"] * f + WEIGHTS["entropy"] * e)
+                       for a, b, f, e in zip(age, burst, failed, entropy)))
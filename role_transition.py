@@ -0,0 +1,49 @@
+import asyncio
+import time
+from typing import Iterable, Optional
+
+import discord
+
+from perf_metrics import discord_request, metrics
+
+MAX_RETRIES = 3          # Повторы при ответе 429
+BASE_BACKOFF = 0.5       # Начальная пауза перед повтором (секунды)
+
+async def transition_roles(member: discord.Member, add: Iterable[discord.Role] = (),
+                           remove: Iterable[discord.Role] = (), reason: Optional[str] = None):
+    """
+    Переводит участника в итоговый набор ролей одним запросом (member.edit).
+
+    Итоговый набор = текущие роли − remove + add, поэтому участник никогда
+    не остаётся одновременно с обеими ролями верификации. При 429 запрос
+    повторяется с экспоненциальной паузой. Остальные ошибки (и 429 после
+    исчерпания повторов) пробрасываются вызывающему коду, как раньше при
+    add_roles/remove_roles.
+    """
+    add = list(add)
+    remove_ids = {role.id for role in remove}
+    roles = [role for role in member.roles if not role.is_default() and role.id not in remove_ids]
+    current_ids = {role.id for role in roles}
+    roles.extend(role for role in add if role.id not in current_ids)
+
+    started = time.monotonic()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with discord_request("role_edit"):
+                await member.edit(roles=roles, reason=reason)
+            break
+        except discord.RateLimited as e:
+            if attempt == MAX_RETRIES:
+                metrics.observe("glistbot_role_transition_seconds", time.monotonic() - started, result="error")
+                raise
+            delay = e.retry_after
+        except discord.HTTPException as e:
+            if e.status != 429 or attempt == MAX_RETRIES:
+                metrics.observe("glistbot_role_transition_seconds", time.monotonic() - started, result="error")
+                raise
+            delay = BASE_BACKOFF * 2 ** attempt
+        metrics.inc("glistbot_role_transition_retries_total")
+        await asyncio.sleep(delay)
+
+    # Время смены ролей целиком, вместе с паузами между повторами
+    metrics.observe("glistbot_role_transition_seconds", time.monotonic() - started, result="ok")
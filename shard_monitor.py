@@ -0,0 +1,193 @@
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import discord
+from discord.ext import commands, tasks
+
+RATE_WINDOW = 60  # За сколько последних секунд считается частота событий
+
+def parse_shard_ids(value: str) -> List[int]:
+    """Разбирает список шардов вида "0,1,2" или диапазон "0-3" (можно смешивать)"""
+    shard_ids = []
+    for part in value.replace(' ', '').split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            shard_ids.extend(range(int(first), int(last) + 1))
+        else:
+            shard_ids.append(int(part))
+    return sorted(set(shard_ids))
+
+def sharding_from_env() -> Optional[Dict[str, object]]:
+    """
+    Параметры шардинга из переменных окружения или None, если он выключен.
+
+    SHARDING=auto — AutoShardedBot сам выбирает число шардов.
+    SHARD_COUNT — явное число шардов.
+
+    Все шарды обслуживает один процесс. Разнести бота на несколько процессов
+    нельзя: ЛС (!code, !resendcode) приходят только на шард 0, коды верификации
+    и заявки хранятся в памяти процесса, а bot.get_guild() не видит серверы
+    чужих шардов. Поэтому SHARD_IDS, если указан, должен покрывать все шарды.
+    """
+    mode = os.getenv("SHARDING", "").strip().lower()
+    shard_count = os.getenv("SHARD_COUNT", "").strip()
+    shard_ids = os.getenv("SHARD_IDS", "").strip()
+    if mode in ("", "0", "off", "false", "no") and not shard_count:
+        return None
+
+    options: Dict[str, object] = {}
+    if shard_count:
+        options["shard_count"] = int(shard_count)
+        if shard_ids:
+            options["shard_ids"] = parse_shard_ids(shard_ids)
+            bad = [shard_id for shard_id in options["shard_ids"] if shard_id >= options["shard_count"]]
+            if bad:
+                raise ValueError(f"SHARD_IDS {bad} выходят за пределы SHARD_COUNT={shard_count}")
+            missing = sorted(set(range(options["shard_count"])) - set(options["shard_ids"]))
+            if missing:
+                raise ValueError(
+                    f"SHARD_IDS не включает шарды {missing}: бот должен обслуживать все шарды одним процессом "
+                    f"(ЛС приходят только на шард 0, коды верификации хранятся в памяти процесса)"
+                )
+    elif shard_ids:
+        raise ValueError("Для SHARD_IDS необходимо указать SHARD_COUNT")
+    return options
+
+class EventRate:
+    """
+    Частота событий одного шарда за последние RATE_WINDOW секунд.
+    Счётчики хранятся по секундам в кольцевом буфере — память не растёт с нагрузкой.
+    """
+
+    def __init__(self, window: int = RATE_WINDOW):
+        self.window = window
+        self.total = 0
+        self._buckets = [0] * window
+        self._seconds = [0] * window
+
+    def hit(self, now: Optional[float] = None):
+        second = int(now if now is not None else time.monotonic())
+        index = second % self.window
+        if self._seconds[index] != second:
+            self._seconds[index] = second
+            self._buckets[index] = 0
+        self._buckets[index] += 1
+        self.total += 1
+
+    def per_second(self, now: Optional[float] = None) -> float:
+        second = int(now if now is not None else time.monotonic())
+        recent = sum(count for count, stamp in zip(self._buckets, self._seconds)
+                     if second - self.window < stamp <= second)
+        return recent / self.window
+
+class ShardMonitorCog(commands.Cog):
+    """
+    Задержка и частота событий по шардам.
+    Работает и без шардинга — тогда весь бот считается шардом 0.
+    """
+
+    def __init__(self, bot, report_minutes: float = 0):
+        self.bot = bot
+        self.rates: Dict[int, EventRate] = {}
+        self.report_minutes = report_minutes
+
+    async def cog_load(self):
+        if self.report_minutes > 0:
+            self.report.change_interval(minutes=self.report_minutes)
+            self.report.start()
+
+    async def cog_unload(self):
+        self.report.cancel()
+
+    def _hit(self, guild: Optional[discord.Guild]):
+        # Личные сообщения Discord всегда доставляет шарду 0
+        shard_id = guild.shard_id if guild is not None else 0
+        rate = self.rates.get(shard_id)
+        if rate is None:
+            rate = self.rates[shard_id] = EventRate()
+        rate.hit()
+
+    def shard_latencies(self) -> List[Tuple[int, float]]:
+        if isinstance(self.bot, commands.AutoShardedBot):
+            return sorted(self.bot.latencies)
+        return [(0, self.bot.latency)]
+
+    def shard_report(self) -> List[str]:
+        """Строка на каждый шард: задержка, события/с, число серверов"""
+        guild_counts: Dict[int, int] = {}
+        for guild in self.bot.guilds:
+            guild_counts[guild.shard_id] = guild_counts.get(guild.shard_id, 0) + 1
+
+        lines = []
+        for shard_id, latency in self.shard_latencies():
+            rate = self.rates.get(shard_id)
+            latency_text = f"{latency * 1000:.0f} мс" if latency == latency and latency != float('inf') else "нет связи"
+            lines.append(
+                f"Шард {shard_id}: задержка {latency_text}, "
+                f"{rate.per_second() if rate else 0:.2f} событий/с "
+                f"(всего {rate.total if rate else 0}), серверов {guild_counts.get(shard_id, 0)}"
+            )
+        return lines
+
+    @tasks.loop(minutes=10)
+    async def report(self):
+        for line in self.shard_report():
+            print(line)
+
+    @report.before_loop
+    async def before_report(self):
+        await self.bot.wait_until_ready()
+
+    # --- Учёт событий по шардам ---
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        self._hit(message.guild)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self._hit(member.guild)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self._hit(member.guild)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        self._hit(after.guild)
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction):
+        self._hit(interaction.guild)
+
+    # --- Состояние шардов ---
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id):
+        print(f"Шард {shard_id} готов.")
+
+    @commands.Cog.listener()
+    async def on_shard_disconnect(self, shard_id):
+        print(f"Шард {shard_id} отключился.")
+
+    @commands.Cog.listener()
+    async def on_shard_resumed(self, shard_id):
+        print(f"Шард {shard_id} восстановил соединение.")
+
+    @commands.command(name='shards')
+    @commands.has_permissions(administrator=True)
+    async def shards(self, ctx):
+        """Задержка и частота событий по каждому шарду"""
+        embed = discord.Embed(
+            title="🛰️ Шарды",
+            description="\n".join(self.shard_report()),
+            color=discord.Color.blurple()
+        )
+        if ctx.guild is not None:
+            embed.set_footer(text=f"Этот сервер обслуживает шард {ctx.guild.shard_id}")
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    report_minutes = float(os.getenv("SHARD_REPORT_MINUTES", "10"))
+    await bot.add_cog(ShardMonitorCog(bot, report_minutes=report_minutes))
@@ -0,0 +1,555 @@
+"""
+Симулятор массового входа (рейда) без подключения к Discord
+Прогоняет VerificationCog и StatsCog на поддельных Member/Guild/Role/Channel.
+Все обращения «к Discord» идут через MockHTTP, который учитывает лимиты
+по маршрутам (как бакеты Discord) и глобальный лимит. Для каждого уровня
+верификации в сервер входит N участников, после чего измеряется задержка
+от входа до получения роли верифицированного и число запросов к API.
+
+Время виртуальное: ожидание лимитов и таймеров не занимает реального времени,
+поэтому рейд в 1000 участников прогоняется за секунды.
+
+Использование: python simulate_raid.py [--members 1000] [--levels 1 2 3] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import selectors
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+GUILD_ID = 900000000000000000
+UNVERIFIED_ROLE_ID = GUILD_ID + 1
+VERIFIED_ROLE_ID = GUILD_ID + 2
+WELCOME_CHANNEL_ID = GUILD_ID + 10
+LOG_CHANNEL_ID = GUILD_ID + 11
+MODERATOR_CHANNEL_ID = GUILD_ID + 12
+BOT_USER_ID = GUILD_ID + 99
+
+# --- Лимиты маршрутов Discord: (запросов, за секунд), ключ бакета ---
+# Discord не публикует точные значения, это приближения по наблюдаемым заголовкам
+# X-RateLimit-*; при необходимости их можно поправить здесь.
+DISCORD_ROUTE_LIMITS: Dict[str, Tuple[int, float]] = {
+    "PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}": (10, 10.0),
+    "PATCH /guilds/{guild_id}/members/{user_id}": (10, 10.0),
+    "DELETE /guilds/{guild_id}/members/{user_id}": (5, 5.0),
+    "GET /guilds/{guild_id}/members/{user_id}": (10, 1.0),
+    "POST /users/@me/channels": (5, 1.0),
+    "POST /channels/{channel_id}/messages": (5, 5.0),
+    "DELETE /channels/{channel_id}/messages/{message_id}": (5, 1.0),
+}
+GLOBAL_LIMIT = (50, 1.0)       # Глобальный лимит бота
+API_LATENCY = 0.08             # Время ответа API (секунды)
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """
+    Цикл событий с виртуальными часами.
+
+    Когда готовых задач нет, цикл не спит до ближайшего таймера, а сразу
+    переводит часы вперёд. Пока работают потоки (run_in_executor), время
+    идёт по-настоящему — иначе часы убегали бы вперёд, пока поток занят.
+    """
+
+    def __init__(self):
+        super().__init__(selectors.DefaultSelector())
+        self._now = time.monotonic()
+        self._threads = 0
+        select = self._selector.select
+
+        def virtual_select(timeout=None):
+            if self._threads or timeout is None:
+                started = time.perf_counter()
+                events = select(timeout)
+                self._now += time.perf_counter() - started
+                return events
+            events = select(0)
+            if not events and timeout > 0:
+                self._now += timeout
+            return events
+
+        self._selector.select = virtual_select
+
+    def time(self) -> float:
+        return self._now
+
+    def call_later(self, delay, callback, *args, context=None):
+        # Ожидание вроде 1e-13 с (остаток ведра токенов) теряется при сложении
+        # с часами, и ждущий крутился бы в цикле, не сдвигая время
+        if delay > 0:
+            delay = max(delay, 1e-6)
+        return super().call_later(delay, callback, *args, context=context)
+
+    def run_in_executor(self, executor, func, *args):
+        future = super().run_in_executor(executor, func, *args)
+        self._threads += 1
+
+        def done(_):
+            self._threads -= 1
+
+        future.add_done_callback(done)
+        return future
+
+class FixedWindow:
+    """Бакет Discord: remaining запросов до момента reset"""
+
+    def __init__(self, limit: int, per: float):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+        self.lock = asyncio.Lock()
+
+class MockHTTP:
+    """
+    Поддельный HTTP-слой Discord.
+
+    Каждый запрос проходит глобальный бакет и бакет маршрута (по серверу или
+    каналу). Как и discord.py, клиент не получает 429, а заранее ждёт сброса
+    бакета, если запросы в нём закончились; такие ожидания считаются отдельно.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[int, float]] = None, latency: float = API_LATENCY):
+        self.limits = dict(limits or DISCORD_ROUTE_LIMITS)
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.waits: Counter = Counter()
+        self.wait_seconds = 0.0
+        self._global = FixedWindow(*GLOBAL_LIMIT)
+        self._buckets: Dict[Tuple[str, object], FixedWindow] = {}
+
+    async def _take(self, bucket: FixedWindow, route: str):
+        async with bucket.lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if now >= bucket.reset_at:
+                bucket.remaining = bucket.limit
+                bucket.reset_at = now + bucket.per
+            if bucket.remaining == 0:
+                delay = bucket.reset_at - now
+                self.waits[route] += 1
+                self.wait_seconds += delay
+                await asyncio.sleep(delay)
+                bucket.remaining = bucket.limit
+                bucket.reset_at = loop.time() + bucket.per
+            bucket.remaining -= 1
+
+    async def request(self, route: str, major: object = None):
+        bucket = self._buckets.get((route, major))
+        if bucket is None:
+            bucket = self._buckets[(route, major)] = FixedWindow(*self.limits.get(route, (50, 1.0)))
+        await self._take(bucket, route)
+        await self._take(self._global, "global")
+        self.calls[route] += 1
+        await asyncio.sleep(self.latency)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+# --- Поддельные объекты Discord ---
+ids = itertools.count(GUILD_ID + 1000)
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str, default: bool = False):
+        self.id = role_id
+        self.name = name
+        self.mention = f"<@&{role_id}>"
+        self._default = default
+
+    def is_default(self) -> bool:
+        return self._default
+
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel", content=None, embeds=(), view=None, author=None):
+        self.id = next(ids)
+        self.channel = channel
+        self.content = content
+        self.embeds = list(embeds)
+        self.view = view
+        self.author = author
+
+    async def delete(self):
+        await self.channel.http.request("DELETE /channels/{channel_id}/messages/{message_id}", self.channel.id)
+
+    async def edit(self, **kwargs):
+        await self.channel.http.request("PATCH /channels/{channel_id}/messages/{message_id}", self.channel.id)
+
+class FakeChannel:
+    def __init__(self, sim: "RaidSimulation", channel_id: int, guild=None, recipient=None):
+        self.sim = sim
+        self.http = sim.http
+        self.id = channel_id
+        self.guild = guild
+        self.recipient = recipient
+        self.mention = f"<#{channel_id}>"
+
+    async def send(self, content=None, *, embed=None, embeds=None, file=None, view=None, delete_after=None):
+        await self.http.request("POST /channels/{channel_id}/messages", self.id)
+        message = FakeMessage(self, content, embeds or ([embed] if embed else []), view, self.sim.bot.user)
+        if delete_after is not None:
+            self.sim.background(self._delete_later(message, delete_after))
+        if self.recipient is not None and file is not None:
+            # ЛС с QR-кодом: участник «сканирует» его и отвечает боту
+            self.sim.on_code_received(self.recipient)
+        return message
+
+    async def _delete_later(self, message: FakeMessage, delay: float):
+        await asyncio.sleep(delay)
+        await message.delete()
+
+class FakeMember:
+    def __init__(self, sim: "RaidSimulation", guild: "FakeGuild", user_id: int, name: str,
+                 created_at: datetime, permissions: discord.Permissions = None):
+        self.sim = sim
+        self.http = sim.http
+        self.guild = guild
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+        self.avatar = None
+        self.display_avatar = SimpleNamespace(url=f"https://cdn.discordapp.com/embed/avatars/{user_id % 5}.png")
+        self.created_at = created_at
+        self.joined_at = datetime.now(timezone.utc)
+        self.roles: List[FakeRole] = [guild.default_role]
+        self.guild_permissions = permissions or discord.Permissions.none()
+        self._dm: Optional[FakeChannel] = None
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def add_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.http.request("PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}", self.guild.id)
+            if role not in self.roles:
+                self.roles.append(role)
+        self.sim.on_roles_changed(self)
+
+    async def edit(self, *, roles=None, reason=None):
+        await self.http.request("PATCH /guilds/{guild_id}/members/{user_id}", self.guild.id)
+        if roles is not None:
+            self.roles = [self.guild.default_role, *roles]
+        self.sim.on_roles_changed(self)
+
+    async def kick(self, reason=None):
+        await self.http.request("DELETE /guilds/{guild_id}/members/{user_id}", self.guild.id)
+        self.guild.members_by_id.pop(self.id, None)
+
+    async def send(self, content=None, **kwargs):
+        if self._dm is None:
+            await self.http.request("POST /users/@me/channels")
+            self._dm = FakeChannel(self.sim, next(ids), recipient=self)
+        return await self._dm.send(content, **kwargs)
+
+class FakeGuild:
+    def __init__(self, sim: "RaidSimulation", guild_id: int, name: str):
+        self.sim = sim
+        self.id = guild_id
+        self.name = name
+        self.shard_id = 0
+        self.default_role = FakeRole(guild_id, "@everyone", default=True)
+        self.roles_by_id: Dict[int, FakeRole] = {}
+        self.members_by_id: Dict[int, FakeMember] = {}
+
+    @property
+    def members(self) -> List[FakeMember]:
+        return list(self.members_by_id.values())
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self.roles_by_id.get(role_id)
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        return self.members_by_id.get(user_id)
+
+    async def fetch_member(self, user_id: int) -> FakeMember:
+        await self.sim.http.request("GET /guilds/{guild_id}/members/{user_id}", self.id)
+        member = self.members_by_id.get(user_id)
+        if member is None:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return member
+
+class FakeBot:
+    """Минимум интерфейса commands.Bot, которым пользуются коги"""
+
+    def __init__(self, guild: FakeGuild, channels: Dict[int, FakeChannel]):
+        self.user = SimpleNamespace(id=BOT_USER_ID, name="GlistBot", mention=f"<@{BOT_USER_ID}>")
+        self.guilds = [guild]
+        self.cogs: Dict[str, object] = {}
+        self._channels = channels
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self._channels.get(channel_id)
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+    def add_view(self, view, message_id=None):
+        pass
+
+    async def wait_until_ready(self):
+        pass
+
+class FakeContext:
+    def __init__(self, author, channel: FakeChannel, guild=None, message: FakeMessage = None):
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+        self.message = message
+        self.prefix = "!"
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))], 2)
+
+    return {'p50_s': pick(0.5), 'p90_s': pick(0.9), 'p99_s': pick(0.99), 'max_s': round(values[-1], 2)}
+
+class RaidSimulation:
+    """Один прогон рейда на заданном уровне верификации"""
+
+    def __init__(self, level: int, members: int, raid_seconds: float, think: float,
+                 moderator_interval: float, http: MockHTTP):
+        self.level = level
+        self.count = members
+        self.raid_seconds = raid_seconds
+        self.think = think
+        self.moderator_interval = moderator_interval
+        self.http = http
+        self.joined: Dict[int, float] = {}
+        self.verified: Dict[int, float] = {}
+        self.all_verified = asyncio.Event()
+        self._tasks = set()
+
+        self.guild = FakeGuild(self, GUILD_ID, "Raid Test")
+        self.unverified_role = FakeRole(UNVERIFIED_ROLE_ID, "Неверифицирован")
+        self.verified_role = FakeRole(VERIFIED_ROLE_ID, "Верифицирован")
+        self.guild.roles_by_id = {role.id: role for role in (self.unverified_role, self.verified_role)}
+        channels = {channel_id: FakeChannel(self, channel_id, guild=self.guild)
+                    for channel_id in (WELCOME_CHANNEL_ID, LOG_CHANNEL_ID, MODERATOR_CHANNEL_ID)}
+        self.bot = FakeBot(self.guild, channels)
+        self.moderator = FakeMember(self, self.guild, next(ids), "moderator",
+                                    datetime.now(timezone.utc) - timedelta(days=900),
+                                    discord.Permissions(manage_roles=True, kick_members=True))
+        self.guild.members_by_id[self.moderator.id] = self.moderator
+
+    def background(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # --- Реакции «участников» на действия бота ---
+    def on_roles_changed(self, member: FakeMember):
+        if member.id in self.verified or member.id not in self.joined:
+            return
+        if self.verified_role in member.roles:
+            self.verified[member.id] = asyncio.get_running_loop().time() - self.joined[member.id]
+            if len(self.verified) == self.count:
+                self.all_verified.set()
+        elif self.level == 1 and self.unverified_role in member.roles:
+            # Участник видит приветствие и пишет !verify
+            self.background(self._user_verify(member))
+
+    def on_code_received(self, member: FakeMember):
+        if self.level == 2:
+            self.background(self._user_code(member))
+
+    async def _user_verify(self, member: FakeMember):
+        await asyncio.sleep(self.think)
+        channel = self.bot.get_channel(WELCOME_CHANNEL_ID)
+        ctx = FakeContext(member, channel, guild=self.guild, message=FakeMessage(channel, "!verify", author=member))
+        cog = self.bot.get_cog('VerificationCog')
+        await cog.verify.callback(cog, ctx)
+
+    async def _user_code(self, member: FakeMember):
+        await asyncio.sleep(self.think)
+        cog = self.bot.get_cog('VerificationCog')
+        token = cog.codes.get(self.guild.id, member.id)
+        if token is None:
+            return
+        ctx = FakeContext(member, member._dm)
+        await cog.code.callback(cog, ctx, token)
+
+    async def _moderators(self):
+        """Модераторы раз в moderator_interval обновляют панель и одобряют показанную страницу"""
+        from queue_dashboard import QueueDashboardView, BatchProgress, run_batch
+
+        cog = self.bot.get_cog('VerificationCog')
+        view = QueueDashboardView(cog, self.guild)
+        roles = (self.verified_role, self.unverified_role)
+
+        async def report():
+            pass
+
+        while not self.all_verified.is_set():
+            await asyncio.sleep(self.moderator_interval)
+            await view.update_ranking()
+            view.render()
+            requests = view.shown_requests()
+            if requests:
+                await run_batch(requests, lambda request: view._approve(request, roles, self.moderator, 3),
+                                BatchProgress(len(requests)), report)
+
+    async def run(self, max_seconds: float) -> dict:
+        from stats_cog import StatsCog
+        from verification_cog import VerificationCog
+
+        loop = asyncio.get_running_loop()
+        stats_cog = StatsCog(self.bot)
+        verification_cog = VerificationCog(self.bot)
+        self.bot.cogs = {'StatsCog': stats_cog, 'VerificationCog': verification_cog}
+        await stats_cog.cog_load()
+        await verification_cog.cog_load()
+
+        if self.level == 3:
+            self.background(self._moderators())
+
+        started = loop.time()
+        real_started = time.perf_counter()
+        spacing = self.raid_seconds / self.count
+        now = datetime.now(timezone.utc)
+        for i in range(self.count):
+            member = FakeMember(self, self.guild, next(ids), f"raider{i}",
+                                now - timedelta(days=i % 60, hours=i % 24))
+            self.guild.members_by_id[member.id] = member
+            self.joined[member.id] = loop.time()
+            # Тот же порядок, что у discord.py: слушатели обоих когов
+            await verification_cog.on_member_join(member)
+            await stats_cog.on_member_join(member)
+            await asyncio.sleep(spacing)
+
+        try:
+            await asyncio.wait_for(self.all_verified.wait(), max_seconds)
+        except asyncio.TimeoutError:
+            pass
+        duration = loop.time() - started
+
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await verification_cog.cog_unload()
+        await stats_cog.cog_unload()
+
+        return {
+            'level': self.level,
+            'members': self.count,
+            'verified': len(self.verified),
+            'duration_s': round(duration, 1),
+            'real_seconds': round(time.perf_counter() - real_started, 2),
+            'join_to_verified': percentiles(list(self.verified.values())),
+            'api_calls': self.http.total_calls,
+            'api_calls_by_route': dict(self.http.calls.most_common()),
+            'ratelimit_waits': dict(self.http.waits.most_common()),
+            'ratelimit_wait_seconds': round(self.http.wait_seconds, 1),
+            'join_pipeline_dropped': verification_cog.join_pipeline.dropped,
+            'log_events_sent': verification_cog.log_aggregator.sent_events,
+            'log_messages_sent': verification_cog.log_aggregator.sent_messages,
+        }
+
+def run_level(level: int, args) -> dict:
+    """Прогон одного уровня в отдельной временной папке (свои config.json и БД)"""
+    import config_store
+
+    with tempfile.TemporaryDirectory() as tmp:
+        previous_cwd = os.getcwd()
+        os.chdir(tmp)
+        loop = VirtualClockLoop()
+        real_monotonic = time.monotonic
+        # Лимитеры бота считают время через time.monotonic — переводим их на виртуальные часы
+        time.monotonic = loop.time
+        try:
+            with open('config.json', 'w', encoding='utf-8') as f:
+                json.dump({
+                    "GUILD_ID": GUILD_ID,
+                    "UNVERIFIED_ROLE_ID": UNVERIFIED_ROLE_ID,
+                    "VERIFIED_ROLE_ID": VERIFIED_ROLE_ID,
+                    "MODERATOR_CHANNEL_ID": MODERATOR_CHANNEL_ID,
+                    "WELCOME_CHANNEL_ID": WELCOME_CHANNEL_ID,
+                    "LOG_CHANNEL_ID": LOG_CHANNEL_ID,
+                    "VERIFICATION_LEVEL": level,
+                    # Уровень задаётся прогоном, детектор рейдов не должен его менять
+                    "RAID_ACTION": "off",
+                }, f)
+            config_store.config_store.reload()
+            config_store.guild_config_store.close()
+
+            asyncio.set_event_loop(loop)
+            http = MockHTTP(latency=args.latency)
+            simulation = loop.run_until_complete(_create(level, args, http))
+            return loop.run_until_complete(simulation.run(args.max_seconds))
+        finally:
+            config_store.guild_config_store.close()
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+            asyncio.set_event_loop(None)
+            time.monotonic = real_monotonic
+            os.chdir(previous_cwd)
+
+async def _create(level: int, args, http: MockHTTP) -> RaidSimulation:
+    # Объекты с asyncio.Event создаются внутри работающего цикла
+    return RaidSimulation(level, args.members, args.raid_seconds, args.think, args.moderator_interval, http)
+
+def main():
+    parser = argparse.ArgumentParser(description="Симуляция рейда без подключения к Discord")
+    parser.add_argument("--members", type=int, default=1000, help="сколько участников входит")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 3], choices=[1, 2, 3],
+                        help="уровни верификации для прогона")
+    parser.add_argument("--raid-seconds", type=float, default=10.0, help="за сколько секунд входят все участники")
+    parser.add_argument("--think", type=float, default=0.0, help="реакция участника на приветствие/ЛС (секунды)")
+    parser.add_argument("--moderator-interval", type=float, default=5.0,
+                        help="как часто модератор одобряет страницу очереди на уровне 3 (секунды)")
+    parser.add_argument("--latency", type=float, default=API_LATENCY, help="время ответа API (секунды)")
+    parser.add_argument("--max-seconds", type=float, default=7200.0, help="предел виртуального времени прогона")
+    parser.add_argument("--json", metavar="PATH", help="сохранить результаты в JSON ('-' — вывести в stdout)")
+    args = parser.parse_args()
+
+    # Модули бота ищутся рядом со скриптом, даже после смены рабочей папки
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    quiet = args.json == '-'
+    results = []
+    with contextlib.redirect_stdout(sys.stderr if quiet else sys.stdout):
+        for level in args.levels:
+            print(f"🌊 Уровень {level}: вход {args.members} участников за {args.raid_seconds:g} с...")
+            result = run_level(level, args)
+            results.append(result)
+            latency = result['join_to_verified']
+            print(f"   верифицировано {result['verified']}/{result['members']} за {result['duration_s']} с "
+                  f"(реально {result['real_seconds']} с)")
+            if latency:
+                print(f"   вход → верификация: p50 {latency['p50_s']} с, p90 {latency['p90_s']} с, "
+                      f"p99 {latency['p99_s']} с, max {latency['max_s']} с")
+            print(f"   запросов к API: {result['api_calls']}, ожиданий лимитов: "
+                  f"{sum(result['ratelimit_waits'].values())} ({result['ratelimit_wait_seconds']} с)")
+            for route, calls in result['api_calls_by_route'].items():
+                print(f"      {calls:6} {route}")
+
+    if args.json == '-':
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты сохранены в {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -1,189 +1,646 @@
 import discord
-from discord.ext import commands
-import json
-import sqlite3
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from discord.ext import commands, tasks
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple, TypeVar
+
+from config_store import get_config, get_guild_config
+from db_pool import ReadToken, SQLitePool
+from perf_metrics import metrics
+from stats_retention import (RETENTION_TABLES, PRUNE_BATCH, PRUNE_PAUSE, VACUUM_PAGES, AUTO_VACUUM_CONVERT_MAX,
+                             retention_cutoff, attach_archive, detach_archive, prune_batch,
+                             incremental_vacuum, enable_incremental_vacuum)
+
+T = TypeVar('T')
+
+# --- Параметры отложенной записи в БД ---
+WRITE_BATCH_SIZE = 200        # Максимум записей в одной транзакции
+WRITE_FLUSH_INTERVAL = 1.0    # Максимальная задержка записи (секунды)
+WRITE_QUEUE_MAXSIZE = 50000   # Предел очереди, после которого записи отбрасываются
+
+# --- Чтение статистики в фоновых потоках ---
+READ_WORKERS = 4              # Потоков (и соединений) для чтения
+READ_MAX_PENDING = 16         # Одновременных запросов; остальные ждут своей очереди
+READ_TIMEOUT = 10.0           # После стольких секунд запрос прерывается (conn.interrupt())
+READ_TIMEOUT_MESSAGE = "⏱️ Запрос статистики выполняется слишком долго. Попробуйте позже."
+
+# --- Кэш результатов запросов статистики ---
+STATS_CACHE_TTL = 30.0        # Время жизни результата (секунды)
+
+# --- SQL для вставки (timestamp передаётся явно в момент события) ---
+INSERT_VERIFICATION = '''
+    INSERT INTO verifications
+    (user_id, username, guild_id, status, method, moderator_id, moderator_name, verification_level, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+INSERT_MEMBER_JOIN = '''
+    INSERT INTO member_joins (user_id, username, guild_id, account_age_days, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+'''
+INSERT_ATTEMPT = '''
+    INSERT INTO verification_attempts (user_id, guild_id, success, timestamp)
+    VALUES (?, ?, ?, ?)
+'''
+
+# --- Миграции схемы ---
+# Версия схемы хранится в PRAGMA user_version; миграция N переводит БД из версии N-1 в N.
+# Новые миграции добавляются только в конец списка.
+# Агрегаты (daily_*, moderator_totals) ведутся только триггерами на вставку: сырые строки
+# удаляются по сроку хранения, поэтому пересобирать агрегаты из сырых данных нельзя.
+SCHEMA_MIGRATIONS = [
+    # 1: базовые таблицы
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS verifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            guild_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            method TEXT NOT NULL,
+            moderator_id INTEGER,
+            moderator_name TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            verification_level INTEGER
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS verification_attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL,
+            success BOOLEAN NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS member_joins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            guild_id INTEGER NOT NULL,
+            account_age_days INTEGER,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ],
+    # 2: составные индексы под выборки по серверу и периоду, по пользователю и по модераторам
+    [
+        'CREATE INDEX IF NOT EXISTS idx_verifications_guild_time ON verifications (guild_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_verifications_guild_user_time ON verifications (guild_id, user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_verifications_guild_moderator ON verifications (guild_id, moderator_id)',
+        'CREATE INDEX IF NOT EXISTS idx_attempts_guild_user_time ON verification_attempts (guild_id, user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_joins_guild_time ON member_joins (guild_id, timestamp)',
+    ],
+    # 3: дневные агрегаты для !stats, поддерживаются триггерами и заполняются из сырых данных
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS daily_verifications (
+            guild_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            method TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, day, status, method)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS daily_joins (
+            guild_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            account_age_sum INTEGER NOT NULL DEFAULT 0,
+            account_age_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, day)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT OR REPLACE INTO daily_verifications (guild_id, day, status, method, count)
+        SELECT guild_id, date(timestamp), status, method, COUNT(*)
+        FROM verifications
+        GROUP BY guild_id, date(timestamp), status, method
+        ''',
+        '''
+        INSERT OR REPLACE INTO daily_joins (guild_id, day, count, account_age_sum, account_age_count)
+        SELECT guild_id, date(timestamp), COUNT(*), COALESCE(SUM(account_age_days), 0), COUNT(account_age_days)
+        FROM member_joins
+        GROUP BY guild_id, date(timestamp)
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_verifications_daily AFTER INSERT ON verifications
+        BEGIN
+            INSERT INTO daily_verifications (guild_id, day, status, method, count)
+            VALUES (NEW.guild_id, date(NEW.timestamp), NEW.status, NEW.method, 1)
+            ON CONFLICT (guild_id, day, status, method) DO UPDATE SET count = count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_member_joins_daily AFTER INSERT ON member_joins
+        BEGIN
+            INSERT INTO daily_joins (guild_id, day, count, account_age_sum, account_age_count)
+            VALUES (NEW.guild_id, date(NEW.timestamp), 1, COALESCE(NEW.account_age_days, 0),
+                    NEW.account_age_days IS NOT NULL)
+            ON CONFLICT (guild_id, day) DO UPDATE SET
+                count = count + 1,
+                account_age_sum = account_age_sum + excluded.account_age_sum,
+                account_age_count = account_age_count + excluded.account_age_count;
+        END
+        ''',
+    ],
+    # 4: итоги модераторов за всё время (переживают удаление старых строк) и индексы по времени для очистки
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS moderator_totals (
+            guild_id INTEGER NOT NULL,
+            moderator_id INTEGER NOT NULL,
+            moderator_name TEXT,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, moderator_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT OR REPLACE INTO moderator_totals (guild_id, moderator_id, moderator_name, count)
+        SELECT guild_id, moderator_id, moderator_name, COUNT(*)
+        FROM verifications
+        WHERE moderator_id IS NOT NULL
+        GROUP BY guild_id, moderator_id
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_verifications_moderators AFTER INSERT ON verifications
+        WHEN NEW.moderator_id IS NOT NULL
+        BEGIN
+            INSERT INTO moderator_totals (guild_id, moderator_id, moderator_name, count)
+            VALUES (NEW.guild_id, NEW.moderator_id, NEW.moderator_name, 1)
+            ON CONFLICT (guild_id, moderator_id) DO UPDATE SET
+                count = count + 1,
+                moderator_name = excluded.moderator_name;
+        END
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_verifications_time ON verifications (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_joins_time ON member_joins (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_attempts_time ON verification_attempts (timestamp)',
+    ],
+]
+
+def db_timestamp() -> str:
+    """Текущее время в формате CURRENT_TIMESTAMP SQLite (UTC)"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def window_start_day(days: int) -> str:
+    """Первый день (UTC, YYYY-MM-DD) периода из N последних дней, включая сегодняшний"""
+    return (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+
+class StatsResultCache:
+    """
+    Кэш результатов запросов по серверам: {guild_id: {ключ: (срок, значение)}}.
+    Записи живут STATS_CACHE_TTL секунд и сбрасываются целиком для сервера,
+    как только в БД попадают новые события этого сервера.
+
+    Запросы выполняются в потоках чтения, поэтому каждый сброс увеличивает
+    поколение сервера: результат, прочитанный до сброса, в кэш уже не попадёт.
+    put() (в потоке чтения) и invalidate() (в event loop) выполняются под одной
+    блокировкой, так что сброс не может вклиниться между проверкой поколения и записью.
+    """
+
+    def __init__(self, ttl: float = STATS_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[int, Dict[tuple, Tuple[float, object]]] = {}
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, guild_id: int, key: tuple):
+        with self._lock:
+            entry = self._entries.get(guild_id, {}).get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def generation(self, guild_id: int) -> int:
+        with self._lock:
+            return self._generations.get(guild_id, 0)
+
+    def put(self, guild_id: int, key: tuple, value, generation: int = None):
+        with self._lock:
+            if generation is not None and generation != self._generations.get(guild_id, 0):
+                return
+            self._entries.setdefault(guild_id, {})[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate_all(self):
+        """Сбрасывает результаты всех серверов (например, после удаления старых строк)"""
+        with self._lock:
+            guild_ids = set(self._entries) | set(self._generations)
+        for guild_id in guild_ids:
+            self.invalidate(guild_id)
+
+    def invalidate(self, guild_id: int):
+        with self._lock:
+            self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+            if self._entries.pop(guild_id, None) is not None:
+                self.invalidations += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._entries.values())
 
 class StatsCog(commands.Cog):
-    def __init__(self, bot):
+    def __init__(self, bot, db_path: str = 'verification_stats.db'):
         self.bot = bot
-        self.db_path = 'verification_stats.db'
-        self.init_database()
+        self.db_path = db_path
+        # Постоянные соединения: писатель используется только потоком записи,
+        # читатели — командами статистики
+        self.db = SQLitePool(self.db_path, readers=READ_WORKERS)
+
+        # Очередь отложенной записи: события копятся здесь и пишутся пачками
+        # в отдельном потоке, чтобы fsync не блокировал event loop
+        self._write_queue: asyncio.Queue = asyncio.Queue(maxsize=WRITE_QUEUE_MAXSIZE)
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stats-writer')
+        self._writer_task = None
+        self.dropped_writes = 0
+
+        # Запросы чтения выполняются в отдельном пуле потоков с таймаутом,
+        # чтобы тяжёлая аналитика не блокировала обработку событий Discord
+        self._read_executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix='stats-reader')
+        self._read_slots = asyncio.Semaphore(READ_MAX_PENDING)
+        self._read_local = threading.local()
+        self._active_reads = set()
+        self.read_timeouts = 0
+
+        self.cache = StatsResultCache()
+
+        # Очистка по сроку хранения: итоги последнего прохода
+        self.retention_removed: Dict[str, int] = {}
+        self.retention_vacuumed = 0
+        self.retention_last_run = None
+        self._vacuum_mode_checked = False
+        self._retention_lock = asyncio.Lock()
+
+    async def cog_load(self):
+        # Миграции (в том числе построение индексов на большой БД) выполняются
+        # в потоке записи и не задерживают запуск бота. Поток однопоточный,
+        # поэтому все последующие записи гарантированно идут после миграций.
+        migration = asyncio.get_running_loop().run_in_executor(self._db_executor, self.init_database)
+        migration.add_done_callback(self._on_migration_done)
+        self._writer_task = asyncio.create_task(self._writer_loop())
+        self.retention.start()
+
+    @staticmethod
+    def _on_migration_done(future: asyncio.Future):
+        if not future.cancelled() and future.exception():
+            print(f"Ошибка при миграции БД статистики: {future.exception()}")
+
+    async def cog_unload(self):
+        # Очистка останавливается первой: она использует поток записи
+        self.retention.cancel()
+        retention_task = self.retention.get_task()
+        if retention_task is not None:
+            await asyncio.gather(retention_task, return_exceptions=True)
+
+        # Сигнал остановки ставится в конец очереди — всё, что было до него, будет записано
+        if self._writer_task:
+            await self._write_queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+
+        # Дописываем то, что успело попасть в очередь после сигнала остановки
+        leftover = []
+        while not self._write_queue.empty():
+            item = self._write_queue.get_nowait()
+            if item is not None:
+                leftover.append(item)
+        loop = asyncio.get_running_loop()
+        if leftover:
+            await loop.run_in_executor(self._db_executor, self._write_batch, leftover)
+        self._db_executor.shutdown(wait=True)
+
+        # Незавершённые чтения прерываются, чтобы не ждать их при закрытии соединений
+        for token in list(self._active_reads):
+            token.cancel()
+        await loop.run_in_executor(None, lambda: self._read_executor.shutdown(wait=True, cancel_futures=True))
+        self.db.close()
+
+    def _reader(self):
+        """Соединение для чтения, привязанное к токену отмены текущего запроса (если он есть)"""
+        return self.db.reader(getattr(self._read_local, 'token', None))
+
+    async def run_read(self, func: Callable[..., T], *args) -> T:
+        """
+        Выполняет синхронный запрос чтения в пуле потоков.
+
+        Если запрос не уложился в READ_TIMEOUT или корутину отменили,
+        выполняющийся SQL прерывается через conn.interrupt(); наружу
+        пробрасывается asyncio.TimeoutError (или CancelledError).
+        """
+        token = ReadToken()
+
+        def run():
+            self._read_local.token = token
+            try:
+                return func(*args)
+            finally:
+                self._read_local.token = None
+
+        with metrics.timer("glistbot_stats_read_seconds", query=func.__name__):
+            async with self._read_slots:
+                self._active_reads.add(token)
+                try:
+                    future = asyncio.get_running_loop().run_in_executor(self._read_executor, run)
+                    return await asyncio.wait_for(future, READ_TIMEOUT)
+                except asyncio.TimeoutError:
+                    self.read_timeouts += 1
+                    token.cancel()
+                    raise
+                except asyncio.CancelledError:
+                    token.cancel()
+                    raise
+                finally:
+                    self._active_reads.discard(token)
+
+    def _enqueue_write(self, guild_id: int, sql: str, params: tuple):
+        """Ставит запись в очередь, не блокируя event loop"""
+        if self._writer_task is None or self._writer_task.done():
+            self.dropped_writes += 1
+            print("Ошибка при записи в БД: поток записи не запущен, событие отброшено")
+            return
+        try:
+            self._write_queue.put_nowait((guild_id, sql, params))
+        except asyncio.QueueFull:
+            self.dropped_writes += 1
+            print("Ошибка при записи в БД: очередь переполнена, событие отброшено")
+
+    async def _writer_loop(self):
+        """Забирает события из очереди и сбрасывает их пачками по размеру или по времени"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._write_queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + WRITE_FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._write_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                await loop.run_in_executor(self._db_executor, self._write_batch, batch)
+            except Exception as e:
+                print(f"Ошибка при пакетной записи в БД ({len(batch)} записей): {e}")
+
+            # Данные серверов из пачки изменились — их кэшированные результаты устарели
+            for guild_id in {guild_id for guild_id, _, _ in batch}:
+                self.cache.invalidate(guild_id)
+
+    def _write_batch(self, batch: List[Tuple[int, str, tuple]]):
+        """Записывает пачку одной транзакцией (выполняется в потоке записи)"""
+        grouped: Dict[str, List[tuple]] = {}
+        for _, sql, params in batch:
+            grouped.setdefault(sql, []).append(params)
+
+        with self.db.transaction() as conn:
+            for sql, rows in grouped.items():
+                conn.executemany(sql, rows)
 
     def init_database(self):
-        """Инициализация базы данных для хранения статистики"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Таблица для хранения верификаций
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS verifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                username TEXT NOT NULL,
-                guild_id INTEGER NOT NULL,
-                status TEXT NOT NULL,
-                method TEXT NOT NULL,
-                moderator_id INTEGER,
-                moderator_name TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                verification_level INTEGER
-            )
-        ''')
-        
-        # Таблица для хранения попыток верификации
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS verification_attempts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                guild_id INTEGER NOT NULL,
-                success BOOLEAN NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица для хранения информации о присоединениях
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS member_joins (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                username TEXT NOT NULL,
-                guild_id INTEGER NOT NULL,
-                account_age_days INTEGER,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        """Инициализация базы данных: применяет недостающие миграции схемы"""
+        conn = self.db.writer
+        current_version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for version, statements in enumerate(SCHEMA_MIGRATIONS, start=1):
+            if version <= current_version:
+                continue
+            # Каждая миграция применяется атомарно вместе с новым номером версии
+            with self.db.transaction():
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {version}')
+            print(f"БД статистики обновлена до версии {version}")
+            current_version = version
+        conn.execute('PRAGMA optimize')
 
     def log_verification_to_db(self, user_id: int, username: str, guild_id: int, status: str, 
                                method: str, verification_level: int, moderator_id: int = None, 
                                moderator_name: str = None):
-        """Записывает верификацию в базу данных"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO verifications 
-                (user_id, username, guild_id, status, method, moderator_id, moderator_name, verification_level)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, username, guild_id, status, method, moderator_id, moderator_name, verification_level))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"Ошибка при записи верификации в БД: {e}")
+        """Ставит верификацию в очередь записи в базу данных"""
+        self._enqueue_write(guild_id, INSERT_VERIFICATION, (user_id, username, guild_id, status, method,
+                                                  moderator_id, moderator_name, verification_level,
+                                                  db_timestamp()))
 
     def log_member_join(self, user_id: int, username: str, guild_id: int, account_age_days: int):
-        """Записывает присоединение участника в базу данных"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO member_joins (user_id, username, guild_id, account_age_days)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, username, guild_id, account_age_days))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"Ошибка при записи присоединения в БД: {e}")
+        """Ставит присоединение участника в очередь записи в базу данных"""
+        self._enqueue_write(guild_id, INSERT_MEMBER_JOIN, (user_id, username, guild_id, account_age_days, db_timestamp()))
 
     def log_verification_attempt(self, user_id: int, guild_id: int, success: bool):
-        """Записывает попытку верификации"""
+        """Ставит попытку верификации в очередь записи"""
+        self._enqueue_write(guild_id, INSERT_ATTEMPT, (user_id, guild_id, success, db_timestamp()))
+
+    # --- Срок хранения сырых данных ---
+    def _prepare_vacuum(self):
+        """
+        Освобождение места после очистки требует режима incremental vacuum:
+        небольшая БД переводится в него сразу, большая — вручную (stats_retention.py)
+        """
+        if not enable_incremental_vacuum(self.db.writer, AUTO_VACUUM_CONVERT_MAX):
+            print("БД статистики слишком большая для VACUUM во время работы: место после очистки будет "
+                  "переиспользоваться, но файл не уменьшится. Выполните при остановленном боте: "
+                  "python stats_retention.py --enable-incremental-vacuum")
+
+    async def apply_retention(self) -> Dict[str, int]:
+        """
+        Удаляет (или архивирует) строки старше срока хранения из RETENTION_DAYS.
+
+        Каждая пачка — отдельная короткая транзакция в потоке записи, поэтому
+        обычные записи встают в очередь между пачками, а не ждут всю очистку.
+        """
+        async with self._retention_lock:
+            return await self._apply_retention()
+
+    async def _apply_retention(self) -> Dict[str, int]:
+        config = get_config()
+        policy = {table: days for table, days in config.retention_days.items()
+                  if table in RETENTION_TABLES and days and days > 0}
+        if not policy:
+            return {}
+        loop = asyncio.get_running_loop()
+        writer = self.db.writer
+
+        if not self._vacuum_mode_checked:
+            self._vacuum_mode_checked = True
+            await loop.run_in_executor(self._db_executor, self._prepare_vacuum)
+
+        archive = config.retention_archive or None
+        if archive:
+            await loop.run_in_executor(self._db_executor, attach_archive, writer, archive)
+        removed = {}
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO verification_attempts (user_id, guild_id, success)
-                VALUES (?, ?, ?)
-            ''', (user_id, guild_id, success))
-            conn.commit()
-            conn.close()
+            for table, days in policy.items():
+                cutoff = retention_cutoff(days)
+                removed[table] = 0
+                while True:
+                    count = await loop.run_in_executor(self._db_executor, prune_batch, writer, table,
+                                                       cutoff, PRUNE_BATCH, archive is not None)
+                    removed[table] += count
+                    if count < PRUNE_BATCH:
+                        break
+                    await asyncio.sleep(PRUNE_PAUSE)
+        finally:
+            if archive:
+                await loop.run_in_executor(self._db_executor, detach_archive, writer)
+
+        vacuumed = 0
+        if any(removed.values()):
+            # Агрегаты не меняются, но история пользователей и последние верификации — да
+            self.cache.invalidate_all()
+            while True:
+                pages = await loop.run_in_executor(self._db_executor, incremental_vacuum, writer, VACUUM_PAGES)
+                if not pages:
+                    break
+                vacuumed += pages
+                await asyncio.sleep(PRUNE_PAUSE)
+
+        self.retention_removed = removed
+        self.retention_vacuumed = vacuumed
+        self.retention_last_run = datetime.now()
+        if any(removed.values()):
+            summary = ", ".join(f"{table}: {count}" for table, count in removed.items())
+            print(f"Очистка статистики по сроку хранения ({'архив' if archive else 'удаление'}): "
+                  f"{summary}; освобождено страниц: {vacuumed}")
+        return removed
+
+    @tasks.loop(hours=1)
+    async def retention(self):
+        try:
+            await self.apply_retention()
         except Exception as e:
-            print(f"Ошибка при записи попытки верификации в БД: {e}")
+            print(f"Ошибка при очистке статистики по сроку хранения: {e}")
 
     def get_stats_period(self, guild_id: int, days: int = 7) -> Dict:
         """Получает статистику за определенный период"""
+        return self.get_stats_windows(guild_id, (days,)).get(days, {})
+
+    def get_stats_windows(self, guild_id: int, windows: Tuple[int, ...] = (7, 30)) -> Dict[int, Dict]:
+        """
+        Получает статистику сразу за несколько периодов (в днях).
+        
+        Данные берутся из дневных агрегатов (daily_verifications, daily_joins),
+        поэтому даже окно в 365 дней — это не больше 365 строк на комбинацию
+        статус/метод, независимо от объёма сырых данных. Счётчики для всех окон
+        собираются одним проходом условной агрегацией. Период в N дней — это
+        сегодняшний день и N-1 предыдущих (по UTC).
+        """
+        windows = tuple(sorted(set(windows)))
+        cached = self.cache.get(guild_id, ('windows', windows))
+        if cached is not None:
+            return cached
+        generation = self.cache.generation(guild_id)
+
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            date_threshold = datetime.now() - timedelta(days=days)
-            
-            # Общее количество верификаций
-            cursor.execute('''
-                SELECT COUNT(*) FROM verifications 
-                WHERE guild_id = ? AND timestamp > ?
-            ''', (guild_id, date_threshold))
-            total_verifications = cursor.fetchone()[0]
-            
-            # Успешные верификации
-            cursor.execute('''
-                SELECT COUNT(*) FROM verifications 
-                WHERE guild_id = ? AND status = 'успешно' AND timestamp > ?
-            ''', (guild_id, date_threshold))
-            successful = cursor.fetchone()[0]
-            
-            # Отклоненные верификации
-            cursor.execute('''
-                SELECT COUNT(*) FROM verifications 
-                WHERE guild_id = ? AND status = 'отклонено' AND timestamp > ?
-            ''', (guild_id, date_threshold))
-            rejected = cursor.fetchone()[0]
-            
-            # По методам
-            cursor.execute('''
-                SELECT method, COUNT(*) FROM verifications 
-                WHERE guild_id = ? AND timestamp > ?
+            start_days = [window_start_day(days) for days in windows]
+            oldest = start_days[-1]
+
+            # Верификации: по методам, с разбивкой на окна и статусы
+            columns = []
+            params = []
+            for start_day in start_days:
+                columns.append("SUM(CASE WHEN day >= ? THEN count ELSE 0 END)")
+                columns.append("SUM(CASE WHEN day >= ? AND status = 'успешно' THEN count ELSE 0 END)")
+                columns.append("SUM(CASE WHEN day >= ? AND status = 'отклонено' THEN count ELSE 0 END)")
+                params.extend((start_day, start_day, start_day))
+            verifications_sql = f'''
+                SELECT method, {", ".join(columns)}
+                FROM daily_verifications
+                WHERE guild_id = ? AND day >= ?
                 GROUP BY method
-            ''', (guild_id, date_threshold))
-            by_method = dict(cursor.fetchall())
-            
-            # Новые участники
-            cursor.execute('''
-                SELECT COUNT(*) FROM member_joins 
-                WHERE guild_id = ? AND timestamp > ?
-            ''', (guild_id, date_threshold))
-            new_members = cursor.fetchone()[0]
-            
-            # Средний возраст аккаунтов (в днях)
-            cursor.execute('''
-                SELECT AVG(account_age_days) FROM member_joins 
-                WHERE guild_id = ? AND timestamp > ?
-            ''', (guild_id, date_threshold))
-            avg_account_age = cursor.fetchone()[0] or 0
-            
-            conn.close()
-            
-            return {
-                'total_verifications': total_verifications,
-                'successful': successful,
-                'rejected': rejected,
-                'by_method': by_method,
-                'new_members': new_members,
-                'avg_account_age': round(avg_account_age, 1),
-                'success_rate': round((successful / total_verifications * 100) if total_verifications > 0 else 0, 1)
-            }
+            '''
+            verifications_params = (*params, guild_id, oldest)
+
+            # Присоединения: количество и средний возраст аккаунта для каждого окна
+            columns = []
+            params = []
+            for start_day in start_days:
+                columns.append("SUM(CASE WHEN day >= ? THEN count ELSE 0 END)")
+                columns.append("SUM(CASE WHEN day >= ? THEN account_age_sum ELSE 0 END)")
+                columns.append("SUM(CASE WHEN day >= ? THEN account_age_count ELSE 0 END)")
+                params.extend((start_day, start_day, start_day))
+            joins_sql = f'''
+                SELECT {", ".join(columns)}
+                FROM daily_joins
+                WHERE guild_id = ? AND day >= ?
+            '''
+            joins_params = (*params, guild_id, oldest)
+
+            with self._reader() as conn:
+                by_method_rows = conn.execute(verifications_sql, verifications_params).fetchall()
+                joins_row = conn.execute(joins_sql, joins_params).fetchone()
+
+            result = {}
+            for i, days in enumerate(windows):
+                total_verifications = successful = rejected = 0
+                by_method = {}
+                for row in by_method_rows:
+                    total, ok, denied = (row[1 + i * 3 + k] or 0 for k in range(3))
+                    if total:
+                        by_method[row[0]] = total
+                    total_verifications += total
+                    successful += ok
+                    rejected += denied
+
+                new_members = joins_row[i * 3] or 0
+                age_sum = joins_row[i * 3 + 1] or 0
+                age_count = joins_row[i * 3 + 2] or 0
+                avg_account_age = age_sum / age_count if age_count else 0
+
+                result[days] = {
+                    'total_verifications': total_verifications,
+                    'successful': successful,
+                    'rejected': rejected,
+                    'by_method': by_method,
+                    'new_members': new_members,
+                    'avg_account_age': round(avg_account_age, 1),
+                    'success_rate': round((successful / total_verifications * 100) if total_verifications > 0 else 0, 1)
+                }
+            self.cache.put(guild_id, ('windows', windows), result, generation)
+            return result
         except Exception as e:
             print(f"Ошибка при получении статистики: {e}")
             return {}
 
     def get_top_moderators(self, guild_id: int, limit: int = 5) -> List[Tuple]:
         """Получает топ модераторов по количеству верификаций"""
+        cached = self.cache.get(guild_id, ('top_moderators', limit))
+        if cached is not None:
+            return cached
+        generation = self.cache.generation(guild_id)
+
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT moderator_name, COUNT(*) as count 
-                FROM verifications 
-                WHERE guild_id = ? AND moderator_id IS NOT NULL
-                GROUP BY moderator_id
-                ORDER BY count DESC
-                LIMIT ?
-            ''', (guild_id, limit))
-            result = cursor.fetchall()
-            conn.close()
+            with self._reader() as conn:
+                cursor = conn.cursor()
+                # Итоги за всё время ведутся триггером, старые сырые строки могут быть удалены
+                cursor.execute('''
+                    SELECT moderator_name, count
+                    FROM moderator_totals
+                    WHERE guild_id = ?
+                    ORDER BY count DESC
+                    LIMIT ?
+                ''', (guild_id, limit))
+                result = cursor.fetchall()
+            self.cache.put(guild_id, ('top_moderators', limit), result, generation)
             return result
         except Exception as e:
             print(f"Ошибка при получении топа модераторов: {e}")
@@ -191,20 +648,24 @@ class StatsCog(commands.Cog):
 
     def get_recent_verifications(self, guild_id: int, limit: int = 10) -> List[Dict]:
         """Получает последние верификации"""
+        cached = self.cache.get(guild_id, ('recent', limit))
+        if cached is not None:
+            return cached
+        generation = self.cache.generation(guild_id)
+
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT username, status, method, timestamp 
-                FROM verifications 
-                WHERE guild_id = ?
-                ORDER BY timestamp DESC
-                LIMIT ?
-            ''', (guild_id, limit))
-            results = cursor.fetchall()
-            conn.close()
+            with self._reader() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT username, status, method, timestamp 
+                    FROM verifications 
+                    WHERE guild_id = ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                ''', (guild_id, limit))
+                results = cursor.fetchall()
             
-            return [
+            recent = [
                 {
                     'username': r[0],
                     'status': r[1],
@@ -213,10 +674,38 @@ class StatsCog(commands.Cog):
                 }
                 for r in results
             ]
+            self.cache.put(guild_id, ('recent', limit), recent, generation)
+            return recent
         except Exception as e:
             print(f"Ошибка при получении последних верификаций: {e}")
             return []
 
+    def get_user_history(self, guild_id: int, user_id: int) -> Tuple[List[Tuple], int]:
+        """Последние 5 верификаций пользователя и число его попыток"""
+        try:
+            with self._reader() as conn:
+                cursor = conn.cursor()
+            
+                # Верификации пользователя
+                cursor.execute('''
+                    SELECT status, method, timestamp FROM verifications 
+                    WHERE user_id = ? AND guild_id = ?
+                    ORDER BY timestamp DESC
+                    LIMIT 5
+                ''', (user_id, guild_id))
+                verifications = cursor.fetchall()
+            
+                # Попытки верификации
+                cursor.execute('''
+                    SELECT COUNT(*) FROM verification_attempts 
+                    WHERE user_id = ? AND guild_id = ?
+                ''', (user_id, guild_id))
+                attempts = cursor.fetchone()[0]
+            return verifications, attempts
+        except Exception as e:
+            print(f"Ошибка при проверке пользователя: {e}")
+            return [], 0
+
     @commands.command(name='stats')
     @commands.has_permissions(manage_guild=True)
     async def show_stats(self, ctx, days: int = 7):
@@ -230,7 +719,11 @@ class StatsCog(commands.Cog):
             await ctx.send("❌ Укажите количество дней от 1 до 365.")
             return
 
-        stats = self.get_stats_period(ctx.guild.id, days)
+        try:
+            stats = await self.run_read(self.get_stats_period, ctx.guild.id, days)
+        except asyncio.TimeoutError:
+            await ctx.send(READ_TIMEOUT_MESSAGE)
+            return
         
         if not stats or stats['total_verifications'] == 0:
             await ctx.send(f"📊 За последние **{days} дней** нет данных о верификациях.")
@@ -301,9 +794,14 @@ class StatsCog(commands.Cog):
         
         Использование: !verifstats
         """
-        stats_7d = self.get_stats_period(ctx.guild.id, 7)
-        stats_30d = self.get_stats_period(ctx.guild.id, 30)
-        top_mods = self.get_top_moderators(ctx.guild.id, 5)
+        try:
+            windows = await self.run_read(self.get_stats_windows, ctx.guild.id, (7, 30))
+            top_mods = await self.run_read(self.get_top_moderators, ctx.guild.id, 5)
+        except asyncio.TimeoutError:
+            await ctx.send(READ_TIMEOUT_MESSAGE)
+            return
+        stats_7d = windows.get(7, {})
+        stats_30d = windows.get(30, {})
 
         embed = discord.Embed(
             title="🔐 Статистика верификаций",
@@ -348,9 +846,8 @@ class StatsCog(commands.Cog):
 
         # Текущая конфигурация
         try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            level = config.get("VERIFICATION_LEVEL", "?")
+            config = get_guild_config(ctx.guild.id)
+            level = config.verification_level if config else "не настроен"
             embed.add_field(
                 name="⚙️ Текущие настройки",
                 value=f"Уровень верификации: **{level}**",
@@ -375,7 +872,11 @@ class StatsCog(commands.Cog):
             await ctx.send("❌ Укажите количество от 1 до 50.")
             return
 
-        recent = self.get_recent_verifications(ctx.guild.id, limit)
+        try:
+            recent = await self.run_read(self.get_recent_verifications, ctx.guild.id, limit)
+        except asyncio.TimeoutError:
+            await ctx.send(READ_TIMEOUT_MESSAGE)
+            return
         
         if not recent:
             await ctx.send("📋 Нет данных о недавних верификациях.")
@@ -416,6 +917,56 @@ class StatsCog(commands.Cog):
         embed.set_footer(text=f"Запросил: {ctx.author.name}", icon_url=ctx.author.display_avatar.url)
         await ctx.send(embed=embed)
 
+    @commands.command(name='statscache')
+    @commands.has_permissions(administrator=True)
+    async def stats_cache_info(self, ctx):
+        """
+        Показывает состояние кэша результатов статистики
+        
+        Использование: !statscache
+        """
+        cache = self.cache
+        total = cache.hits + cache.misses
+        hit_rate = round(cache.hits / total * 100, 1) if total else 0
+        await ctx.send(
+            f"🗃️ Кэш статистики: попаданий **{cache.hits}**, промахов **{cache.misses}** ({hit_rate}%), "
+            f"записей **{len(cache)}**, сбросов **{cache.invalidations}**, TTL {cache.ttl:g} с.\n"
+            f"⏱️ Прерванных по таймауту запросов: **{self.read_timeouts}**."
+        )
+
+    @commands.command(name='retention')
+    @commands.has_permissions(administrator=True)
+    async def retention_info(self, ctx, action: str = None):
+        """
+        Срок хранения сырых данных статистики
+
+        Использование: !retention — настройки и итоги последней очистки, !retention run — очистить сейчас
+        """
+        config = get_config()
+        policy = {table: days for table, days in config.retention_days.items()
+                  if table in RETENTION_TABLES and days and days > 0}
+        if not policy:
+            await ctx.send("ℹ️ Срок хранения не задан: все данные хранятся всегда (`RETENTION_DAYS` в config.json).")
+            return
+
+        if action == "run":
+            await ctx.send("🧹 Очистка запущена...")
+            try:
+                await self.apply_retention()
+            except Exception as e:
+                print(f"Ошибка при очистке статистики по сроку хранения: {e}")
+                await ctx.send("❌ Ошибка при очистке. Подробности в консоли бота.")
+                return
+
+        lines = [f"`{table}`: {days:g} дн." for table, days in policy.items()]
+        mode = f"перенос в `{config.retention_archive}`" if config.retention_archive else "удаление"
+        text = f"🧹 Срок хранения ({mode}):\n" + "\n".join(lines)
+        if self.retention_last_run is not None:
+            removed = ", ".join(f"{table}: {count}" for table, count in self.retention_removed.items())
+            text += (f"\nПоследняя очистка {self.retention_last_run.strftime('%d.%m.%Y %H:%M')}: "
+                     f"{removed}; освобождено страниц: {self.retention_vacuumed}.")
+        await ctx.send(text)
+
     @commands.command(name='checkuser', aliases=['userinfo'])
     @commands.has_permissions(manage_roles=True)
     async def check_user(self, ctx, member: discord.Member = None):
@@ -429,30 +980,10 @@ class StatsCog(commands.Cog):
 
         # Получаем данные из БД
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Верификации пользователя
-            cursor.execute('''
-                SELECT status, method, timestamp FROM verifications 
-                WHERE user_id = ? AND guild_id = ?
-                ORDER BY timestamp DESC
-                LIMIT 5
-            ''', (member.id, ctx.guild.id))
-            verifications = cursor.fetchall()
-            
-            # Попытки верификации
-            cursor.execute('''
-                SELECT COUNT(*) FROM verification_attempts 
-                WHERE user_id = ? AND guild_id = ?
-            ''', (member.id, ctx.guild.id))
-            attempts = cursor.fetchone()[0]
-            
-            conn.close()
-        except Exception as e:
-            print(f"Ошибка при проверке пользователя: {e}")
-            verifications = []
-            attempts = 0
+            verifications, attempts = await self.run_read(self.get_user_history, ctx.guild.id, member.id)
+        except asyncio.TimeoutError:
+            await ctx.send(READ_TIMEOUT_MESSAGE)
+            return
 
         # Создаем embed
         embed = discord.Embed(
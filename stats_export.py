@@ -0,0 +1,279 @@
+"""
+Выгрузка истории верификаций для аудита: CSV или JSONL, сжатые gzip-частями
+Используется командой !export и из консоли (без запуска бота):
+
+    python stats_export.py --guild 123456789 --since 2024-01-01 --until 2024-12-31 --format jsonl --out export/
+
+Строки читаются курсором SQLite порциями и проходят через генераторы,
+поэтому в памяти находится не больше одной сжатой части.
+"""
+
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+# Выгружаемые таблицы и их столбцы (в порядке вывода)
+EXPORT_TABLES: Dict[str, Tuple[str, ...]] = {
+    "verifications": ("id", "user_id", "username", "guild_id", "status", "method",
+                      "moderator_id", "moderator_name", "verification_level", "timestamp"),
+    "member_joins": ("id", "user_id", "username", "guild_id", "account_age_days", "timestamp"),
+    "verification_attempts": ("id", "user_id", "guild_id", "success", "timestamp"),
+}
+EXPORT_FORMATS = ("csv", "jsonl")
+FETCH_SIZE = 1000                       # Строк за один fetchmany
+WRITE_CHUNK = 64 * 1024                 # Сколько символов копить перед записью в gzip
+PART_BYTES = 8 * 1024 * 1024            # Размер сжатой части по умолчанию
+PART_MARGIN = 256 * 1024                # Запас: gzip досбрасывает буфер при закрытии части
+
+class ExportPart(NamedTuple):
+    table: str
+    number: int
+    rows: int
+    filename: str
+    data: bytes
+
+def parse_day(value: Optional[str]) -> Optional[str]:
+    """Проверяет дату в формате YYYY-MM-DD; ValueError при ошибке"""
+    if value is None:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+def timestamp_range(since: Optional[str], until: Optional[str]) -> Tuple[str, str]:
+    """
+    Границы по столбцу timestamp (UTC, 'YYYY-MM-DD HH:MM:SS'): [since, until + 1 день).
+    Пустые границы означают всю историю.
+    """
+    start = since or '0000-00-00'
+    if until is None:
+        return start, '9999-99-99'
+    end = datetime.strptime(until, '%Y-%m-%d') + timedelta(days=1)
+    return start, end.strftime('%Y-%m-%d')
+
+def open_export_connection(db_path: str) -> sqlite3.Connection:
+    """Отдельное соединение только для чтения: выгрузка не занимает читателей пула бота"""
+    uri = f"file:{os.path.abspath(db_path)}?mode=ro"
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+def iter_rows(conn: sqlite3.Connection, table: str, guild_id: int, start: str, end: str) -> Iterator[tuple]:
+    """Строки таблицы за период по порядку времени, порциями через курсор"""
+    columns = EXPORT_TABLES[table]
+    cursor = conn.execute(
+        f'SELECT {", ".join(columns)} FROM {table} '
+        f'WHERE guild_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp, id',
+        (guild_id, start, end)
+    )
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+def iter_lines(rows: Iterable[tuple], columns: Tuple[str, ...], fmt: str) -> Iterator[str]:
+    """Строки результата в текстовом виде: CSV или по JSON-объекту на строку"""
+    if fmt == "jsonl":
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n"
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def csv_header(columns: Tuple[str, ...]) -> str:
+    return ",".join(columns) + "\n"
+
+def gzip_parts(lines: Iterable[str], header: str = "", part_bytes: int = PART_BYTES) -> Iterator[Tuple[int, bytes]]:
+    """
+    Сжимает строки в самостоятельные gzip-файлы не больше part_bytes.
+    Каждая часть начинается с header (заголовок CSV), выдаётся (строк, данные).
+    """
+    limit = max(part_bytes - PART_MARGIN, part_bytes // 2)
+    buffer = gz = None
+    pending: List[str] = []
+    pending_size = rows = 0
+
+    def write_pending():
+        nonlocal pending_size
+        gz.write("".join(pending).encode('utf-8'))
+        pending.clear()
+        pending_size = 0
+
+    for line in lines:
+        if gz is None:
+            buffer = io.BytesIO()
+            gz = gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0)
+            pending.append(header)
+            pending_size = len(header)
+            rows = 0
+        pending.append(line)
+        pending_size += len(line)
+        rows += 1
+        if pending_size >= WRITE_CHUNK:
+            write_pending()
+            if buffer.tell() >= limit:
+                gz.close()
+                yield rows, buffer.getvalue()
+                gz = None
+    if gz is not None:
+        write_pending()
+        gz.close()
+        yield rows, buffer.getvalue()
+
+def export_parts(db_path: str, guild_id: int, tables: Iterable[str], since: Optional[str] = None,
+                 until: Optional[str] = None, fmt: str = "csv", part_bytes: int = PART_BYTES) -> Iterator[ExportPart]:
+    """
+    Сжатые части выгрузки по всем таблицам.
+    Все таблицы читаются в одной транзакции, поэтому выгрузка согласована,
+    даже если бот продолжает писать в БД.
+    """
+    start, end = timestamp_range(since, until)
+    period = f"{since or 'start'}_{until or 'now'}"
+    conn = open_export_connection(db_path)
+    try:
+        conn.execute('BEGIN')
+        for table in tables:
+            columns = EXPORT_TABLES[table]
+            lines = iter_lines(iter_rows(conn, table, guild_id, start, end), columns, fmt)
+            header = csv_header(columns) if fmt == "csv" else ""
+            for number, (rows, data) in enumerate(gzip_parts(lines, header, part_bytes), start=1):
+                filename = f"{table}_{guild_id}_{period}.part{number:03}.{fmt}.gz"
+                yield ExportPart(table, number, rows, filename, data)
+    finally:
+        conn.close()
+
+class StatsExportCog(commands.Cog):
+    """Команда !export: история верификаций сервера gzip-вложениями"""
+
+    def __init__(self, bot, db_path: str = 'verification_stats.db'):
+        self.bot = bot
+        self.db_path = db_path
+        # Выгрузки идут по одной: каждая держит открытую транзакцию чтения
+        self._lock = asyncio.Lock()
+
+    @commands.command(name='export')
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    async def export(self, ctx, table: str = "all", since: str = None, until: str = None, fmt: str = "csv"):
+        """
+        Выгружает историю верификаций сервера
+
+        Использование: !export [verifications|member_joins|verification_attempts|all] [с YYYY-MM-DD] [по YYYY-MM-DD] [csv|jsonl]
+        Пример: !export all 2024-01-01 2024-12-31 jsonl
+        """
+        if table != "all" and table not in EXPORT_TABLES:
+            await ctx.send(f"❌ Неизвестная таблица. Доступны: {', '.join(EXPORT_TABLES)}, all.")
+            return
+        if fmt not in EXPORT_FORMATS:
+            await ctx.send("❌ Формат должен быть csv или jsonl.")
+            return
+        try:
+            since, until = parse_day(since), parse_day(until)
+        except ValueError:
+            await ctx.send("❌ Даты указываются в формате YYYY-MM-DD.")
+            return
+        if since and until and since > until:
+            await ctx.send("❌ Начало периода позже конца.")
+            return
+        if self._lock.locked():
+            await ctx.send("⏳ Уже выполняется другая выгрузка. Попробуйте позже.")
+            return
+
+        tables = list(EXPORT_TABLES) if table == "all" else [table]
+        part_bytes = min(PART_BYTES, ctx.guild.filesize_limit)
+        period = f"{since or 'начало'} — {until or 'сегодня'}"
+
+        async with self._lock:
+            print(f"Выгрузка {', '.join(tables)} сервера {ctx.guild.id} ({period}) запрошена {ctx.author.name}")
+            status = await ctx.send(f"📦 Выгрузка {', '.join(tables)} за период {period} ({fmt})...")
+            parts = export_parts(self.db_path, ctx.guild.id, tables, since, until, fmt, part_bytes)
+            totals: Dict[str, int] = {name: 0 for name in tables}
+            files = 0
+            try:
+                while True:
+                    # Очередная часть читается и сжимается в потоке, event loop не блокируется
+                    part = await asyncio.to_thread(next, parts, None)
+                    if part is None:
+                        break
+                    await ctx.send(f"`{part.table}` часть {part.number}: {part.rows} строк",
+                                   file=discord.File(io.BytesIO(part.data), filename=part.filename))
+                    totals[part.table] += part.rows
+                    files += 1
+            except (sqlite3.Error, discord.HTTPException) as e:
+                print(f"Ошибка при выгрузке истории сервера {ctx.guild.id}: {e}")
+                await status.edit(content=f"❌ Выгрузка прервана (отправлено файлов: {files}): {e}")
+                return
+            finally:
+                await asyncio.to_thread(parts.close)
+
+        summary = ", ".join(f"{name}: {count}" for name, count in totals.items())
+        if files:
+            await status.edit(content=f"✅ Выгрузка завершена, файлов: {files} ({summary}).")
+        else:
+            await status.edit(content=f"📭 За период {period} нет данных.")
+
+async def setup(bot):
+    await bot.add_cog(StatsExportCog(bot))
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка истории верификаций (CSV/JSONL, gzip-части)")
+    parser.add_argument("--db", default="verification_stats.db", help="путь к БД статистики")
+    parser.add_argument("--guild", type=int, required=True, help="ID сервера")
+    parser.add_argument("--since", type=parse_day, help="начало периода, YYYY-MM-DD (включительно)")
+    parser.add_argument("--until", type=parse_day, help="конец периода, YYYY-MM-DD (включительно)")
+    parser.add_argument("--tables", nargs="+", choices=list(EXPORT_TABLES), default=list(EXPORT_TABLES),
+                        help="какие таблицы выгружать")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", dest="fmt")
+    parser.add_argument("--out", default=".", help="папка для .gz-частей")
+    parser.add_argument("--part-mb", type=float, default=PART_BYTES / (1024 * 1024), help="размер части (МБ)")
+    parser.add_argument("--stdout", action="store_true",
+                        help="вывести строки без сжатия в stdout (например, для передачи в другую программу)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"БД не найдена: {args.db}")
+    if args.stdout and len(args.tables) > 1:
+        parser.error("--stdout выводит одну таблицу: укажите её в --tables")
+
+    if args.stdout:
+        start, end = timestamp_range(args.since, args.until)
+        conn = open_export_connection(args.db)
+        try:
+            columns = EXPORT_TABLES[args.tables[0]]
+            if args.fmt == "csv":
+                sys.stdout.write(csv_header(columns))
+            sys.stdout.writelines(iter_lines(iter_rows(conn, args.tables[0], args.guild, start, end), columns, args.fmt))
+        finally:
+            conn.close()
+        return
+
+    os.makedirs(args.out, exist_ok=True)
+    totals: Dict[str, int] = {}
+    for part in export_parts(args.db, args.guild, args.tables, args.since, args.until, args.fmt,
+                             int(args.part_mb * 1024 * 1024)):
+        path = os.path.join(args.out, part.filename)
+        with open(path, 'wb') as f:
+            f.write(part.data)
+        totals[part.table] = totals.get(part.table, 0) + part.rows
+        print(f"💾 {path}: {part.rows} строк, {len(part.data) / (1024 * 1024):.1f} МБ")
+
+    if not totals:
+        print("📭 За указанный период нет данных.")
+    else:
+        print("✅ Готово: " + ", ".join(f"{table} — {rows}" for table, rows in totals.items()))
+
+if __name__ == "__main__":
+    main()
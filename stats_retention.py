@@ -0,0 +1,120 @@
+"""
+Срок хранения сырых данных статистики
+Просроченные строки удаляются (или переносятся в архивную БД) небольшими
+пачками, каждая в своей короткой транзакции, после чего освободившиеся
+страницы постепенно возвращаются системе (PRAGMA incremental_vacuum).
+
+Дневные агрегаты и итоги модераторов обновляются только триггерами на вставку,
+поэтому удаление сырых строк их не меняет: !stats и топ модераторов остаются
+верными за всю историю.
+
+Перевод большой существующей БД в режим incremental vacuum требует полного
+VACUUM, его лучше выполнить при остановленном боте:
+
+    python stats_retention.py --db verification_stats.db --enable-incremental-vacuum
+"""
+
+import argparse
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+# Таблицы с сырыми событиями, для которых задаётся срок хранения
+RETENTION_TABLES = ("verifications", "member_joins", "verification_attempts")
+PRUNE_BATCH = 500                       # Строк за одну транзакцию удаления
+PRUNE_PAUSE = 0.05                      # Пауза между пачками (секунды), чтобы успевали обычные записи
+VACUUM_PAGES = 256                      # Страниц за один шаг incremental_vacuum
+AUTO_VACUUM_CONVERT_MAX = 64 * 1024 * 1024  # До какого размера БД переводится в incremental vacuum при запуске
+AUTO_VACUUM_INCREMENTAL = 2
+
+ARCHIVE_SCHEMA = "archive"
+
+def retention_cutoff(days: float) -> str:
+    """Граница хранения в формате столбца timestamp (UTC): всё, что раньше, просрочено"""
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+def attach_archive(conn: sqlite3.Connection, path: str):
+    """Подключает архивную БД и создаёт в ней таблицы с теми же столбцами"""
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (path,))
+    for table in RETENTION_TABLES:
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{table} AS SELECT * FROM main.{table} WHERE 0')
+
+def detach_archive(conn: sqlite3.Connection):
+    conn.execute(f"DETACH DATABASE {ARCHIVE_SCHEMA}")
+
+def prune_batch(conn: sqlite3.Connection, table: str, cutoff: str, batch: int = PRUNE_BATCH,
+                archive: bool = False) -> int:
+    """
+    Удаляет (при archive=True — сначала копирует в архив) до batch самых старых
+    просроченных строк одной транзакцией. Возвращает число удалённых строк.
+
+    Строки выбираются по индексу на timestamp, так что пачка читает только себя.
+    Архивная БД в режиме WAL коммитится отдельно от основной: при сбое строка
+    может попасть в архив дважды, но не потеряется.
+    """
+    if table not in RETENTION_TABLES:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    expired = f'SELECT id FROM main.{table} WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?'
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if archive:
+            conn.execute(f'INSERT INTO {ARCHIVE_SCHEMA}.{table} SELECT * FROM main.{table} WHERE id IN ({expired})',
+                         (cutoff, batch))
+        deleted = conn.execute(f'DELETE FROM main.{table} WHERE id IN ({expired})', (cutoff, batch)).rowcount
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+    return deleted
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int = VACUUM_PAGES) -> int:
+    """Возвращает системе до pages свободных страниц; 0 — нечего освобождать или режим выключен"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        return 0
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if not free:
+        return 0
+    # execute() делает только один шаг запроса, а каждый шаг этой прагмы освобождает
+    # одну страницу; executescript выполняет её до конца
+    conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+    return free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+def database_size(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+
+def enable_incremental_vacuum(conn: sqlite3.Connection, max_bytes: int = None) -> bool:
+    """
+    Переводит БД в режим auto_vacuum=INCREMENTAL (требует полного VACUUM).
+    При max_bytes большие БД не трогаются — возвращается False.
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return True
+    if max_bytes is not None and database_size(conn) > max_bytes:
+        return False
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание БД статистики")
+    parser.add_argument("--db", default="verification_stats.db", help="путь к БД статистики")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="перевести БД в режим incremental vacuum (полный VACUUM, бот должен быть остановлен)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"БД не найдена: {args.db}")
+    if not args.enable_incremental_vacuum:
+        parser.error("укажите действие, например --enable-incremental-vacuum")
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        before = database_size(conn)
+        print(f"⏳ VACUUM {args.db} ({before / (1024 * 1024):.1f} МБ)...")
+        enable_incremental_vacuum(conn)
+        print(f"✅ Готово: {database_size(conn) / (1024 * 1024):.1f} МБ, режим incremental vacuum включён")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Проверка хранилища кодов верификации (code_store.py)
+"""
+
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import code_store
+from code_store import PendingCodeStore
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время для code_store: clock.now двигается вручную"""
+    fake = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(code_store, "time", SimpleNamespace(time=lambda: fake.now))
+    return fake
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "codes.db")
+
+def saved_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return sorted(conn.execute('SELECT guild_id, user_id, token FROM verification_codes'))
+
+def test_ttl_expiry_on_get(clock, db_path):
+    store = PendingCodeStore(db_path, ttl=60)
+    store.set(1, 10, "AAAA")
+    clock.now += 59
+    assert store.get(1, 10) == "AAAA"
+    assert store.pending_guilds(10) == [1]
+
+    clock.now += 1                         # Срок истекает ровно через ttl
+    assert store.get(1, 10) is None
+    assert store.pending_guilds(10) == []
+    assert len(store) == 0
+    store.close()
+    assert saved_rows(db_path) == []
+
+def test_sweep_removes_only_expired(clock, db_path):
+    store = PendingCodeStore(db_path, ttl=60)
+    store.set(1, 10, "AAAA")
+    clock.now += 30
+    store.set(1, 11, "BBBB")
+    store.set(2, 10, "CCCC")
+    clock.now += 30
+    assert store.sweep() == 1
+    assert store.get(1, 10) is None
+    assert store.pending_guilds(10) == [2]
+    assert store.get(1, 11) == "BBBB"
+    store.close()
+    assert saved_rows(db_path) == [(1, 11, "BBBB"), (2, 10, "CCCC")]
+
+def test_max_entries_evicts_oldest(clock, db_path):
+    store = PendingCodeStore(db_path, ttl=60, max_entries=3)
+    for user_id in range(5):
+        store.set(1, user_id, f"T{user_id}")
+        clock.now += 1
+    assert len(store) == 3
+    assert [store.get(1, user_id) for user_id in range(5)] == [None, None, "T2", "T3", "T4"]
+
+    # Повторная выдача кода делает запись самой свежей
+    store.set(1, 2, "NEW2")
+    store.set(1, 5, "T5")
+    assert [store.get(1, user_id) for user_id in (2, 3, 4, 5)] == ["NEW2", None, "T4", "T5"]
+    store.close()
+    assert saved_rows(db_path) == [(1, 2, "NEW2"), (1, 4, "T4"), (1, 5, "T5")]
+
+def test_reload_keeps_live_codes(clock, db_path):
+    store = PendingCodeStore(db_path, ttl=60)
+    store.set(1, 10, "AAAA")
+    store.set(2, 10, "BBBB")
+    clock.now += 30
+    store.set(1, 11, "CCCC")
+    assert store.pop(2, 10) == "BBBB"
+    assert store.pop(2, 10) is None
+    store.close()
+
+    clock.now += 40                        # Код AAAA истёк, CCCC ещё действует
+    reloaded = PendingCodeStore(db_path, ttl=60, max_entries=1)
+    assert len(reloaded) == 1
+    assert reloaded.get(1, 11) == "CCCC"
+    assert reloaded.pending_guilds(10) == []
+    reloaded.close()
@@ -0,0 +1,50 @@
+"""
+Проверка настроек серверов (config_store.py)
+"""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from config_store import GuildConfigStore
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "guilds.db")
+
+def saved_overrides(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return dict(conn.execute('SELECT guild_id, verification_level FROM guild_level_overrides'))
+
+def test_level_override_does_not_wait_for_lock(db_path):
+    store = GuildConfigStore(db_path)
+    store.update(1, verification_level=2)
+
+    # Другое соединение (например, очистка статистики) держит блокировку записи
+    blocker = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    blocker.execute('BEGIN IMMEDIATE')
+    release = threading.Timer(0.5, blocker.execute, ('COMMIT',))
+    release.start()
+    try:
+        started = time.monotonic()
+        store.set_level_override(1, 3)
+        assert time.monotonic() - started < 0.1
+        # Временный уровень действует сразу, настройки сервера не меняются
+        assert store.get(1).verification_level == 3
+        assert store.get_base(1).verification_level == 2
+    finally:
+        release.join()
+        blocker.close()
+
+    store.close()
+    assert saved_overrides(db_path) == {1: 3}
+
+    reopened = GuildConfigStore(db_path)
+    assert reopened.level_overrides() == {1: 3}
+    assert reopened.clear_level_override(1)
+    assert not reopened.clear_level_override(1)
+    assert reopened.get(1).verification_level == 2
+    reopened.close()
+    assert saved_overrides(db_path) == {}
@@ -0,0 +1,68 @@
+"""
+Проверка конвейера входов (join_pipeline.py)
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from join_pipeline import JoinPipeline, RouteLimiter
+
+def member(guild_id: int, number: int):
+    return SimpleNamespace(guild=SimpleNamespace(id=guild_id), name=f"{guild_id}-{number}")
+
+def test_raid_does_not_stall_other_guilds():
+    async def run():
+        # Лимит смены ролей как у бота: 10 в секунду на сервер
+        limiter = RouteLimiter({"roles": (10, 1.0)})
+        loop = asyncio.get_running_loop()
+        done = {}
+
+        async def handler(joined):
+            await limiter.acquire("roles", joined.guild.id)
+            done[joined.name] = loop.time()
+
+        pipeline = JoinPipeline(handler, workers=4)
+        started = loop.time()
+        for number in range(30):
+            pipeline.submit(member(1, number))
+        pipeline.submit(member(2, 0))
+        pipeline.start()
+        await pipeline.stop()
+        return {name: at - started for name, at in done.items()}, pipeline
+
+    done, pipeline = asyncio.run(run())
+    assert pipeline.processed == 31
+    # Рейд на сервере 1 обрабатывается ~2 с, вход на сервере 2 — без ожидания его хвоста
+    assert done["1-29"] > 1.5
+    assert done["2-0"] < 0.5
+
+def test_order_within_guild_and_round_robin():
+    async def run():
+        order = []
+
+        async def handler(joined):
+            order.append(joined.name)
+
+        pipeline = JoinPipeline(handler, workers=1)
+        for guild_id, number in [(1, 0), (1, 1), (1, 2), (2, 0), (2, 1), (3, 0)]:
+            pipeline.submit(member(guild_id, number))
+        pipeline.start()
+        await pipeline.stop()
+        return order
+
+    assert asyncio.run(run()) == ["1-0", "2-0", "3-0", "1-1", "2-1", "1-2"]
+
+def test_queue_limit():
+    async def run():
+        async def handler(joined):
+            pass
+
+        pipeline = JoinPipeline(handler, workers=1, maxsize=2)
+        results = [pipeline.submit(member(1, number)) for number in range(3)]
+        pipeline.start()
+        await pipeline.stop()
+        return results, pipeline
+
+    results, pipeline = asyncio.run(run())
+    assert results == [True, True, False]
+    assert (pipeline.processed, pipeline.dropped) == (2, 1)
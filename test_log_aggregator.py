@@ -0,0 +1,111 @@
+"""
+Проверка пачечной отправки логов (log_aggregator.py)
+"""
+
+import asyncio
+
+import discord
+
+from log_aggregator import MAX_EMBEDS_PER_MESSAGE, SUMMARY_CHUNK_CHARS, LogAggregator, LogEvent
+
+DESCRIPTION_LIMIT = 4096    # Лимит Discord на описание embed
+EMBED_TOTAL_LIMIT = 6000    # ... и на весь текст embed
+
+class FakeChannel:
+    def __init__(self, channel_id: int = 1, fail: bool = False):
+        self.id = channel_id
+        self.fail = fail
+        self.sent = []
+
+    async def send(self, embed=None, embeds=None):
+        if self.fail:
+            raise discord.HTTPException(FakeResponse(), "недоступен")
+        self.sent.append(embeds if embeds is not None else [embed])
+
+class FakeResponse:
+    status = 500
+    reason = "Internal Server Error"
+
+def events(count: int, length: int = 20):
+    return [LogEvent(discord.Embed(title=str(i)), f"{i:05d}".ljust(length, "x")) for i in range(count)]
+
+def assert_within_limits(embeds):
+    for embed in embeds:
+        assert len(embed.description) <= DESCRIPTION_LIMIT
+        assert len(embed) <= EMBED_TOTAL_LIMIT
+
+def test_summary_fits_one_embed():
+    embeds = LogAggregator._summary_embeds(events(50))
+    assert len(embeds) == 1
+    assert embeds[0].title == "📊 Сводка верификаций: 50 событий"
+    assert embeds[0].description.splitlines() == [event.summary for event in events(50)]
+
+def test_summary_split_at_limit():
+    # 100 строк по 99 символов + перевод строки: ровно 39 строк в части
+    batch = events(100, length=99)
+    embeds = LogAggregator._summary_embeds(batch)
+    assert [len(embed.description.splitlines()) for embed in embeds] == [39, 39, 22]
+    assert [embed.title for embed in embeds] == [f"📊 Сводка верификаций: 100 событий (часть {i}/3)"
+                                                 for i in (1, 2, 3)]
+    # Ни одна строка не потеряна и порядок сохранён
+    lines = [line for embed in embeds for line in embed.description.splitlines()]
+    assert lines == [event.summary for event in batch]
+    assert_within_limits(embeds)
+
+def test_summary_exact_boundary():
+    # Строки ровно по лимиту части: каждая в отдельном embed
+    embeds = LogAggregator._summary_embeds(events(3, length=SUMMARY_CHUNK_CHARS - 1))
+    assert len(embeds) == 3
+    embeds = LogAggregator._summary_embeds(events(2, length=SUMMARY_CHUNK_CHARS // 2 - 1))
+    assert len(embeds) == 1
+    assert len(embeds[0].description) == SUMMARY_CHUNK_CHARS - 1
+
+def test_summary_long_line_truncated():
+    embeds = LogAggregator._summary_embeds(events(2, length=10_000))
+    assert len(embeds) == 2
+    assert all(len(embed.description) == SUMMARY_CHUNK_CHARS for embed in embeds)
+    assert_within_limits(embeds)
+
+def test_flush_small_batch_as_embeds():
+    async def run():
+        aggregator = LogAggregator()
+        channel, other = FakeChannel(1), FakeChannel(2)
+        for event in events(MAX_EMBEDS_PER_MESSAGE):
+            aggregator.add(channel, event.embed, event.summary)
+        aggregator.add(other, discord.Embed(title="x"), "x")
+        assert aggregator.queued == MAX_EMBEDS_PER_MESSAGE + 1
+        await aggregator.flush()
+        return aggregator, channel, other
+
+    aggregator, channel, other = asyncio.run(run())
+    assert [len(message) for message in channel.sent] == [MAX_EMBEDS_PER_MESSAGE]
+    assert len(other.sent) == 1
+    assert (aggregator.queued, aggregator.sent_events, aggregator.sent_messages) == (0, 11, 2)
+
+def test_flush_burst_as_summary():
+    async def run():
+        aggregator = LogAggregator()
+        channel = FakeChannel()
+        for event in events(200, length=99):
+            aggregator.add(channel, event.embed, event.summary)
+        await aggregator.flush()
+        return aggregator, channel
+
+    aggregator, channel = asyncio.run(run())
+    assert len(channel.sent) == 6          # 200 строк по 39 в части
+    assert all(embed.title.startswith("📊") for message in channel.sent for embed in message)
+    assert (aggregator.sent_events, aggregator.sent_messages) == (200, 6)
+
+def test_overflow_and_send_errors_are_dropped(capsys):
+    async def run():
+        aggregator = LogAggregator(max_pending=5)
+        channel = FakeChannel(fail=True)
+        for event in events(8):
+            aggregator.add(channel, event.embed, event.summary)
+        await aggregator.flush()
+        return aggregator
+
+    aggregator = asyncio.run(run())
+    assert aggregator.dropped == 3 + 5
+    assert aggregator.sent_events == 0
+    assert "Ошибка при отправке логов (5 событий)" in capsys.readouterr().out
@@ -0,0 +1,123 @@
+"""
+Проверка кодировщика QR (qr_render.py) на эталонных векторах
+Матрицы и их хэши получены пакетом qrcode (уровень коррекции M, байтовый режим,
+та же маска), таблицы битов формата и версии — из стандарта ISO/IEC 18004.
+"""
+
+import hashlib
+import struct
+import zlib
+
+import pytest
+
+from qr_render import QRCode, render_png, MODULE_PIXELS, QUIET_ZONE
+
+# "AB12CD34", версия 1, маска 2
+MATRIX_AB12CD34 = """\
+#######.......#######
+#.....#..####.#.....#
+#.###.#.###...#.###.#
+#.###.#.#.....#.###.#
+#.###.#.#..##.#.###.#
+#.....#.#.#.#.#.....#
+#######.#.#.#.#######
+........##.##........
+#.#####..##.#.#####..
+#...##..###.##..#.#..
+.....###..##...#...#.
+.##.##.#........#.##.
+...#.##.##.#...#.#...
+........##.####.#.#..
+#######..#..#.##.###.
+#.....#.#.######..#..
+#.###.#.#.#.#....#..#
+#.###.#.#...#..#..#..
+#.###.#.####.#.......
+#.....#.........###..
+#######.##.#.#.#..##."""
+
+# (данные, маска, версия, sha256 матрицы в виде строк из '#' и '.')
+MATRIX_HASHES = [
+    (b"https://discord.com/verify/ABCDEFGH", 4, 3,
+     "42baf4e979ec3d3eb34cd3a6c15be52cf6a84327e89e7253372bd80f3c433c1a"),
+    (b"X" * 100, 5, 6, "d2792a2438fd96a53b8a1031d52b87c845bbaacad5a2a8c8ccd545567809e993"),
+    (b"Z" * 130, 0, 8, "bfc1947d5710799eeb5a08e286dbbe5e3b45d3f720789a4f2962eff063d40e5b"),
+    (b"Y" * 200, 6, 10, "32ce220fe7bf445cb8f6393b8b1377c30cf163ac67192690b3f6fc8f072e57d3"),
+]
+
+# Биты формата для уровня M по маскам (старший бит первый)
+FORMAT_BITS_M = ["101010000010010", "101000100100101", "101111001111100", "101101101001011",
+                 "100010111111001", "100000011001110", "100111110010111", "100101010100000"]
+
+# Биты версии (старший бит первый)
+VERSION_BITS = {7: "000111110010010100", 8: "001000010110111100",
+                9: "001001101010011001", 10: "001010010011010011"}
+
+# Наибольшая длина данных (байт) для версий 1-10 при уровне M
+CAPACITY_M = [14, 26, 42, 62, 84, 106, 122, 152, 180, 213]
+
+def matrix_text(qr: QRCode) -> str:
+    return "\n".join("".join("#" if dark else "." for dark in row) for row in qr.modules)
+
+def read_format_bits(qr: QRCode) -> str:
+    """Биты формата из копии рядом с левым верхним искателем"""
+    positions = [(8, i) for i in range(6)] + [(8, 7), (8, 8), (7, 8)] + [(14 - i, 8) for i in range(9, 15)]
+    value = sum(qr.modules[y][x] << i for i, (x, y) in enumerate(positions))
+    return format(value, "015b")
+
+def test_matrix_version_1():
+    qr = QRCode(b"AB12CD34", mask=2)
+    assert (qr.version, qr.size) == (1, 21)
+    assert matrix_text(qr) == MATRIX_AB12CD34
+
+@pytest.mark.parametrize("data, mask, version, digest", MATRIX_HASHES)
+def test_matrix_hashes(data, mask, version, digest):
+    qr = QRCode(data, mask=mask)
+    assert qr.version == version
+    assert hashlib.sha256(matrix_text(qr).encode()).hexdigest() == digest
+
+@pytest.mark.parametrize("mask", range(8))
+def test_format_bits(mask):
+    qr = QRCode(b"GLISTBOT", mask=mask)
+    assert read_format_bits(qr) == FORMAT_BITS_M[mask]
+    # Вторая копия: правый верхний и левый нижний углы
+    size = qr.size
+    positions = [(size - 1 - i, 8) for i in range(8)] + [(8, size - 15 + i) for i in range(8, 15)]
+    value = sum(qr.modules[y][x] << i for i, (x, y) in enumerate(positions))
+    assert format(value, "015b") == FORMAT_BITS_M[mask]
+    assert qr.modules[size - 8][8]   # Всегда тёмный модуль
+
+@pytest.mark.parametrize("version", sorted(VERSION_BITS))
+def test_version_bits(version):
+    qr = QRCode(b"V" * CAPACITY_M[version - 1], mask=0)
+    assert qr.version == version
+    size = qr.size
+    top_right = sum(qr.modules[i // 3][size - 11 + i % 3] << i for i in range(18))
+    bottom_left = sum(qr.modules[size - 11 + i % 3][i // 3] << i for i in range(18))
+    assert format(top_right, "018b") == format(bottom_left, "018b") == VERSION_BITS[version]
+
+def test_version_capacity():
+    for version, capacity in enumerate(CAPACITY_M, start=1):
+        assert QRCode._choose_version(capacity) == version
+        if version < len(CAPACITY_M):
+            assert QRCode._choose_version(capacity + 1) == version + 1
+    with pytest.raises(ValueError):
+        QRCode._choose_version(CAPACITY_M[-1] + 1)
+
+def test_automatic_mask_is_reproducible():
+    assert QRCode(b"AB12CD34").mask == QRCode(b"AB12CD34").mask
+    assert matrix_text(QRCode(b"AB12CD34")) == matrix_text(QRCode(b"AB12CD34", mask=QRCode(b"AB12CD34").mask))
+
+def test_png_header_and_pixels():
+    png = render_png("AB12CD34")
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    width, height, depth, color = struct.unpack(">IIBB", png[16:26])
+    side = (21 + 2 * QUIET_ZONE) * MODULE_PIXELS
+    assert (width, height, depth, color) == (side, side, 8, 0)
+
+    # Данные IDAT: строки с байтом фильтра, первая строка — белая рамка
+    idat = png[png.index(b"IDAT") + 4:]
+    length = struct.unpack(">I", png[png.index(b"IDAT") - 4:png.index(b"IDAT")])[0]
+    raw = zlib.decompress(idat[:length])
+    assert len(raw) == side * (side + 1)
+    assert set(raw[1:side + 1]) == {255}
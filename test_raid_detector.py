@@ -0,0 +1,109 @@
+"""
+Проверка обнаружения рейдов (raid_detector.py)
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from raid_detector import (WINDOW_MAX_JOINS, JoinSample, JoinWindow, RaidDetector, RaidThresholds,
+                           WindowStats, name_key, raid_reasons)
+
+NOW = datetime.now(timezone.utc)
+YOUNG = NOW - timedelta(days=1)
+OLD = NOW - timedelta(days=400)
+
+THRESHOLDS = RaidThresholds(window=60, min_joins=10, burst_joins=30, young_days=7,
+                            young_share=0.6, no_avatar_share=0.8, name_cluster=5)
+
+@pytest.mark.parametrize("username, key", [
+    ("raider01", "raider"),
+    ("RaiderX_99", "raider"),
+    ("raid.er", "raider"),
+    ("ab12", ""),              # Скелет короче NAME_MIN
+    ("123456", ""),
+    ("Bob", "bob"),
+])
+def test_name_key(username, key):
+    assert name_key(username) == key
+
+def test_window_counters_follow_expiry():
+    window = JoinWindow()
+    window.add(JoinSample(0, True, True, "raider"))
+    window.add(JoinSample(10, True, False, "raider"))
+    window.add(JoinSample(20, False, True, ""))
+    window.add(JoinSample(30, False, False, "norman"))
+    assert window.stats() == WindowStats(4, 2, 2, 2, "raider")
+
+    window.expire(now=70, window=60)       # Уходит запись с at=0
+    assert window.stats() == WindowStats(3, 1, 1, 1, window.stats().cluster_name)
+    assert window.names == {"raider": 1, "norman": 1}
+
+    window.expire(now=85, window=60)       # Уходят 10 и 20; граница окна включительно
+    assert window.stats() == WindowStats(1, 0, 0, 1, "norman")
+    assert "raider" not in window.names
+
+    window.expire(now=1000, window=60)
+    assert window.stats() == WindowStats(0, 0, 0, 0, "")
+
+def test_window_capped():
+    window = JoinWindow()
+    for at in range(WINDOW_MAX_JOINS + 5):
+        window.add(JoinSample(at, at < 5, False, "raider"))
+    stats = window.stats()
+    assert stats.joins == WINDOW_MAX_JOINS
+    assert stats.young == 0                # Самые старые (молодые аккаунты) вытеснены
+    assert stats.cluster == WINDOW_MAX_JOINS
+    assert window.samples[0].at == 5
+
+def test_reasons():
+    assert raid_reasons(WindowStats(9, 9, 9, 9, "raider"), THRESHOLDS) == []
+    assert len(raid_reasons(WindowStats(10, 6, 8, 5, "raider"), THRESHOLDS)) == 3
+    assert raid_reasons(WindowStats(10, 5, 7, 4, "raider"), THRESHOLDS) == []
+    # Всплеск срабатывает сам по себе
+    assert raid_reasons(WindowStats(30, 0, 0, 1, "bob"), THRESHOLDS) == ["30 входов за 60 с"]
+    assert WindowStats(0, 0, 0, 0, "").share(0) == 0.0
+
+def test_observe_trips_on_young_share():
+    detector = RaidDetector()
+    for i in range(9):
+        assert detector.observe(1, YOUNG, True, f"user{i}x", THRESHOLDS, now=i) == []
+    reasons = detector.observe(1, YOUNG, True, "raider", THRESHOLDS, now=9)
+    assert len(reasons) == 2               # Молодые аккаунты и без аватара
+    # Другой сервер не затронут
+    assert detector.stats(2, THRESHOLDS, now=9).joins == 0
+    # Через окно старые входы вытеснены
+    assert detector.observe(1, OLD, True, "raider", THRESHOLDS, now=100) == []
+    assert detector.stats(1, THRESHOLDS, now=100).joins == 1
+
+def test_observe_name_cluster():
+    detector = RaidDetector()
+    for i in range(9):
+        username = f"raider{i}" if i % 2 else f"{chr(97 + i) * 4}{i}"
+        detector.observe(1, OLD, True, username, THRESHOLDS, now=i)
+    # Десятый вход: пятое имя с тем же скелетом, аккаунты старые и с аватарами
+    reasons = detector.observe(1, OLD, True, "Raider_X", THRESHOLDS, now=9)
+    assert reasons == ["похожие имена «raider…»: 5"]
+
+def test_trip_and_cooldown():
+    detector = RaidDetector()
+    assert detector.trip(1, "pause_dm", previous_level=2, now=100)
+    assert not detector.trip(1, "level3", previous_level=1, now=200)
+    state = detector.active[1]
+    # Повторное срабатывание продлевает режим, не меняя действие и исходный уровень
+    assert (state.action, state.started, state.last_trip, state.previous_level) == ("pause_dm", 100, 200, 2)
+    assert detector.dm_paused(1) and not detector.dm_paused(2)
+
+    assert detector.expired(cooldown=300, thresholds=THRESHOLDS, now=499) == []
+    assert detector.expired(cooldown=300, thresholds=THRESHOLDS, now=500) == [1]
+    assert detector.end(1) == state
+    assert detector.end(1) is None
+    assert not detector.dm_paused(1)
+    assert detector.trip(1, "level3", now=600)
+
+def test_expired_drops_empty_windows():
+    detector = RaidDetector()
+    detector.observe(1, OLD, False, "bob", THRESHOLDS, now=0)
+    detector.observe(2, OLD, False, "bob", THRESHOLDS, now=50)
+    detector.expired(cooldown=900, thresholds=THRESHOLDS, now=100)
+    assert list(detector._windows) == [2]
@@ -0,0 +1,144 @@
+"""
+Проверка оценки риска заявок (risk_score.py)
+"""
+
+import asyncio
+import json
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from risk_score import (AGE_SCALE_DAYS, ATTEMPTS_SCALE, BURST_SCALE, SQL_CHUNK, WEIGHTS, burst_sizes,
+                        fetch_failed_attempts, score_batch, username_entropy)
+
+NOW = 1_700_000_000.0
+DAY = 86400
+
+def test_burst_sizes_counts_neighbours_in_window():
+    times = [0, 10, 59, 60, 500, 1000, 1030]
+    # Окно ±60 с включительно, сама заявка не считается
+    assert list(burst_sizes(times, window=60)) == [3, 3, 3, 3, 0, 1, 1]
+
+def test_burst_sizes_unsorted_and_duplicates():
+    assert list(burst_sizes([100, 0, 100, 30], window=70)) == [2, 1, 2, 3]
+    assert list(burst_sizes([], window=60)) == []
+
+def test_username_entropy():
+    assert username_entropy("") == 0.0
+    assert username_entropy("aaaa") == 0.0
+    assert username_entropy("abcd") == pytest.approx(2.0)
+    # Регистр не различается
+    assert username_entropy("AbAb") == pytest.approx(1.0)
+
+def test_score_components():
+    scores = score_batch(
+        account_created=[NOW, NOW - AGE_SCALE_DAYS * DAY, NOW - 400 * DAY],
+        requested=[NOW, NOW + 10_000, NOW + 20_000],
+        usernames=["aaaa", "aaaa", "aaaa"],
+        attempts=[0, 0, 0],
+        now=NOW,
+    )
+    # Только возраст: новый аккаунт — полный вес, старше AGE_SCALE_DAYS — ноль
+    assert list(scores) == pytest.approx([100 * WEIGHTS["age"], 0.0, 0.0])
+
+def test_score_burst_attempts_and_entropy():
+    old = NOW - 400 * DAY
+    count = BURST_SCALE + 1
+    scores = score_batch([old] * count, [NOW] * count, ["aaaa"] * count, [0] * count, now=NOW)
+    assert list(scores) == pytest.approx([100 * WEIGHTS["burst"]] * count)
+
+    scores = score_batch([old, old], [NOW, NOW + 10_000], ["aaaa", "xk29fq8zPw"], [3, 0], now=NOW)
+    assert scores[0] == pytest.approx(100 * WEIGHTS["attempts"])
+    assert 0 < scores[1] <= 100 * WEIGHTS["entropy"]
+
+def test_score_bounds_and_order():
+    scores = score_batch(
+        account_created=[NOW + DAY, NOW - 1000 * DAY],   # Дата в будущем не даёт больше 1
+        requested=[NOW, NOW],
+        usernames=["qwertyuiopasdfgh", "bob"],
+        attempts=[50, 0],
+        now=NOW,
+    )
+    assert scores[0] == pytest.approx(100 * (WEIGHTS["age"] + WEIGHTS["attempts"] + WEIGHTS["entropy"]
+                                             + WEIGHTS["burst"] / BURST_SCALE))
+    assert 0 <= scores[1] < scores[0] <= 100
+
+def test_fetch_failed_attempts_chunks():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE verification_attempts (user_id INTEGER, guild_id INTEGER, success INTEGER)")
+    rows = [(user_id, 1, 0) for user_id in range(SQL_CHUNK + 10)]
+    rows += [(5, 1, 0), (5, 1, 1), (5, 2, 0), (SQL_CHUNK + 5, 1, 0)]
+    conn.executemany("INSERT INTO verification_attempts VALUES (?, ?, ?)", rows)
+
+    attempts = fetch_failed_attempts(conn, 1, list(range(SQL_CHUNK + 10)) + [10**9])
+    assert len(attempts) == SQL_CHUNK + 10
+    assert attempts[5] == 2                 # Успешные и чужой сервер не считаются
+    assert attempts[SQL_CHUNK + 5] == 2     # Вторая порция запроса
+    assert 10**9 not in attempts
+
+class FakeBot:
+    """Минимум интерфейса бота для VerificationCog и StatsCog"""
+
+    def __init__(self):
+        self.cogs = {}
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+    def add_view(self, view, message_id=None):
+        pass
+
+class FakeContext:
+    def __init__(self, author):
+        self.author = author
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+@pytest.fixture
+def bot_dir(tmp_path, monkeypatch):
+    """Рабочая папка бота со своими config.json и БД"""
+    import config_store
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "config.json").write_text(json.dumps({"GUILD_ID": 1, "VERIFICATION_LEVEL": 2}), encoding="utf-8")
+    config_store.config_store.reload()
+    config_store.guild_config_store.close()
+    yield tmp_path
+    config_store.guild_config_store.close()
+
+def test_wrong_code_raises_risk(bot_dir):
+    from stats_cog import StatsCog
+    from verification_cog import VerificationCog
+
+    guild_id, user_id = 1, 42
+
+    async def run():
+        bot = FakeBot()
+        stats_cog = StatsCog(bot)
+        await stats_cog.cog_load()
+        cog = VerificationCog(bot)
+        bot.cogs = {'StatsCog': stats_cog, 'VerificationCog': cog}
+        try:
+            cog.manual_requests.add(guild_id, user_id, "bob", NOW - 400 * DAY)
+            cog.codes.set(guild_id, user_id, "AAAA1111")
+            before = await cog.manual_requests.ranked(guild_id, cog.stats_version(guild_id))
+
+            ctx = FakeContext(SimpleNamespace(id=user_id, name="bob"))
+            await cog.code.callback(cog, ctx, "BBBB2222")
+            assert ctx.sent == ["❌ Неверный код."]
+            # Остановка кога дописывает очередь записи в БД
+            await stats_cog.cog_unload()
+
+            after = await cog.manual_requests.ranked(guild_id, cog.stats_version(guild_id))
+            return before[0][0], after[0][0]
+        finally:
+            await asyncio.to_thread(cog.codes.close)
+            await asyncio.to_thread(cog.manual_requests.close)
+
+    before, after = asyncio.run(run())
+    assert after == pytest.approx(before + 100 * WEIGHTS["attempts"] / ATTEMPTS_SCALE)
+    with sqlite3.connect(bot_dir / "verification_stats.db") as conn:
+        assert conn.execute('SELECT user_id, guild_id, success FROM verification_attempts').fetchall() == [(42, 1, 0)]
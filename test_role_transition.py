@@ -0,0 +1,68 @@
+"""
+Проверка смены ролей одним запросом (role_transition.py)
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import role_transition
+from perf_metrics import metrics
+from role_transition import MAX_RETRIES, transition_roles
+
+def role(role_id: int, default: bool = False):
+    return SimpleNamespace(id=role_id, is_default=lambda: default)
+
+class TooManyRequests(discord.HTTPException):
+    def __init__(self):
+        super().__init__(SimpleNamespace(status=429, reason="Too Many Requests"), "rate limited")
+
+class FakeMember:
+    def __init__(self, roles, failures: int = 0):
+        self.roles = roles
+        self.failures = failures
+        self.calls = 0
+
+    async def edit(self, *, roles=None, reason=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise TooManyRequests()
+        self.roles = [self.roles[0], *roles]
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(role_transition, "BASE_BACKOFF", 0.001)
+    metrics.reset()
+    yield
+    metrics.reset()
+
+def transition_histogram(result: str):
+    return next((histogram for name, labels, histogram in metrics.histograms()
+                 if name == "glistbot_role_transition_seconds" and labels == (("result", result),)), None)
+
+def test_single_edit_swaps_roles():
+    everyone, unverified, verified, other = role(1, default=True), role(2), role(3), role(4)
+    member = FakeMember([everyone, unverified, other])
+    asyncio.run(transition_roles(member, add=[verified], remove=[unverified]))
+    assert member.calls == 1
+    assert [r.id for r in member.roles] == [1, 4, 3]
+    assert transition_histogram("ok").count == 1
+
+def test_retries_are_counted_in_latency():
+    member = FakeMember([role(1, default=True), role(2)], failures=2)
+    asyncio.run(transition_roles(member, add=[role(3)], remove=[role(2)]))
+    assert member.calls == 3
+    assert "glistbot_role_transition_retries_total 2" in metrics.render().splitlines()
+    histogram = transition_histogram("ok")
+    # Паузы 0.001 + 0.002 с входят во время смены ролей
+    assert histogram.count == 1 and histogram.sum >= 0.003
+
+def test_gives_up_after_max_retries():
+    member = FakeMember([role(1, default=True), role(2)], failures=MAX_RETRIES + 1)
+    with pytest.raises(discord.HTTPException):
+        asyncio.run(transition_roles(member, add=[role(3)], remove=[role(2)]))
+    assert member.calls == MAX_RETRIES + 1
+    assert transition_histogram("error").count == 1
+    assert transition_histogram("ok") is None
@@ -0,0 +1,21 @@
+"""
+Проверка кэша результатов статистики (StatsResultCache в stats_cog.py)
+"""
+
+from stats_cog import StatsResultCache
+
+def test_put_respects_generation():
+    cache = StatsResultCache(ttl=60)
+    generation = cache.generation(1)
+    cache.invalidate(1)
+    # Результат прочитан до сброса — в кэш не попадает
+    cache.put(1, ('recent', 10), "старый", generation)
+    assert cache.get(1, ('recent', 10)) is None
+
+    cache.put(1, ('recent', 10), "новый", cache.generation(1))
+    cache.put(2, ('recent', 10), "другой сервер", cache.generation(2))
+    assert cache.get(1, ('recent', 10)) == "новый"
+    cache.invalidate(1)
+    assert cache.get(1, ('recent', 10)) is None
+    assert cache.get(2, ('recent', 10)) == "другой сервер"
+    assert (cache.hits, cache.invalidations) == (2, 1)
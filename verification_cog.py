@@ -1,25 +1,36 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ui import View, Button, button
-import json
 import random
 import string
-import urllib.parse
 import os
+import io
+import asyncio
 from datetime import datetime
-
-# --- Вспомогательная функция для обновления JSON ---
-def update_config(key, value):
-    with open('config.json', 'r+') as f:
-        data = json.load(f)
-        data[key] = value
-        f.seek(0)
-        json.dump(data, f, indent=2)
-        f.truncate()
-
-# --- Хранилище временных данных ---
-# В реальном проекте лучше использовать базу данных (например, SQLite)
-pending_verifications = {}
+from config_store import config_store, guild_config_store, get_config, get_guild_config
+from join_pipeline import JoinPipeline, RouteLimiter, WelcomeBatcher
+from log_aggregator import LogAggregator
+from code_store import PendingCodeStore
+from qr_render import qr_cache
+from role_transition import transition_roles
+from member_cache import resolve_member
+from manual_queue import ManualRequestStore, STATUS_APPROVED, STATUS_DENIED, STATUS_LEFT
+from queue_dashboard import QueueDashboardView
+from perf_metrics import metrics, discord_request
+from raid_detector import RaidDetector, RaidThresholds, RAID_ACTIONS
+
+# Что сообщается модераторам о действии при рейде
+RAID_ACTION_TEXT = {
+    "level3": "Уровень верификации переключён на **3** (ручная проверка)",
+    "pause_dm": "Отправка QR-кодов в ЛС приостановлена",
+    "alert": "Только оповещение, настройки не менялись",
+}
+
+# --- QR-код для уровня 2 ---
+async def make_qr_file(token: str) -> discord.File:
+    """PNG с QR-кодом как вложение; генерация (при промахе кэша) идёт вне event loop"""
+    png = await asyncio.to_thread(qr_cache.get, token)
+    return discord.File(io.BytesIO(png), filename="qr.png")
 
 # --- Функция логирования верификаций ---
 async def log_verification(bot, guild_id: int, member: discord.Member, status: str, method: str, moderator: discord.Member = None):
@@ -31,11 +42,16 @@ async def log_verification(bot, guild_id: int, member: discord.Member, status: s
     - method: "команда", "qr-код", "модератор"
     - moderator: модератор (только для ручной верификации)
     """
+    if status == "успешно" and member.joined_at is not None:
+        waited = (datetime.now(member.joined_at.tzinfo) - member.joined_at).total_seconds()
+        metrics.observe("glistbot_join_to_verified_seconds", waited, method=method)
+
     try:
-        with open('config.json', 'r', encoding='utf-8') as f:
-            config = json.load(f)
+        config = get_guild_config(guild_id)
+        if config is None:
+            return
         
-        log_channel_id = config.get("LOG_CHANNEL_ID")
+        log_channel_id = config.log_channel_id
         if not log_channel_id:
             return
         
@@ -64,7 +80,7 @@ async def log_verification(bot, guild_id: int, member: discord.Member, status: s
         embed.add_field(name="ID", value=str(member.id), inline=True)
         embed.add_field(name="Статус", value=status.capitalize(), inline=True)
         embed.add_field(name="Метод", value=method.capitalize(), inline=True)
-        embed.add_field(name="Уровень", value=str(config.get("VERIFICATION_LEVEL", "?")), inline=True)
+        embed.add_field(name="Уровень", value=str(config.verification_level), inline=True)
         
         if moderator:
             embed.add_field(name="Модератор", value=moderator.mention, inline=True)
@@ -73,7 +89,16 @@ async def log_verification(bot, guild_id: int, member: discord.Member, status: s
         embed.set_footer(text=f"Аккаунт создан")
         embed.timestamp = member.created_at
         
-        await log_channel.send(embed=embed)
+        # Отправка идёт через агрегатор: события копятся и уходят пачками
+        cog = bot.get_cog('VerificationCog')
+        aggregator = getattr(cog, 'log_aggregator', None)
+        if aggregator:
+            summary = f"{emoji} {member.mention} (`{member.id}`) — {method}"
+            if moderator:
+                summary += f", модератор {moderator.mention}"
+            aggregator.add(log_channel, embed, summary)
+        else:
+            await log_channel.send(embed=embed)
         
     except Exception as e:
         print(f"Ошибка при логировании верификации: {e}")
@@ -84,6 +109,38 @@ class ManualVerificationView(View):
         # timeout=None делает кнопки постоянными (не исчезают после перезапуска)
         super().__init__(timeout=None)
 
+    @staticmethod
+    async def _claim_request(interaction: discord.Interaction):
+        """
+        Находит заявку по ID сообщения и захватывает её для обработки.
+        Возвращает (заявка, участник); при неудаче сам отвечает модератору и возвращает (None, None).
+        """
+        store = interaction.client.get_cog('VerificationCog').manual_requests
+        request = await store.by_message(interaction.message.id)
+        if request is not None:
+            member_id = request.user_id
+        else:
+            # Сообщения, отправленные до появления таблицы заявок: ID берётся из подписи embed
+            try:
+                member_id = int(interaction.message.embeds[0].footer.text.split(": ")[1])
+            except (IndexError, ValueError, AttributeError) as e:
+                await interaction.response.send_message("Не удалось найти заявку для этого сообщения.", ephemeral=True)
+                print(f"Ошибка при извлечении ID: {e}")
+                return None, None
+            request = store.get(interaction.guild.id, member_id)
+
+        if request is not None and not store.claim(request):
+            await interaction.response.send_message("ℹ️ Эта заявка уже обработана или обрабатывается.", ephemeral=True)
+            return None, None
+
+        member = await resolve_member(interaction.guild, member_id)
+        if not member:
+            if request is not None:
+                store.resolve(request, STATUS_LEFT)
+            await interaction.response.send_message(f"Пользователь с ID `{member_id}` не найден на сервере.", ephemeral=True)
+            return None, None
+        return request, member
+
     @button(label="Одобрить", style=discord.ButtonStyle.green, custom_id="approve_button")
     async def approve(self, interaction: discord.Interaction, button: Button):
         # Проверка прав модератора
@@ -91,77 +148,57 @@ class ManualVerificationView(View):
             await interaction.response.send_message("❌ У вас недостаточно прав для выполнения этого действия.", ephemeral=True)
             return
 
-        # Извлекаем ID пользователя из сообщения
-        try:
-            member_id = int(interaction.message.embeds[0].footer.text.split(": ")[1])
-            member = interaction.guild.get_member(member_id)
-        except (IndexError, ValueError, AttributeError) as e:
-            await interaction.response.send_message("Не удалось найти ID пользователя в сообщении.", ephemeral=True)
-            print(f"Ошибка при извлечении ID: {e}")
-            return
-
-        if not member:
-            await interaction.response.send_message(f"Пользователь с ID `{member_id}` не найден на сервере.", ephemeral=True)
+        # Заявка находится по ID сообщения (таблица manual_requests)
+        request, member = await self._claim_request(interaction)
+        if member is None:
             return
+        store = interaction.client.get_cog('VerificationCog').manual_requests
 
-        # Загружаем роли из конфига
+        # Загружаем роли из настроек сервера
         try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            config = get_guild_config(interaction.guild.id)
         except Exception as e:
+            if request is not None:
+                store.release(request)
             await interaction.response.send_message("❌ Ошибка при чтении конфигурации.", ephemeral=True)
-            print(f"Ошибка при чтении config.json: {e}")
+            print(f"Ошибка при чтении настроек сервера {interaction.guild.id}: {e}")
             return
 
-        verified_role = interaction.guild.get_role(config["VERIFIED_ROLE_ID"])
-        unverified_role = interaction.guild.get_role(config["UNVERIFIED_ROLE_ID"])
+        verified_role = interaction.guild.get_role(config.verified_role_id) if config else None
+        unverified_role = interaction.guild.get_role(config.unverified_role_id) if config else None
 
         if not verified_role or not unverified_role:
-            await interaction.response.send_message("❌ Ошибка: Роли не найдены. Проверьте ID в конфиге.", ephemeral=True)
+            if request is not None:
+                store.release(request)
+            await interaction.response.send_message("❌ Ошибка: Роли не найдены. Проверьте настройки сервера (`!setup`).", ephemeral=True)
             return
 
+        # Смена ролей с повторами после 429 может занять дольше 3 секунд, отведённых на ответ
+        await interaction.response.defer(ephemeral=True, thinking=True)
         try:
-            await member.add_roles(verified_role, reason=f"Одобрено модератором {interaction.user.name}")
-            await member.remove_roles(unverified_role, reason="Верификация пройдена")
-            await interaction.response.send_message(f"✅ Пользователь {member.mention} был одобрен.", ephemeral=True)
-
-            # Логирование
-            await log_verification(
-                bot=interaction.client,
-                guild_id=interaction.guild.id,
-                member=member,
-                status="успешно",
-                method="модератор",
-                moderator=interaction.user
-            )
-            
-            # Логирование в БД статистики
-            try:
-                stats_cog = interaction.client.get_cog('StatsCog')
-                if stats_cog:
-                    stats_cog.log_verification_to_db(
-                        user_id=member.id,
-                        username=member.name,
-                        guild_id=interaction.guild.id,
-                        status="успешно",
-                        method="модератор",
-                        verification_level=config["VERIFICATION_LEVEL"],
-                        moderator_id=interaction.user.id,
-                        moderator_name=interaction.user.name
-                    )
-            except Exception as e:
-                print(f"Ошибка при логировании в статистику: {e}")
-
-            # Обновляем исходное сообщение
-            new_embed = interaction.message.embeds[0]
-            new_embed.color = discord.Color.green()
-            new_embed.description = f"**Статус: Одобрено**\nМодератор: {interaction.user.mention}"
-            await interaction.message.edit(embed=new_embed, view=None) # Удаляем кнопки
+            await interaction.client.get_cog('VerificationCog').approve_member(
+                member, verified_role, unverified_role, interaction.user, config.verification_level, request)
         except discord.Forbidden:
-            await interaction.response.send_message("❌ У бота недостаточно прав для изменения ролей.", ephemeral=True)
+            if request is not None:
+                store.release(request)
+            await interaction.followup.send("❌ У бота недостаточно прав для изменения ролей.", ephemeral=True)
+            return
         except discord.HTTPException as e:
-            await interaction.response.send_message(f"❌ Ошибка при изменении ролей: {e}", ephemeral=True)
+            if request is not None:
+                store.release(request)
+            await interaction.followup.send(f"❌ Ошибка при изменении ролей: {e}", ephemeral=True)
             print(f"HTTPException при одобрении: {e}")
+            return
+        await interaction.followup.send(f"✅ Пользователь {member.mention} был одобрен.", ephemeral=True)
+
+        # Обновляем исходное сообщение
+        new_embed = interaction.message.embeds[0]
+        new_embed.color = discord.Color.green()
+        new_embed.description = f"**Статус: Одобрено**\nМодератор: {interaction.user.mention}"
+        try:
+            await interaction.message.edit(embed=new_embed, view=None) # Удаляем кнопки
+        except discord.HTTPException as e:
+            print(f"Не удалось обновить сообщение заявки: {e}")
 
     @button(label="Отклонить", style=discord.ButtonStyle.red, custom_id="deny_button")
     async def deny(self, interaction: discord.Interaction, button: Button):
@@ -170,62 +207,36 @@ class ManualVerificationView(View):
             await interaction.response.send_message("❌ У вас недостаточно прав для выполнения этого действия.", ephemeral=True)
             return
 
-        try:
-            member_id = int(interaction.message.embeds[0].footer.text.split(": ")[1])
-            member = interaction.guild.get_member(member_id)
-        except (IndexError, ValueError, AttributeError) as e:
-            await interaction.response.send_message("Не удалось найти ID пользователя в сообщении.", ephemeral=True)
-            print(f"Ошибка при извлечении ID: {e}")
+        request, member = await self._claim_request(interaction)
+        if member is None:
             return
+        store = interaction.client.get_cog('VerificationCog').manual_requests
 
-        if not member:
-            await interaction.response.send_message(f"Пользователь с ID `{member_id}` не найден на сервере.", ephemeral=True)
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            config = get_guild_config(interaction.guild.id)
+            await interaction.client.get_cog('VerificationCog').deny_member(
+                member, interaction.user, config.verification_level if config else 3, request)
+        except discord.Forbidden:
+            if request is not None:
+                store.release(request)
+            await interaction.followup.send("❌ У бота недостаточно прав для кика этого пользователя.", ephemeral=True)
             return
+        except discord.HTTPException as e:
+            if request is not None:
+                store.release(request)
+            await interaction.followup.send(f"❌ Ошибка при кике: {e}", ephemeral=True)
+            print(f"HTTPException при кике: {e}")
+            return
+        await interaction.followup.send(f"❌ Пользователь {member.mention} был кикнут.", ephemeral=True)
 
+        new_embed = interaction.message.embeds[0]
+        new_embed.color = discord.Color.red()
+        new_embed.description = f"**Статус: Отклонено (кик)**\nМодератор: {interaction.user.mention}"
         try:
-            await member.kick(reason=f"Отклонено модератором {interaction.user.name}")
-            await interaction.response.send_message(f"❌ Пользователь {member.mention} был кикнут.", ephemeral=True)
-
-            # Логирование
-            await log_verification(
-                bot=interaction.client,
-                guild_id=interaction.guild.id,
-                member=member,
-                status="отклонено",
-                method="модератор",
-                moderator=interaction.user
-            )
-            
-            # Логирование в БД статистики
-            try:
-                # Загружаем конфиг для получения verification_level
-                with open('config.json', 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                
-                stats_cog = interaction.client.get_cog('StatsCog')
-                if stats_cog:
-                    stats_cog.log_verification_to_db(
-                        user_id=member.id,
-                        username=member.name,
-                        guild_id=interaction.guild.id,
-                        status="отклонено",
-                        method="модератор",
-                        verification_level=config.get("VERIFICATION_LEVEL", 3),
-                        moderator_id=interaction.user.id,
-                        moderator_name=interaction.user.name
-                    )
-            except Exception as e:
-                print(f"Ошибка при логировании в статистику: {e}")
-
-            new_embed = interaction.message.embeds[0]
-            new_embed.color = discord.Color.red()
-            new_embed.description = f"**Статус: Отклонено (кик)**\nМодератор: {interaction.user.mention}"
             await interaction.message.edit(embed=new_embed, view=None)
-        except discord.Forbidden:
-            await interaction.response.send_message("❌ У бота недостаточно прав для кика этого пользователя.", ephemeral=True)
         except discord.HTTPException as e:
-            await interaction.response.send_message(f"❌ Ошибка при кике: {e}", ephemeral=True)
-            print(f"HTTPException при кике: {e}")
+            print(f"Не удалось обновить сообщение заявки: {e}")
 
 # --- Основной класс модуля (Cog) ---
 class VerificationCog(commands.Cog):
@@ -233,6 +244,131 @@ class VerificationCog(commands.Cog):
         self.bot = bot
         # Регистрируем View, чтобы кнопки работали после перезапуска бота
         self.bot.add_view(ManualVerificationView())
+
+        # Конвейер обработки входов (параметры берутся из config.json)
+        config = get_config()
+        self.limiter = RouteLimiter(config.route_limits)
+        self.join_pipeline = JoinPipeline(self.process_join, workers=config.join_workers)
+        self.welcome_batcher = WelcomeBatcher(
+            self.send_welcome,
+            batch_size=config.welcome_batch_size,
+            window=config.welcome_batch_window
+        )
+        self.log_aggregator = LogAggregator(window=config.log_batch_window)
+
+        # Коды QR-верификации (уровень 2) хранятся в SQLite и переживают перезапуск
+        self.codes = PendingCodeStore(ttl=config.code_ttl_hours * 3600, max_entries=config.code_store_max)
+        # Заявки на ручную верификацию (уровень 3): сообщение с кнопками → участник
+        self.manual_requests = ManualRequestStore()
+        # Скользящие окна входов по серверам для обнаружения рейдов
+        self.raid_detector = RaidDetector()
+
+    async def cog_load(self):
+        self.join_pipeline.start()
+        self.log_aggregator.start()
+        self.sweep_codes.start()
+        # Режим рейда, включённый до перезапуска: уровень 3 снимется после RAID_COOLDOWN_MINUTES без срабатываний
+        for guild_id in guild_config_store.level_overrides():
+            base = guild_config_store.get_base(guild_id)
+            self.raid_detector.trip(guild_id, "level3", base.verification_level if base else 1)
+        self.raid_watch.start()
+
+    async def cog_unload(self):
+        self.sweep_codes.cancel()
+        self.raid_watch.cancel()
+        await self.join_pipeline.stop()
+        await self.welcome_batcher.close()
+        await self.log_aggregator.stop()
+        await asyncio.to_thread(self.codes.close)
+        await asyncio.to_thread(self.manual_requests.close)
+
+    # --- Периодическая очистка просроченных кодов ---
+    @tasks.loop(minutes=10)
+    async def sweep_codes(self):
+        removed = self.codes.sweep()
+        if removed:
+            print(f"Удалено просроченных кодов верификации: {removed}")
+
+    # --- Режим рейда ---
+    def check_raid(self, member):
+        """
+        Добавляет вход в окно детектора рейдов. Если рейд только что начался,
+        применяет RAID_ACTION и возвращает сработавшие признаки, иначе None.
+        """
+        config = get_config()
+        if config.raid_action == "off":
+            return None
+        guild_config = get_guild_config(member.guild.id)
+        if guild_config is None:
+            return None
+
+        thresholds = RaidThresholds.from_config(config)
+        reasons = self.raid_detector.observe(member.guild.id, member.created_at, member.avatar is not None,
+                                             member.name, thresholds)
+        if not reasons:
+            return None
+
+        action = config.raid_action if config.raid_action in RAID_ACTIONS else "alert"
+        if member.guild.id in self.raid_detector.active:
+            # Режим рейда уже включён: новое срабатывание только продлевает его
+            self.raid_detector.trip(member.guild.id, action)
+            return None
+
+        previous_level = None
+        if action == "level3" and guild_config.verification_level != 3:
+            previous_level = guild_config.verification_level
+            # Только временный уровень: настройки сервера (и config.json) остаются как были.
+            # Он действует сразу, запись в БД идёт в фоне
+            guild_config_store.set_level_override(member.guild.id, 3)
+        # Режим рейда отмечается после того, как действие применено
+        self.raid_detector.trip(member.guild.id, action, previous_level)
+        metrics.inc("glistbot_raid_alerts_total", action=action)
+        print(f"Возможный рейд на сервере {member.guild.id} ({'; '.join(reasons)}), действие: {action}")
+        return reasons
+
+    async def end_raid(self, guild_id: int, reason: str):
+        """Снимает режим рейда и возвращает уровень верификации, если его переключал детектор"""
+        state = self.raid_detector.end(guild_id)
+        if state is None:
+            return
+        restored = None
+        # Если уровень за время рейда выбрали вручную (!setlevel), временного уровня уже нет
+        if state.previous_level is not None and guild_config_store.clear_level_override(guild_id):
+            config = get_guild_config(guild_id)
+            restored = config.verification_level if config else state.previous_level
+        print(f"Режим рейда на сервере {guild_id} снят: {reason}")
+
+        embed = discord.Embed(
+            title="✅ Режим рейда снят",
+            description=reason,
+            color=discord.Color.green(),
+            timestamp=datetime.now()
+        )
+        if restored is not None:
+            embed.add_field(name="Уровень верификации", value=f"Возвращён на **{restored}**")
+        elif state.action == "pause_dm":
+            embed.add_field(name="ЛС", value="Отправка QR-кодов возобновлена")
+        await self.send_raid_alert(guild_id, embed)
+
+    async def send_raid_alert(self, guild_id: int, embed: discord.Embed):
+        """Оповещение в канал модерации (MODERATOR_CHANNEL_ID сервера)"""
+        config = get_guild_config(guild_id)
+        channel = self.bot.get_channel(config.moderator_channel_id) if config and config.moderator_channel_id else None
+        if channel is None:
+            return
+        try:
+            # Одно сообщение на рейд — без лимитера, чтобы не ждать в очереди за заявками
+            with discord_request("raid_alert"):
+                await channel.send(embed=embed)
+        except discord.HTTPException as e:
+            print(f"Не удалось отправить оповещение о рейде: {e}")
+
+    @tasks.loop(seconds=30)
+    async def raid_watch(self):
+        config = get_config()
+        thresholds = RaidThresholds.from_config(config)
+        for guild_id in self.raid_detector.expired(config.raid_cooldown_minutes * 60, thresholds):
+            await self.end_raid(guild_id, f"Признаки рейда не повторялись {config.raid_cooldown_minutes:g} мин.")
         
     def log_to_stats_db(self, user_id: int, username: str, guild_id: int, status: str, 
                         method: str, verification_level: int, moderator_id: int = None, 
@@ -246,98 +382,251 @@ class VerificationCog(commands.Cog):
         except Exception as e:
             print(f"Ошибка при логировании в статистику: {e}")
 
+    def log_attempt_to_stats_db(self, user_id: int, guild_id: int, success: bool):
+        """Попытка ввода кода: учитывается в статистике и в оценке риска заявок"""
+        try:
+            stats_cog = self.bot.get_cog('StatsCog')
+            if stats_cog:
+                stats_cog.log_verification_attempt(user_id, guild_id, success)
+        except Exception as e:
+            print(f"Ошибка при логировании попытки верификации: {e}")
+
+    def stats_version(self, guild_id: int) -> int:
+        """Меняется после каждой записи событий сервера в БД статистики (в том числе попыток)"""
+        stats_cog = self.bot.get_cog('StatsCog')
+        return stats_cog.cache.generation(guild_id) if stats_cog else 0
+
+    # --- Одобрение и отклонение заявок (кнопки и панель очереди) ---
+    async def approve_member(self, member, verified_role, unverified_role, moderator,
+                             verification_level: int, request=None):
+        """Одобряет участника: смена ролей, закрытие заявки, логи. Ошибки Discord пробрасываются."""
+        await transition_roles(member, add=[verified_role], remove=[unverified_role],
+                               reason=f"Одобрено модератором {moderator.name}")
+        if request is not None:
+            self.manual_requests.resolve(request, STATUS_APPROVED, moderator.id)
+        await log_verification(self.bot, member.guild.id, member, status="успешно",
+                               method="модератор", moderator=moderator)
+        self.log_to_stats_db(member.id, member.name, member.guild.id, "успешно", "модератор",
+                             verification_level, moderator.id, moderator.name)
+
+    async def deny_member(self, member, moderator, verification_level: int, request=None):
+        """Отклоняет участника (кик), закрывает заявку и пишет логи. Ошибки Discord пробрасываются."""
+        with discord_request("kick"):
+            await member.kick(reason=f"Отклонено модератором {moderator.name}")
+        if request is not None:
+            self.manual_requests.resolve(request, STATUS_DENIED, moderator.id)
+        await log_verification(self.bot, member.guild.id, member, status="отклонено",
+                               method="модератор", moderator=moderator)
+        self.log_to_stats_db(member.id, member.name, member.guild.id, "отклонено", "модератор",
+                             verification_level, moderator.id, moderator.name)
+
     # --- Команда для смены уровня верификации ---
     @commands.command()
+    @commands.guild_only()
     @commands.has_permissions(administrator=True)
     async def setlevel(self, ctx, level: int):
         if 1 <= level <= 3:
-            update_config("VERIFICATION_LEVEL", level)
+            guild_config_store.update(ctx.guild.id, verification_level=level)
+            # Выбранный вручную уровень важнее временного уровня режима рейда
+            guild_config_store.clear_level_override(ctx.guild.id)
             await ctx.send(f"✅ Уровень верификации изменен на **{level}**.")
         else:
             await ctx.send("❌ Неверный уровень. Пожалуйста, выберите от 1 до 3.")
 
+    # --- Настройка сервера: роли и каналы верификации ---
+    @commands.command(name='setup')
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    async def setup_guild(self, ctx, unverified_role: discord.Role, verified_role: discord.Role,
+                          moderator_channel: discord.TextChannel = None,
+                          welcome_channel: discord.TextChannel = None,
+                          log_channel: discord.TextChannel = None):
+        """Сохраняет роли и каналы верификации для текущего сервера"""
+        config = guild_config_store.update(
+            ctx.guild.id,
+            unverified_role_id=unverified_role.id,
+            verified_role_id=verified_role.id,
+            moderator_channel_id=moderator_channel.id if moderator_channel else None,
+            welcome_channel_id=welcome_channel.id if welcome_channel else None,
+            log_channel_id=log_channel.id if log_channel else None
+        )
+        await ctx.send(
+            f"✅ Сервер настроен: {unverified_role.mention} → {verified_role.mention}, "
+            f"уровень верификации **{config.verification_level}**."
+        )
+
+    # --- Команда для принудительного перечитывания config.json ---
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def reloadconfig(self, ctx):
+        try:
+            config_store.reload()
+        except Exception as e:
+            await ctx.send("❌ Не удалось перечитать config.json. Проверьте файл.")
+            print(f"Ошибка при чтении config.json: {e}")
+            return
+        config = get_guild_config(ctx.guild.id) if ctx.guild else None
+        level = config.verification_level if config else "не настроен"
+        await ctx.send(f"✅ Конфигурация перечитана. Уровень верификации: **{level}**.")
+
+    # --- Состояние детектора рейдов ---
+    @commands.command(name='raid')
+    @commands.guild_only()
+    @commands.has_permissions(manage_guild=True)
+    async def raid(self, ctx, action: str = None):
+        """Окно входов и режим рейда: !raid, снять режим вручную — !raid off"""
+        if action == "off":
+            if ctx.guild.id not in self.raid_detector.active:
+                await ctx.send("ℹ️ Режим рейда не включён.")
+                return
+            await self.end_raid(ctx.guild.id, f"Снят вручную: {ctx.author.name}")
+            await ctx.send("✅ Режим рейда снят.")
+            return
+        if action is not None:
+            await ctx.send("❌ Использование: `!raid` или `!raid off`.")
+            return
+
+        config = get_config()
+        thresholds = RaidThresholds.from_config(config)
+        stats = self.raid_detector.stats(ctx.guild.id, thresholds)
+        state = self.raid_detector.active.get(ctx.guild.id)
+        embed = discord.Embed(
+            title="🛡️ Детектор рейдов",
+            color=discord.Color.red() if state else discord.Color.blue()
+        )
+        embed.add_field(name=f"Входов за {thresholds.window:g} с", value=str(stats.joins))
+        embed.add_field(name=f"Моложе {thresholds.young_days:g} дн.", value=f"{stats.share(stats.young):.0%}")
+        embed.add_field(name="Без аватара", value=f"{stats.share(stats.no_avatar):.0%}")
+        embed.add_field(name="Похожие имена",
+                        value=f"{stats.cluster} («{stats.cluster_name}…»)" if stats.cluster > 1 else "нет")
+        if state:
+            embed.add_field(name="Режим рейда", value=RAID_ACTION_TEXT[state.action], inline=False)
+        else:
+            embed.add_field(name="Режим рейда", value="выключен" if config.raid_action != "off" else "детектор выключен (RAID_ACTION=off)",
+                            inline=False)
+        await ctx.send(embed=embed)
+
+    # --- Панель очереди ручной верификации (уровень 3) ---
+    @commands.command(name='queue')
+    @commands.guild_only()
+    @commands.has_permissions(manage_roles=True)
+    async def manual_queue(self, ctx):
+        view = QueueDashboardView(self, ctx.guild)
+        await view.update_ranking()
+        view.message = await ctx.send(embed=view.render(), view=view)
+
+    # --- Состояние очереди логов ---
+    @commands.command(name='logqueue')
+    @commands.has_permissions(manage_guild=True)
+    async def log_queue(self, ctx):
+        aggregator = self.log_aggregator
+        await ctx.send(
+            f"📨 Очередь логов: в ожидании **{aggregator.queued}**, "
+            f"отправлено **{aggregator.sent_events}** ({aggregator.sent_messages} сообщений), "
+            f"отброшено **{aggregator.dropped}**."
+        )
+
     # --- Главное событие: новый пользователь на сервере ---
     @commands.Cog.listener()
     async def on_member_join(self, member):
+        # Только постановка в очередь: при массовом входе обработка идёт
+        # пулом воркеров с учётом лимитов Discord API
         try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            # Окно проверяется до постановки в очередь, чтобы участник
+            # уже обрабатывался по правилам режима рейда
+            reasons = self.check_raid(member)
         except Exception as e:
-            print(f"Ошибка при чтении config.json: {e}")
+            print(f"Ошибка детектора рейдов: {e}")
+            reasons = None
+        self.join_pipeline.submit(member)
+
+        if reasons:
+            stats = self.raid_detector.stats(member.guild.id, RaidThresholds.from_config(get_config()))
+            embed = discord.Embed(
+                title="🚨 Обнаружен возможный рейд",
+                description="\n".join(f"• {reason}" for reason in reasons),
+                color=discord.Color.red(),
+                timestamp=datetime.now()
+            )
+            embed.add_field(name="Действие", value=RAID_ACTION_TEXT[self.raid_detector.active[member.guild.id].action],
+                            inline=False)
+            embed.set_footer(text=f"Входов в окне: {stats.joins}. Снять режим: !raid off")
+            await self.send_raid_alert(member.guild.id, embed)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        # Ушедший участник больше не ждёт ручной проверки
+        request = self.manual_requests.get(member.guild.id, member.id)
+        if request is not None and self.manual_requests.claim(request):
+            self.manual_requests.resolve(request, STATUS_LEFT)
+
+    async def process_join(self, member):
+        """Обработка одного входа (вызывается воркером очереди)"""
+        try:
+            config = get_guild_config(member.guild.id)
+        except Exception as e:
+            print(f"Ошибка при чтении настроек сервера {member.guild.id}: {e}")
             return
 
-        unverified_role = member.guild.get_role(config["UNVERIFIED_ROLE_ID"])
+        # Сервер без настроек верификации не обрабатываем
+        if config is None:
+            return
+
+        # Роль выдаётся первой — от неё зависит, что видит новый участник
+        unverified_role = member.guild.get_role(config.unverified_role_id)
         if unverified_role:
             try:
-                await member.add_roles(unverified_role)
+                with metrics.timer("glistbot_join_stage_seconds", stage="role"):
+                    await self.limiter.acquire("roles", member.guild.id)
+                    with discord_request("add_roles"):
+                        await member.add_roles(unverified_role)
             except discord.Forbidden:
                 print(f"Не удалось выдать роль 'Неверифицирован' пользователю {member.name}: недостаточно прав")
             except discord.HTTPException as e:
                 print(f"Ошибка при выдаче роли пользователю {member.name}: {e}")
 
-        level = config["VERIFICATION_LEVEL"]
+        level = config.verification_level
 
-        # --- Отправка приветственного сообщения ---
-        welcome_channel_id = config.get("WELCOME_CHANNEL_ID")
+        # --- Приветствие: копится и отправляется одним сообщением на группу входов ---
+        welcome_channel_id = config.welcome_channel_id
         if welcome_channel_id:
             welcome_channel = self.bot.get_channel(welcome_channel_id)
             if welcome_channel:
-                try:
-                    # Формируем сообщение в зависимости от уровня
-                    if level == 1:
-                        instruction = f"Для получения доступа к серверу напишите команду `!verify` в этом канале."
-                    elif level == 2:
-                        instruction = f"Для получения доступа к серверу проверьте **личные сообщения** от меня. Я отправил вам QR-код с инструкциями.\n\n⚠️ Если ЛС не пришло — откройте личные сообщения от участников сервера в настройках конфиденциальности."
-                    elif level == 3:
-                        instruction = f"Ожидайте проверку модераторами. Это может занять некоторое время."
-                    else:
-                        instruction = "Следуйте инструкциям для верификации."
-
-                    embed = discord.Embed(
-                        title="👋 Добро пожаловать!",
-                        description=f"Привет, {member.mention}! Добро пожаловать на сервер **{member.guild.name}**!",
-                        color=discord.Color.blue(),
-                        timestamp=datetime.now()
-                    )
-                    embed.add_field(
-                        name="🔐 Верификация",
-                        value=instruction,
-                        inline=False
-                    )
-                    embed.set_thumbnail(url=member.display_avatar.url)
-                    embed.set_footer(text=f"Уровень верификации: {level}")
-
-                    await welcome_channel.send(embed=embed)
-                except discord.Forbidden:
-                    print(f"Не удалось отправить приветственное сообщение: недостаточно прав")
-                except discord.HTTPException as e:
-                    print(f"Ошибка при отправке приветственного сообщения: {e}")
+                self.welcome_batcher.add(welcome_channel, member)
 
         if level == 1:
             # Логика для уровня 1: простая команда
-            # Приветственное сообщение уже отправлено выше
+            # Приветственное сообщение уже поставлено в очередь выше
             pass
         elif level == 2:
             # Логика для уровня 2: QR-код
             token = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-            pending_verifications[member.id] = token
-            encoded_text = urllib.parse.quote(f"Ваш код: {token}")
-            qr_url = f"https://quickchart.io/qr?text={encoded_text}&size=250"
+            self.codes.set(member.guild.id, member.id, token)
+            if self.raid_detector.dm_paused(member.guild.id):
+                # Во время рейда ЛС не рассылаются: код сохранён, участник получит его по !resendcode
+                return
+            with metrics.timer("glistbot_join_stage_seconds", stage="qr"):
+                qr_file = await make_qr_file(token)
 
             embed = discord.Embed(
                 title="Верификация на сервере",
-                description=f"Привет, {member.mention}! Чтобы получить доступ, отсканируйте QR-код и отправьте мне код командой `!code ВАШ_КОД`.",
+                description=f"Привет, {member.mention}! Для доступа к серверу **{member.guild.name}** отсканируйте QR-код и отправьте мне код командой `!code ВАШ_КОД`.",
                 color=discord.Color.gold()
             )
-            embed.set_image(url=qr_url)
+            embed.set_image(url=f"attachment://{qr_file.filename}")
             try:
-                await member.send(embed=embed)
+                with metrics.timer("glistbot_join_stage_seconds", stage="dm"):
+                    await self.limiter.acquire("dm")
+                    with discord_request("dm"):
+                        await member.send(embed=embed, file=qr_file)
             except discord.Forbidden:
                 print(f"Не удалось отправить ЛС пользователю {member.name}: личные сообщения закрыты")
 
         elif level == 3:
             # Логика для уровня 3: ручное одобрение
-            mod_channel = self.bot.get_channel(config["MODERATOR_CHANNEL_ID"])
+            request = self.manual_requests.add(member.guild.id, member.id, member.name,
+                                               member.created_at.timestamp())
+            mod_channel = self.bot.get_channel(config.moderator_channel_id)
             if mod_channel:
                 embed = discord.Embed(
                     title="Новый пользователь ожидает верификации",
@@ -349,29 +638,76 @@ class VerificationCog(commands.Cog):
                 embed.set_footer(text=f"ID пользователя: {member.id}")
 
                 try:
-                    await mod_channel.send(embed=embed, view=ManualVerificationView())
+                    with metrics.timer("glistbot_join_stage_seconds", stage="mod_post"):
+                        await self.limiter.acquire("mod", mod_channel.id)
+                        with discord_request("mod_post"):
+                            message = await mod_channel.send(embed=embed, view=ManualVerificationView())
+                    self.manual_requests.attach_message(request, mod_channel.id, message.id)
                 except discord.Forbidden:
                     print(f"Не удалось отправить сообщение в канал модерации: недостаточно прав")
                 except discord.HTTPException as e:
                     print(f"Ошибка при отправке в канал модерации: {e}")
 
+    async def send_welcome(self, channel, members):
+        """Отправляет одно приветствие сразу для группы вошедших участников"""
+        config = get_guild_config(channel.guild.id)
+        level = config.verification_level if config else 1
+
+        # Формируем сообщение в зависимости от уровня
+        if level == 1:
+            instruction = f"Для получения доступа к серверу напишите команду `!verify` в этом канале."
+        elif level == 2 and self.raid_detector.dm_paused(channel.guild.id):
+            instruction = "Рассылка личных сообщений временно приостановлена. Чтобы получить QR-код, напишите мне в ЛС команду `!resendcode`."
+        elif level == 2:
+            instruction = f"Для получения доступа к серверу проверьте **личные сообщения** от меня. Я отправил вам QR-код с инструкциями.\n\n⚠️ Если ЛС не пришло — откройте личные сообщения от участников сервера в настройках конфиденциальности."
+        elif level == 3:
+            instruction = f"Ожидайте проверку модераторами. Это может занять некоторое время."
+        else:
+            instruction = "Следуйте инструкциям для верификации."
+
+        mentions = ", ".join(member.mention for member in members)
+        embed = discord.Embed(
+            title="👋 Добро пожаловать!",
+            description=f"Привет, {mentions}! Добро пожаловать на сервер **{channel.guild.name}**!",
+            color=discord.Color.blue(),
+            timestamp=datetime.now()
+        )
+        embed.add_field(
+            name="🔐 Верификация",
+            value=instruction,
+            inline=False
+        )
+        if len(members) == 1:
+            embed.set_thumbnail(url=members[0].display_avatar.url)
+        embed.set_footer(text=f"Уровень верификации: {level}")
+
+        try:
+            await self.limiter.acquire("welcome", channel.id)
+            with discord_request("welcome"):
+                await channel.send(embed=embed)
+        except discord.Forbidden:
+            print(f"Не удалось отправить приветственное сообщение: недостаточно прав")
+        except discord.HTTPException as e:
+            print(f"Ошибка при отправке приветственного сообщения: {e}")
+
     # --- Команды для верификации ---
     @commands.command()
     async def verify(self, ctx):
         # Только для уровня 1
+        if ctx.guild is None:
+            return
         try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            config = get_guild_config(ctx.guild.id)
         except Exception as e:
-            print(f"Ошибка при чтении config.json: {e}")
+            print(f"Ошибка при чтении настроек сервера {ctx.guild.id}: {e}")
             await ctx.send("❌ Ошибка конфигурации.", delete_after=5)
             return
 
-        if config["VERIFICATION_LEVEL"] != 1:
+        if config is None or config.verification_level != 1:
             return
 
-        unverified_role = ctx.guild.get_role(config["UNVERIFIED_ROLE_ID"])
-        verified_role = ctx.guild.get_role(config["VERIFIED_ROLE_ID"])
+        unverified_role = ctx.guild.get_role(config.unverified_role_id)
+        verified_role = ctx.guild.get_role(config.verified_role_id)
 
         if not unverified_role or not verified_role:
             await ctx.send("❌ Ошибка: Роли не найдены в конфигурации.", delete_after=5)
@@ -386,8 +722,8 @@ class VerificationCog(commands.Cog):
             return
 
         try:
-            await ctx.author.remove_roles(unverified_role)
-            await ctx.author.add_roles(verified_role)
+            await transition_roles(ctx.author, add=[verified_role], remove=[unverified_role],
+                                   reason="Верификация пройдена")
             await ctx.send("✅ Вы успешно верифицированы!", delete_after=5)
             
             # Логирование
@@ -406,7 +742,7 @@ class VerificationCog(commands.Cog):
                 guild_id=ctx.guild.id,
                 status="успешно",
                 method="команда",
-                verification_level=config["VERIFICATION_LEVEL"]
+                verification_level=config.verification_level
             )
         except discord.Forbidden:
             await ctx.send("❌ У бота недостаточно прав для изменения ролей.", delete_after=5)
@@ -422,51 +758,59 @@ class VerificationCog(commands.Cog):
     @commands.command()
     @commands.dm_only() # Команда работает только в ЛС
     async def code(self, ctx, provided_code: str):
-        try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        except Exception as e:
-            print(f"Ошибка при чтении config.json: {e}")
-            await ctx.send("❌ Ошибка конфигурации.")
-            return
-
-        if config["VERIFICATION_LEVEL"] != 2:
-            return
-
         author_id = ctx.author.id
-        if author_id not in pending_verifications:
+        # Серверы, где пользователь ожидает верификации, берутся из индекса кодов
+        pending = self.codes.pending_guilds(author_id)
+        if not pending:
             await ctx.send("❌ У вас нет активного кода верификации.")
             return
 
         # Удаляем возможные спойлеры и лишние пробелы в введённом коде
-        cleaned_input = provided_code.strip().replace('||', '')
-        if pending_verifications[author_id].lower() != cleaned_input.lower():
+        cleaned_input = provided_code.strip().replace('||', '').lower()
+        guild_id = next((guild_id for guild_id in pending
+                         if self.codes.get(guild_id, author_id).lower() == cleaned_input), None)
+        if guild_id is None:
+            # Код не подошёл ни к одному серверу, где пользователь ожидает верификации
+            for pending_guild_id in pending:
+                self.log_attempt_to_stats_db(author_id, pending_guild_id, success=False)
             await ctx.send("❌ Неверный код.")
             return
 
-        del pending_verifications[author_id]
+        try:
+            config = get_guild_config(guild_id)
+        except Exception as e:
+            print(f"Ошибка при чтении настроек сервера {guild_id}: {e}")
+            await ctx.send("❌ Ошибка конфигурации.")
+            return
+
+        if config is None or config.verification_level != 2:
+            return
+
+        expected_code = self.codes.pop(guild_id, author_id)
+        qr_cache.discard(expected_code)
 
-        guild = self.bot.get_guild(config["GUILD_ID"])
+        guild = self.bot.get_guild(guild_id)
         if not guild:
             await ctx.send("❌ Не удалось найти сервер.")
             return
 
-        member = guild.get_member(author_id)
+        member = await resolve_member(guild, author_id)
         if not member:
             await ctx.send("❌ Не удалось найти вас на сервере. Попробуйте перезайти.")
             return
 
-        verified_role = guild.get_role(config["VERIFIED_ROLE_ID"])
-        unverified_role = guild.get_role(config["UNVERIFIED_ROLE_ID"])
+        verified_role = guild.get_role(config.verified_role_id)
+        unverified_role = guild.get_role(config.unverified_role_id)
 
         if not verified_role or not unverified_role:
             await ctx.send("❌ Ошибка: Роли не найдены на сервере.")
             return
 
         try:
-            await member.add_roles(verified_role)
-            await member.remove_roles(unverified_role)
+            await transition_roles(member, add=[verified_role], remove=[unverified_role],
+                                   reason="Верификация пройдена")
             await ctx.send("✅ Верификация пройдена. Добро пожаловать!")
+            self.log_attempt_to_stats_db(member.id, guild.id, success=True)
             
             # Логирование
             await log_verification(
@@ -484,7 +828,7 @@ class VerificationCog(commands.Cog):
                 guild_id=guild.id,
                 status="успешно",
                 method="qr-код",
-                verification_level=config["VERIFICATION_LEVEL"]
+                verification_level=config.verification_level
             )
         except discord.Forbidden:
             await ctx.send("❌ У бота недостаточно прав для изменения ролей.")
@@ -496,64 +840,77 @@ class VerificationCog(commands.Cog):
     @commands.dm_only() # Команда работает только в ЛС
     async def resendcode(self, ctx):
         """Повторная отправка QR-кода для верификации"""
+        author_id = ctx.author.id
+        # Сначала серверы с действующим кодом, затем общие серверы с ботом из кэша
+        # (в режиме lean в нём остаются неверифицированные участники)
+        pending = self.codes.pending_guilds(author_id)
+        guild_ids = pending + [guild.id for guild in ctx.author.mutual_guilds if guild.id not in pending]
+        lean = get_config().member_cache_mode == "lean"
+
         try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            configs = [config for config in map(get_guild_config, guild_ids)
+                       if config is not None and config.verification_level == 2]
         except Exception as e:
-            print(f"Ошибка при чтении config.json: {e}")
+            print(f"Ошибка при чтении настроек серверов: {e}")
             await ctx.send("❌ Ошибка конфигурации.")
             return
 
-        if config["VERIFICATION_LEVEL"] != 2:
+        if not configs:
             await ctx.send("❌ Эта команда доступна только при уровне верификации 2 (QR-код).")
             return
 
-        author_id = ctx.author.id
-        guild = self.bot.get_guild(config["GUILD_ID"])
-        
-        if not guild:
-            await ctx.send("❌ Не удалось найти сервер.")
-            return
-
-        member = guild.get_member(author_id)
-        if not member:
-            await ctx.send("❌ Вы не найдены на сервере.")
-            return
-
-        # Проверяем, есть ли у пользователя роль неверифицирован
-        unverified_role = guild.get_role(config["UNVERIFIED_ROLE_ID"])
-        if not unverified_role or unverified_role not in member.roles:
-            await ctx.send("✅ Вы уже верифицированы! Код больше не нужен.")
+        guild = member = None
+        for config in configs:
+            guild = self.bot.get_guild(config.guild_id)
+            if guild is None:
+                continue
+            member = guild.get_member(author_id)
+            if member is None and lean and guild.id in pending:
+                # Запрос к API — только в режиме lean и только для серверов, где у пользователя есть код
+                try:
+                    member = await resolve_member(guild, author_id)
+                except discord.HTTPException as e:
+                    print(f"Не удалось получить участника {author_id} сервера {guild.id}: {e}")
+            if not member:
+                continue
+            # Проверяем, есть ли у пользователя роль неверифицирован
+            unverified_role = guild.get_role(config.unverified_role_id)
+            if unverified_role and unverified_role in member.roles:
+                break
+        else:
+            if member:
+                await ctx.send("✅ Вы уже верифицированы! Код больше не нужен.")
+            else:
+                await ctx.send("❌ Вы не найдены на сервере.")
             return
 
         # Генерируем новый код (или используем существующий)
-        if author_id in pending_verifications:
-            token = pending_verifications[author_id]
+        token = self.codes.get(guild.id, author_id)
+        if token is not None:
             message_text = "Вот ваш **существующий** код верификации:"
         else:
             token = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-            pending_verifications[author_id] = token
+            self.codes.set(guild.id, author_id, token)
             message_text = "Вот ваш **новый** код верификации:"
 
         # Создаём QR-код
-        encoded_text = urllib.parse.quote(f"Ваш код: {token}")
-        qr_url = f"https://quickchart.io/qr?text={encoded_text}&size=250"
+        qr_file = await make_qr_file(token)
 
         embed = discord.Embed(
             title="🔄 Повторная отправка кода",
-            description=f"{message_text}\n\nВаш код: ||{token}||",
+            description=f"{message_text}\n\nСервер: **{guild.name}**\nВаш код: ||{token}||",
             color=discord.Color.gold()
         )
-        embed.set_image(url=qr_url)
+        embed.set_image(url=f"attachment://{qr_file.filename}")
         embed.add_field(
             name="💡 Подсказка",
             value="После сканирования QR-кода отправьте мне код командой:\n`!code ВАШ_КОД`\nИли просто отправьте код как текст в этом чате.",
             inline=False
         )
-        embed.set_footer(text="Код действителен до перезапуска бота")
+        embed.set_footer(text=f"Код действителен {get_config().code_ttl_hours} ч.")
 
         try:
-            await ctx.send(embed=embed)
+            await ctx.send(embed=embed, file=qr_file)
         except discord.HTTPException as e:
             await ctx.send(f"❌ Ошибка при отправке QR-кода: {e}")
             print(f"Ошибка при повторной отправке QR-кода пользователю {ctx.author.name}: {e}")